@@ -0,0 +1,131 @@
+"""
+Startup benchmark for the game process.
+Measures the time from starting `python run.py` to the first prompt
+(the nickname question), and the time to import the tic_tac_toe package,
+over several runs.
+
+Usage:
+    python benchmarks/startup_benchmark.py --runs 5
+"""
+
+import argparse
+import os
+import queue
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_PROMPT = "Please enter your nickname"
+
+
+def read_chunks(stream, chunks):
+    """
+    Put the output of the process into the queue as it arrives,
+    and None at the end. Runs in a reader thread, so the timeout is
+    enforced even if the process prints nothing.
+    """
+
+    for chunk in iter(lambda: stream.read1(4096), b""):
+        chunks.put(chunk)
+    chunks.put(None)
+
+
+def time_to_first_prompt(env, timeout):
+    """
+    Start run.py and return the seconds until the first prompt appears,
+    or None if the process ended or timed out first.
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "run.py"],
+        cwd=ROOT,
+        env=env,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    chunks = queue.Queue()
+    threading.Thread(
+        target=read_chunks, args=(process.stdout, chunks), daemon=True
+    ).start()
+    output = b""
+    elapsed = None
+    try:
+        while True:
+            remaining = start + timeout - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                chunk = chunks.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if chunk is None:
+                break
+            output += chunk
+            if FIRST_PROMPT.encode() in output:
+                elapsed = time.perf_counter() - start
+                break
+    finally:
+        process.kill()
+        process.wait()
+    return elapsed
+
+
+def time_to_import(env):
+    """
+    Return the seconds a fresh interpreter needs to import the package.
+    """
+
+    start = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "import tic_tac_toe"],
+        cwd=ROOT,
+        env=env,
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+def report(name, samples):
+    """
+    Print the min, median and max of the samples in milliseconds.
+    """
+
+    if not samples:
+        print(f"{name}: no successful runs")
+        return
+    print(
+        f"{name}: min {min(samples) * 1000:.0f} ms, "
+        f"median {statistics.median(samples) * 1000:.0f} ms, "
+        f"max {max(samples) * 1000:.0f} ms ({len(samples)} runs)"
+    )
+
+
+def main():
+    """
+    Run the benchmark and print the results.
+    """
+
+    parser = argparse.ArgumentParser(description="Startup benchmark.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--backend", default="tf",
+                        help="Value of TIC_TAC_TOE_AI for the runs")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONUNBUFFERED="1", TIC_TAC_TOE_AI=args.backend)
+
+    report("import tic_tac_toe",
+           [time_to_import(env) for _ in range(args.runs)])
+    prompts = [time_to_first_prompt(env, args.timeout)
+               for _ in range(args.runs)]
+    report("time to first prompt", [t for t in prompts if t is not None])
+
+
+if __name__ == "__main__":
+    main()
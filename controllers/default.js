@@ -15,8 +15,9 @@ function socket() {
 
     this.on('open', function (client) {
 
-        // Spawn terminal
-        client.tty = Pty.spawn('python3', ['run.py'], {
+        // Spawn terminal attached to the shared game server
+        // (the client falls back to run.py if the server is not running)
+        client.tty = Pty.spawn('python3', ['-m', 'tic_tac_toe.tic_tac_toe_client'], {
             name: 'xterm-color',
             cols: 80,
             rows: 24,
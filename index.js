@@ -25,6 +25,16 @@ options.port = parseInt(process.env.PORT);
 // options.threads = '/api/';
 // options.logs = 'isolated';
 
+// Start the long-lived Python game server shared by all websocket sessions
+const gameServer = require('child_process').spawn('python3', ['run.py', '--serve'], {
+    cwd: process.env.PWD,
+    env: process.env,
+    stdio: 'inherit'
+});
+process.on('exit', function () {
+    gameServer.kill('SIGINT');
+});
+
 var type = process.argv.indexOf('--release', 1) !== -1 || process.argv.indexOf('release', 1) !== -1 ? 'release' : 'debug';
 // require('total4/' + type)(options);
 require('total4').http('release', options);
\ No newline at end of file
@@ -1,18 +1,36 @@
 # work with warnings
 import warnings
 import os
+import sys
+import time
 
 from tic_tac_toe import (
     display_start_game,
     display_board,
     display_leadersboard,
-    save_model_to_google_drive,
     load_data_from_google_sheets,
     update_leadersboard,
+    get_leadersboard,
     save_board_to_google_sheets,
+    flush_board_buffers,
     get_model_id_by_name,
     download_model_from_google_drive,
-    train_model
+    load_numpy_model_from_google_drive,
+    Board,
+    load_perfect_player,
+    submit_google_io,
+    wait_google_io,
+    worksheet_key,
+    canonicalize,
+    inverse_move,
+    get_game_history,
+    new_game_id,
+    SHEETS_MIRROR,
+    NKBoard,
+    AlphaBetaPlayer,
+    parse_variant,
+    span,
+    session_metrics,
 )
 
 # Suppress all UserWarnings
@@ -20,68 +38,208 @@ warnings.filterwarnings("ignore", category=UserWarning)
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
+# AI backend: "tf" - the Keras model, "perfect" - the perfect-play table,
+# "mcts" - tree search with the Keras model as the policy prior
+AI_BACKEND = os.environ.get("TIC_TAC_TOE_AI", "tf").lower()
+# AI of the tf backend while no model is published: "perfect" - the
+# perfect-play table (cannot be beaten), "mcts" - tree search with a
+# uniform prior, "none" - no games until a model is published
+AI_FALLBACK = os.environ.get("TIC_TAC_TOE_AI_FALLBACK", "perfect").lower()
+# Seconds between two checks for a newly published model
+MODEL_REFRESH = float(os.environ.get("TIC_TAC_TOE_MODEL_REFRESH", "300"))
+# Model used for inference: "npz" - the weights-only copy run with NumPy,
+# "h5" - the full Keras model
+MODEL_FORMAT = os.environ.get("TIC_TAC_TOE_MODEL_FORMAT", "npz").lower()
+# Board variant: "3x3" - the classic game, or N×N with K in a row,
+# e.g. "4x4", "5x5k4" or "15x15k5" (gomoku), played by the search AI
+VARIANT = parse_variant(os.environ.get("TIC_TAC_TOE_VARIANT", "3x3"))
+CLASSIC = VARIANT == (3, 3)
+# Statistics file written by `python run.py --profile`
+PROFILE_FILE = os.environ.get("TIC_TAC_TOE_PROFILE", "run.prof")
+
 # ================= Game Functions ==================
 
 
-def load_or_train_model(worksheet):
+def load_published_model():
     """
-    Load an existing model from Google Drive or train
-    a new one if not available.
+    Load the latest model published by the training worker
+    (tic_tac_toe_trainer.py) from Google Drive. Sessions never train:
+    None is returned if no model has been published yet.
+    The weights-only copy is tried first, so TensorFlow is not
+    initialized when it exists.
     """
 
     try:
-        file_id = get_model_id_by_name()
-        if file_id is None:
-            # Train model if not found
-            return train_model(worksheet)
-
-        # Download and load the model if available
-        model = download_model_from_google_drive(file_id)
-        print("Model successfully loaded from Google Drive.")
+        with span("model_load"):
+            model = None
+            if MODEL_FORMAT == "npz":
+                model = load_numpy_model_from_google_drive()
+            if model is None:
+                # Models published before the weights-only copy existed
+                file_id = get_model_id_by_name()
+                if file_id is not None:
+                    model = download_model_from_google_drive(file_id)
     except Exception as e:
         print(f"Error loading model from Google Drive: {e}")
-        # Fallback to training the model if loading fails
-        return train_model(worksheet)
+        return None
 
+    if model is not None:
+        print("Model successfully loaded from Google Drive.")
     return model
 
 
-def player_turn(board, X_train, y_train, tic_tac_toe_data_sheet):
+def refresh_model(predictor):
+    """
+    Switch a shared predictor to a newer published model, if there is
+    one. Drive is checked at most once per TIC_TAC_TOE_MODEL_REFRESH.
+    """
+
+    from tic_tac_toe.tic_tac_toe_google import (
+        MODEL_NAME, MODEL_NPZ_NAME, get_published_model, model_version)
+
+    now = time.monotonic()
+    if now - getattr(predictor, "checked_at", -MODEL_REFRESH) < MODEL_REFRESH:
+        return
+    predictor.checked_at = now
+
+    name = MODEL_NPZ_NAME if MODEL_FORMAT == "npz" else MODEL_NAME
+    published = get_published_model(name)
+    current = getattr(predictor.model, "model_version", 0)
+    if published is None or model_version(published) <= current:
+        return
+    model = load_published_model()
+    if model is not None:
+        predictor.set_model(model)
+        print(f"Switched to model version {model.model_version}.")
+
+
+def new_board():
+    """
+    Return an empty board of the selected variant.
+    """
+
+    if CLASSIC:
+        return Board()
+    return NKBoard(*VARIANT)
+
+
+def load_fallback_ai():
     """
-    Handle the player's turn, validate the move, and update training data.
+    Return the AI played while no model is published, as selected by
+    TIC_TAC_TOE_AI_FALLBACK, or None if games wait for a model.
+    The player is told which AI it is at the start of every game.
     """
 
+    if AI_FALLBACK == "none":
+        return None
+    if AI_FALLBACK == "perfect":
+        ai = load_perfect_player()
+        ai.fallback_notice = (
+            "No trained model is published yet: you play against the "
+            "perfect-play AI, which cannot be beaten.")
+    elif AI_FALLBACK == "mcts":
+        from tic_tac_toe import MCTSPlayer
+        ai = MCTSPlayer()
+        ai.fallback_notice = (
+            "No trained model is published yet: you play against "
+            "the tree search AI.")
+    else:
+        raise ValueError(
+            f"Unknown TIC_TAC_TOE_AI_FALLBACK value: {AI_FALLBACK}")
+    return ai
+
+
+def load_ai(worksheet, batched=False):
+    """
+    Load the AI backend selected by the TIC_TAC_TOE_AI setting.
+    With batched, model calls from many sessions are grouped together.
+    Larger variants are always played by the alpha-beta search.
+    """
+
+    if not CLASSIC:
+        return AlphaBetaPlayer()
+    if AI_BACKEND == "perfect":
+        return load_perfect_player()
+
+    from tic_tac_toe import CachedPredictor, MCTSPlayer
+
+    # On a new machine, start the local history from the mirror sheet
+    history = get_game_history()
+    history.seed_from_worksheet(worksheet)
+    model = load_published_model()
+    # Serve the Keras model through the prediction cache
+    predictor = None
+    if model is not None:
+        predictor = CachedPredictor(model, batched=batched)
+    if AI_BACKEND == "mcts":
+        # Without a published model the search uses a uniform prior
+        return MCTSPlayer(predictor)
+    if predictor is None:
+        return load_fallback_ai()
+    return predictor
+
+
+def record_move(board, move, side, game_log, tic_tac_toe_data_sheet):
+    """
+    Record a move in the local game history and, if the sheet mirror
+    is on, queue it for the Google Sheet in the background.
+    Only 3x3 games are recorded, as the model is trained on them.
+    """
+
+    if not CLASSIC:
+        return
+    get_game_history().record(
+        game_log["game_id"], game_log["nickname"], board, move, side)
+    if SHEETS_MIRROR:
+        submit_google_io(
+            worksheet_key(tic_tac_toe_data_sheet),
+            save_board_to_google_sheets,
+            tic_tac_toe_data_sheet, board.copy(), move)
+
+
+def player_turn(board, tic_tac_toe_data_sheet, game_log):
+    """
+    Handle the player's turn, validate the move, and record it.
+    """
+
+    cells = VARIANT[0] * VARIANT[0]
     try:
         print()
-        move = int(input("Your move (0-8): \n"))
-        if board[move // 3][move % 3] != 0:
+        move = int(input(f"Your move (0-{cells - 1}): \n"))
+        if not 0 <= move < cells:
+            raise IndexError(move)
+        if not board.is_empty(move):
             print("Cell is already taken. Please choose another cell.")
             return False  # Turn was not successful.
-        board[move // 3][move % 3] = 1
-        flattened_board = [cell for row in board for cell in row]
-        X_train.append(flattened_board)
-        y_train.append(move)
-        save_board_to_google_sheets(tic_tac_toe_data_sheet, board, move)
+        board.make_move(move, 1)
+        record_move(board, move, 1, game_log, tic_tac_toe_data_sheet)
         return True  # Turn was successful.
     except (ValueError, IndexError):
-        print("Invalid input. Please enter a number from 0 to 8.")
+        print(f"Invalid input. Please enter a number from 0 to {cells - 1}.")
         return False  # Turn was not successful.
 
 
-def ai_turn(board, model, X_train, tic_tac_toe_data_sheet):
+def ai_turn(board, model, tic_tac_toe_data_sheet, game_log):
     """
-    Execute the AI's turn, predict the best move, and update training data.
+    Execute the AI's turn, predict the best move, and record it.
     """
 
-    flattened_board = [cell for row in board for cell in row]
-    board_as_input = [flattened_board]
-    prediction = model.predict(board_as_input)[0]
-    valid_moves = [i for i in range(9) if board[i // 3][i % 3] == 0]
-    best_move = max(valid_moves, key=lambda i: prediction[i])
-    board[best_move // 3][best_move % 3] = -1
-    flattened_board = [cell for row in board for cell in row]
-    X_train.append(flattened_board)
-    save_board_to_google_sheets(tic_tac_toe_data_sheet, board, best_move)
+    with span("ai_move"):
+        if hasattr(model, "select_move"):
+            # Table or search based backends choose the move themselves
+            best_move = model.select_move(board, -1)
+        else:
+            # The model is trained on canonical boards, so predict on the
+            # canonical form and map the move back to this board
+            canonical_board, transform = canonicalize(board)
+            board_as_input = [canonical_board.to_list()]
+            with span("predict"):
+                prediction = model.predict(board_as_input)[0]
+            valid_moves = canonical_board.legal_moves()
+            best_move = inverse_move(
+                max(valid_moves, key=lambda i: prediction[i]), transform)
+    board.make_move(best_move, -1)
+    record_move(board, best_move, -1, game_log, tic_tac_toe_data_sheet)
 
 
 def check_game_status(board):
@@ -89,37 +247,12 @@ def check_game_status(board):
     Check the current status of the game (win, lose, draw, or ongoing).
     """
 
-    # Check for a win for each player
-    for player in [1, -1]:
-        winning_positions = [
-            # Horizontal
-            board[0],
-            board[1],
-            board[2],
-            # Vertical
-            [board[0][0], board[1][0], board[2][0]],
-            [board[0][1], board[1][1], board[2][1]],
-            [board[0][2], board[1][2], board[2][2]],
-            # Diagonals
-            [board[0][0], board[1][1], board[2][2]],
-            [board[0][2], board[1][1], board[2][0]],
-        ]
-
-        if any(
-                all(pos == player for pos in win_pos)
-                for win_pos in winning_positions):
-            # A win is detected and return the player who won
-            return True, player
-
-    # Check for a draw (all cells are filled)
-    if all(cell != 0 for row in board for cell in row):
-        return True, 0  # The game is a draw
+    # Win, draw and ongoing checks are bitmask lookups on the board
+    return board.status()
 
-    # If no win or draw, the game is not over
-    return False, None
 
-
-def check_and_handle_game_over(board, leadersboard_data_sheet, nickname):
+def check_and_handle_game_over(board, leadersboard_data_sheet, nickname,
+                               tic_tac_toe_data_sheet):
     """
     Check if the game is over and handle the updating of the leaderboard.
     """
@@ -135,7 +268,13 @@ def check_and_handle_game_over(board, leadersboard_data_sheet, nickname):
         else:
             print("\nThe game is a draw!")
             result = "Draw"
-        update_leadersboard(leadersboard_data_sheet, nickname, result)
+        # Send the boards of the finished game in one bulk append and
+        # update the leadersboard in the background
+        submit_google_io(
+            worksheet_key(tic_tac_toe_data_sheet), flush_board_buffers)
+        submit_google_io(
+            worksheet_key(leadersboard_data_sheet),
+            update_leadersboard, leadersboard_data_sheet, nickname, result)
         return True  # The game is over.
     return False  # The game is not over.
 
@@ -150,56 +289,76 @@ def prompt_replay():
     return play_or_no == "y"
 
 
-def game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname):
+def game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname,
+         model=None):
     """
     Main game function to run the gameplay loop,
     including turns and checking the game status.
+    A model shared by the game server can be passed in (and is switched
+    to a newer published version in the background); otherwise the
+    session loads the latest published model.
     """
 
     print("\nGame starting.\n")
-    display_start_game()
+    display_start_game(*VARIANT)
     current_player = 1
-    board = [[0, 0, 0] for _ in range(3)]
-    X_train = []  # Initialisation of the list for storing board states
-    y_train = []  # Initialising the list for storing moves
-    model = load_or_train_model(tic_tac_toe_data_sheet)
+    board = new_board()
+    game_log = {"game_id": new_game_id(), "nickname": nickname}
+    if model is None:
+        model = load_ai(tic_tac_toe_data_sheet)
+        if model is None:
+            print("No trained model is published yet, "
+                  "please come back later.")
+            return
+    else:
+        # The MCTS backend refreshes the model it uses as its prior
+        predictor = getattr(model, "prior", model)
+        if hasattr(predictor, "set_model"):
+            submit_google_io("model", refresh_model, predictor)
+    if getattr(model, "fallback_notice", None):
+        print(model.fallback_notice)
 
     while True:
         if current_player == 1:
-            if not player_turn(
-                    board, X_train, y_train, tic_tac_toe_data_sheet):
+            if not player_turn(board, tic_tac_toe_data_sheet, game_log):
                 continue  # Player needs to retry their turn.
         else:
-            ai_turn(board, model, X_train, tic_tac_toe_data_sheet)
+            ai_turn(board, model, tic_tac_toe_data_sheet, game_log)
 
         print()
         display_board(board)
 
         if check_and_handle_game_over(
-                board, leadersboard_data_sheet, nickname):
+                board, leadersboard_data_sheet, nickname,
+                tic_tac_toe_data_sheet):
             if not prompt_replay():
-                display_leadersboard(leadersboard_data_sheet, nickname)
+                # Show the leadersboard with this game's result in it
+                wait_google_io(worksheet_key(leadersboard_data_sheet))
+                display_leadersboard(
+                    get_leadersboard(leadersboard_data_sheet), nickname)
                 print("\nGame over.\n")
                 break  # Exit the game loop.
-            board = [[0, 0, 0] for _ in range(3)]  # Reset the board.
+            board = new_board()  # Reset the board.
+            game_log["game_id"] = new_game_id()
 
         current_player = -current_player  # Switch players.
 
-    if model is not None:
-        save_model_to_google_drive(model)
-
 
 # ================= Game Functions ==================
 
 
-def main():
+@session_metrics
+def main(sheets=None, model=None):
     """
     Main function to initiate the game, handle user choices, and load data.
+    The game server passes the sheets and the model it shares
+    between sessions.
     """
 
     # Load data from Google Sheets at the start of the main function
-    (leadersboard_data_sheet,
-     tic_tac_toe_data_sheet) = load_data_from_google_sheets()
+    if sheets is None:
+        sheets = load_data_from_google_sheets()
+    (leadersboard_data_sheet, tic_tac_toe_data_sheet) = sheets
 
     if not leadersboard_data_sheet or not tic_tac_toe_data_sheet:
         print("Error loading data from Google Sheets.")
@@ -220,24 +379,99 @@ def main():
     start = start.lower()
     # Main game loop
     if start == "y":
-        game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname)
+        game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname,
+             model)
     elif start == "l":
-        display_leadersboard(leadersboard_data_sheet, nickname)
-        start = str(
-            input(
-                "\nDo you want to play game or exit? \n(y or Y - game, "
-                "any other - exit): \n"
+        leadersboard = get_leadersboard(leadersboard_data_sheet)
+        page = 1
+        while True:
+            page = display_leadersboard(leadersboard, nickname, page)
+            start = str(
+                input(
+                    "\nDo you want to play game or exit? \n(y or Y - game, "
+                    "n or N - next page, p or P - previous page, "
+                    "any other - exit): \n"
+                )
             )
-        )
-        start = start.lower()
+            start = start.lower()
+            if start == "n":
+                page += 1
+            elif start == "p":
+                page = max(1, page - 1)
+            else:
+                break
         if start == "y":
-            game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname)
+            game(leadersboard_data_sheet, tic_tac_toe_data_sheet, nickname,
+                 model)
         else:
             print("\nGame over.\n")
     else:
         print("\nGame over.\n")
 
 
+def load_shared():
+    """
+    Load the sheets and the model once for all sessions of the server.
+    """
+
+    sheets = load_data_from_google_sheets()
+    model = None
+    # The search AI keeps per-game state, so every session loads its own
+    if sheets[1] and CLASSIC:
+        model = load_ai(sheets[1], batched=True)
+    return sheets, model
+
+
+def close_shared(shared):
+    """
+    Release the shared model and flush the boards when the server stops.
+    """
+
+    sheets, model = shared
+    model = getattr(model, "prior", model)
+    if getattr(model, "batcher", None) is not None:
+        print(f"Inference metrics: {model.batcher.metrics()}")
+        model.close()
+    flush_board_buffers()
+
+
+def serve():
+    """
+    Run the long-lived game server that hosts many sessions.
+    """
+
+    from tic_tac_toe.tic_tac_toe_server import GameServer
+
+    GameServer(
+        lambda shared: main(*shared),
+        load_shared=load_shared,
+        close_shared=close_shared,
+    ).run()
+
+
+def profiled(fn, path=PROFILE_FILE):
+    """
+    Run fn under cProfile, save the statistics to a file and print
+    the slowest calls.
+    """
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(fn)
+    finally:
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(20)
+        print(f"Profile saved to {path}", file=sys.stderr)
+
+
 # Ensure that the main function is called when the script is executed
 if __name__ == "__main__":
-    main()
+    entry = serve if "--serve" in sys.argv[1:] else main
+    if "--profile" in sys.argv[1:]:
+        profiled(entry)
+    else:
+        entry()
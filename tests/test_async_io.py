@@ -0,0 +1,81 @@
+"""
+Tests of the background Google I/O layer.
+"""
+
+import threading
+import time
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_async_io import GoogleIO
+
+
+@pytest.fixture
+def google_io():
+    google_io = GoogleIO(max_concurrency=4)
+    yield google_io
+    google_io.shutdown(timeout=5)
+
+
+def test_calls_with_one_key_keep_their_order(google_io):
+    calls = []
+
+    def call(i):
+        # Earlier calls take longer, so only the ordering keeps them
+        time.sleep(0.01 * (5 - i % 5))
+        calls.append(i)
+
+    futures = [google_io.submit("sheet", call, i) for i in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    assert calls == list(range(10))
+
+
+def test_other_keys_do_not_wait(google_io):
+    release = threading.Event()
+    blocked = google_io.submit("slow", release.wait, 5)
+    done = google_io.submit("fast", lambda: "done")
+    assert done.result(timeout=5) == "done"
+    assert not blocked.done()
+    release.set()
+    assert blocked.result(timeout=5) is True
+
+
+def test_concurrency_is_bounded():
+    google_io = GoogleIO(max_concurrency=2)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    futures = [google_io.submit(f"key{i}", call) for i in range(8)]
+    for future in futures:
+        future.result(timeout=5)
+    google_io.shutdown(timeout=5)
+    assert peak[0] == 2
+
+
+def test_errors_are_returned_and_do_not_block_the_key(google_io):
+    def fail():
+        raise ValueError("quota")
+
+    failed = google_io.submit("sheet", fail)
+    after = google_io.submit("sheet", lambda: "sent")
+    with pytest.raises(ValueError):
+        failed.result(timeout=5)
+    assert after.result(timeout=5) == "sent"
+
+
+def test_shutdown_flushes_and_runs_later_calls_directly():
+    google_io = GoogleIO()
+    calls = []
+    google_io.submit("sheet", lambda: time.sleep(0.05) or calls.append(1))
+    google_io.shutdown(timeout=5)
+    assert calls == [1]
+    assert google_io.submit("sheet", lambda: "direct").result() == "direct"
@@ -0,0 +1,103 @@
+"""
+Tests of the write-behind buffer and its spill files.
+"""
+
+import json
+import os
+
+import pytest
+
+from tic_tac_toe import tic_tac_toe_buffer
+from tic_tac_toe.tic_tac_toe_buffer import SheetWriteBuffer
+from tic_tac_toe.tic_tac_toe_storage import LocalSpreadsheet
+
+
+class FailingWorksheet:
+    """
+    Worksheet whose appends fail while failing is set.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.title = worksheet.title
+        self.failing = True
+
+    def append_rows(self, values, **kwargs):
+        if self.failing:
+            raise ConnectionError("offline")
+        return self.worksheet.append_rows(values, **kwargs)
+
+
+@pytest.fixture
+def worksheet(tmp_path):
+    return LocalSpreadsheet(str(tmp_path / "sheet.sqlite3")).worksheet(
+        "boards")
+
+
+@pytest.fixture
+def spill_dir(tmp_path):
+    return str(tmp_path / "spill")
+
+
+def spill_files(spill_dir):
+    return sorted(os.listdir(spill_dir)) if os.path.isdir(spill_dir) else []
+
+
+def test_flush_appends_rows(worksheet, spill_dir):
+    buffer = SheetWriteBuffer(worksheet, max_rows=2, spill_dir=spill_dir)
+    buffer.add(["a", 1])
+    assert worksheet.get_all_values() == []
+    buffer.add(["b", 2])
+    assert worksheet.get_all_values() == [["a", "1"], ["b", "2"]]
+    assert spill_files(spill_dir) == []
+
+
+def test_failed_flush_spills_and_retries(worksheet, spill_dir, capsys):
+    failing = FailingWorksheet(worksheet)
+    buffer = SheetWriteBuffer(failing, spill_dir=spill_dir)
+    buffer.add(["a", 1])
+    assert not buffer.flush()
+    assert "offline" in capsys.readouterr().out
+    assert spill_files(spill_dir) == [f"boards.{buffer.owner}.jsonl"]
+
+    failing.failing = False
+    assert buffer.flush()
+    assert worksheet.get_all_values() == [["a", "1"]]
+    assert spill_files(spill_dir) == []
+
+
+def test_buffers_keep_their_own_spill_files(worksheet, spill_dir):
+    first = SheetWriteBuffer(FailingWorksheet(worksheet), spill_dir=spill_dir)
+    second = SheetWriteBuffer(
+        FailingWorksheet(worksheet), spill_dir=spill_dir)
+    first.add(["a", 1])
+    second.add(["b", 2])
+    first.flush()
+    second.flush()
+    # A live buffer's rows are not taken over by another buffer
+    third = SheetWriteBuffer(worksheet, spill_dir=spill_dir)
+    assert third.rows == []
+    assert len(spill_files(spill_dir)) == 2
+
+
+def test_spill_of_ended_process_is_claimed(
+        worksheet, spill_dir, monkeypatch):
+    os.makedirs(spill_dir)
+    with open(os.path.join(spill_dir, "boards.4242-abc.jsonl"), "w") as f:
+        f.write(json.dumps(["old", 0]) + "\n")
+    monkeypatch.setattr(
+        tic_tac_toe_buffer, "process_alive", lambda pid: pid != 4242)
+
+    failing = FailingWorksheet(worksheet)
+    buffer = SheetWriteBuffer(failing, spill_dir=spill_dir)
+    assert buffer.rows == [["old", 0]]
+    assert spill_files(spill_dir) == [f"boards.{buffer.owner}.claimed0.jsonl"]
+
+    # The claimed file is kept until its rows are sent
+    buffer.add(["new", 1])
+    assert not buffer.flush()
+    assert len(spill_files(spill_dir)) == 2
+    failing.failing = False
+    assert buffer.flush()
+    assert worksheet.get_all_values() == [["old", "0"], ["new", "1"]]
+    assert spill_files(spill_dir) == []
@@ -0,0 +1,95 @@
+"""
+Tests of the N×N, K-in-a-row engine and its alpha-beta AI.
+"""
+
+import random
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_board import Board
+from tic_tac_toe.tic_tac_toe_engine import (
+    AlphaBetaPlayer, NKBoard, parse_variant)
+from tic_tac_toe.tic_tac_toe_perfect import (
+    PerfectPlayer, build_perfect_play_table)
+
+
+def play(board, moves):
+    player = 1
+    for move in moves:
+        board.make_move(move, player)
+        player = -player
+    return board
+
+
+@pytest.mark.parametrize("variant, expected", [
+    ("3x3", (3, 3)), ("4X4", (4, 4)), ("5x5k4", (5, 4)),
+    ("15x15", (15, 5)),
+])
+def test_parse_variant(variant, expected):
+    assert parse_variant(variant) == expected
+
+
+@pytest.mark.parametrize("variant", ["3x4", "4x4k5", "big"])
+def test_parse_variant_rejects(variant):
+    with pytest.raises(ValueError):
+        parse_variant(variant)
+
+
+@pytest.mark.parametrize("line", [
+    (0, 1, 2), (5, 9, 13), (0, 5, 10), (7, 10, 13),
+])
+def test_k_in_a_row_wins_in_every_direction(line):
+    board = NKBoard(4, 3)
+    for move in line[:-1]:
+        board.make_move(move, 1)
+        assert board.status() == (False, 0)
+    board.make_move(line[-1], 1)
+    assert board.status() == (True, 1)
+
+
+def test_unmake_restores_the_board():
+    rng = random.Random(3)
+    board = NKBoard(5, 4)
+    for _ in range(8):
+        before = (board.hash, board.score, board.cells[:])
+        move = rng.choice(board.legal_moves())
+        board.make_move(move, rng.choice((1, -1)))
+        board.unmake_move()
+        assert (board.hash, board.score, board.cells) == before
+        board.make_move(move, 1 if len(board.stack) % 2 == 0 else -1)
+
+
+def test_full_board_without_line_is_a_draw():
+    board = play(NKBoard(3, 3), [0, 1, 2, 4, 3, 5, 7, 6, 8])
+    assert board.status() == (True, 0)
+
+
+def test_takes_the_win_and_blocks():
+    player = AlphaBetaPlayer(time_budget=5, max_depth=3)
+    # X: 0 1 2, O: 5 6 7 on a 5x5 board with 4 in a row
+    board = play(NKBoard(5, 4), [0, 5, 1, 6, 2, 7])
+    assert player.select_move(board, 1) == 3
+    # O has to block X at 3
+    board = play(NKBoard(5, 4), [0, 5, 1, 6, 2])
+    assert player.select_move(board, -1) == 3
+
+
+def test_agrees_with_the_perfect_player_on_3x3():
+    perfect = PerfectPlayer(build_perfect_play_table())
+    engine = AlphaBetaPlayer(time_budget=5)
+    for opening in range(9):
+        board, nk_board = Board(), NKBoard(3, 3)
+        board.make_move(opening, 1)
+        nk_board.make_move(opening, 1)
+        side = -1
+        while not board.status()[0]:
+            if side == -1:
+                move = engine.select_move(nk_board, -1)
+            else:
+                move = perfect.select_move(board, 1)
+            board.make_move(move, side)
+            nk_board.make_move(move, side)
+            side = -side
+        # Neither side can win against perfect play
+        assert board.status() == (True, 0)
+        assert nk_board.status() == (True, 0)
@@ -0,0 +1,100 @@
+"""
+Tests of the SQLite game history and its sync cursor.
+"""
+
+import sqlite3
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_board import Board
+from tic_tac_toe.tic_tac_toe_history import GameHistory
+from tic_tac_toe.tic_tac_toe_storage import LocalSpreadsheet
+from tic_tac_toe.tic_tac_toe_symmetry import canonicalize_move
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = GameHistory(str(tmp_path / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+@pytest.fixture
+def worksheet(tmp_path):
+    return LocalSpreadsheet(str(tmp_path / "sheet.sqlite3")).worksheet(
+        "boards")
+
+
+def test_moves_are_stored_canonically(history):
+    board = Board()
+    board.make_move(8, 1)
+    history.record("game", "bob", board, 8, 1)
+    canonical, move = canonicalize_move(board, 8)
+    [stored] = history.query(player="bob")
+    assert stored["board"] == canonical.to_string()
+    assert stored["move"] == move
+    assert stored["turn"] == 1
+    assert stored["sheet_row"] is None
+    assert history.move_counts(canonical.to_string()) == {move: 1}
+    assert history.player_summary("bob") == {
+        "player": "bob", "games": 1, "moves": 1}
+
+
+def test_sync_reads_only_new_sheet_rows(history, worksheet):
+    worksheet.append_rows([["X        ", 4], ["X   O    ", 1]])
+    assert history.sync_from_worksheet(worksheet) == 2
+    assert history.last_sheet_row() == 2
+    assert history.sync_from_worksheet(worksheet) == 0
+
+    worksheet.append_row(["XX  O    ", 2])
+    assert history.sync_from_worksheet(worksheet) == 1
+    assert [move["sheet_row"] for move in history.query()] == [1, 2, 3]
+
+
+def test_sheet_cursor_ignores_local_moves(history, worksheet):
+    board = Board()
+    board.make_move(0, 1)
+    history.record("game", "bob", board, 0, 1)
+    history.record("game", "bob", board, 0, 1)
+    worksheet.append_rows([["X        ", 4]])
+    history.sync_from_worksheet(worksheet)
+
+    # The local IDs and the sheet rows are separate cursors
+    assert history.count() == 3
+    assert history.count(since_id=2) == 1
+    assert history.count(cursor="sheet_row") == 1
+    assert history.count(since_id=1, cursor="sheet_row") == 0
+    boards, moves, last = history.training_arrays(cursor="sheet_row")
+    assert (len(boards), list(moves), last) == (1, [4], 1)
+    boards, moves, last = history.training_arrays(since_id=1)
+    assert (len(boards), last) == (2, 3)
+    with pytest.raises(ValueError):
+        history.count(cursor="created")
+
+
+def test_imported_rows_are_not_imported_twice(history):
+    rows = [["X        ", "4"], ["", ""], ["X   O    ", "1"]]
+    assert history.import_rows(rows) == 2
+    assert history.import_rows(rows) == 0
+    assert history.seed_from_worksheet(None) == 0
+
+
+def test_old_history_is_migrated(tmp_path):
+    path = str(tmp_path / "old.sqlite3")
+    connection = sqlite3.connect(path)
+    connection.executescript(
+        "CREATE TABLE moves (id INTEGER PRIMARY KEY, game_id TEXT,"
+        " player TEXT, turn INTEGER, side INTEGER, board TEXT NOT NULL,"
+        " move INTEGER NOT NULL, created REAL NOT NULL);"
+        "INSERT INTO moves VALUES (7, NULL, NULL, 1, NULL, 'X        ',"
+        " 4, 0);"
+        "INSERT INTO moves VALUES (8, 'game', 'bob', 1, 1, 'X        ',"
+        " 4, 0);")
+    connection.commit()
+    connection.close()
+
+    history = GameHistory(path)
+    # Moves imported before the column existed used the sheet row as ID
+    assert history.last_sheet_row() == 7
+    assert [move["sheet_row"] for move in history.query()] == [7, None]
+    history.close()
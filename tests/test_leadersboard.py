@@ -0,0 +1,102 @@
+"""
+Tests of the leadersboard service and its ranking index.
+"""
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_leadersboard import (
+    LeadersboardService, RankingIndex)
+from tic_tac_toe.tic_tac_toe_storage import LocalSpreadsheet
+
+
+class CountingWorksheet:
+    """
+    Worksheet wrapper that records the name of every call.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self.worksheet, name)
+
+        def call(*args, **kwargs):
+            self.calls.append(name)
+            return method(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture
+def worksheet(tmp_path):
+    return CountingWorksheet(LocalSpreadsheet(
+        str(tmp_path / "sheet.sqlite3")).worksheet("leadersboard"))
+
+
+def test_update_writes_counters(worksheet):
+    service = LeadersboardService(worksheet)
+    service.update("alice", "Win")
+    service.update("alice", "Draw")
+    service.update("bob", "Lose")
+    assert worksheet.get_all_values()[1:] == [
+        ["alice", "2", "1", "0", "1"],
+        ["bob", "1", "0", "1", "0"],
+    ]
+    assert service.rank("alice") == 1
+    assert [row[0] for _, row in service.top()] == ["alice", "bob"]
+
+
+def test_every_update_is_one_request(worksheet):
+    service = LeadersboardService(worksheet)
+    worksheet.calls.clear()
+    service.update("alice", "Win")
+    assert worksheet.calls == ["append_rows"]
+    worksheet.calls.clear()
+    service.update("alice", "Lose")
+    assert worksheet.calls == ["batch_update"]
+
+
+def test_new_rows_come_from_the_append_response(worksheet):
+    # The new row goes after the last row with data, even an empty one
+    worksheet.append_rows([["carol", 1, 1, 0, 0], ["", "", "", "", ""]])
+    service = LeadersboardService(worksheet)
+    service.update("alice", "Win")
+    service.update("alice", "Win")
+    assert service.rows["alice"] == 4
+    assert worksheet.get_all_values()[3] == ["alice", "2", "2", "0", "0"]
+
+
+def test_failed_write_is_sent_again(worksheet):
+    service = LeadersboardService(worksheet)
+    service.update("alice", "Win")
+    batch_update = worksheet.worksheet.batch_update
+
+    def failing(*args, **kwargs):
+        raise ConnectionError("offline")
+
+    worksheet.worksheet.batch_update = failing
+    with pytest.raises(ConnectionError):
+        service.update("alice", "Draw")
+    worksheet.worksheet.batch_update = batch_update
+    service.flush()
+    assert worksheet.get_all_values()[1] == ["alice", "2", "1", "0", "1"]
+
+
+def test_loads_the_existing_board(worksheet):
+    worksheet.append_rows([["bob", 3, 2, 1, 0], ["alice", 1, 0, 0, 1]])
+    service = LeadersboardService(worksheet)
+    assert service.rank("bob") == 1
+    assert service.around("alice", neighbors=1) == [
+        (1, ["bob", 3, 2, 1, 0]), (2, ["alice", 1, 0, 0, 1])]
+    assert service.page(1, size=1) == ([(1, ["bob", 3, 2, 1, 0])], 2)
+
+
+def test_ranking_index_moves_players():
+    ranking = RankingIndex()
+    ranking.update("alice", 1, 2)
+    ranking.update("bob", 2, 2)
+    assert ranking.nicknames(0, 2) == ["bob", "alice"]
+    ranking.update("alice", 3, 4)
+    assert ranking.rank("alice") == 1
+    assert ranking.rank("carol") is None
@@ -0,0 +1,85 @@
+"""
+Tests of the Monte Carlo Tree Search AI.
+"""
+
+import time
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_board import Board
+from tic_tac_toe.tic_tac_toe_mcts import (
+    PROBE_ROUNDS, MCTSPlayer, get_rollout_pool)
+from tic_tac_toe.tic_tac_toe_perfect import (
+    PerfectPlayer, build_perfect_play_table)
+
+
+def board(cells):
+    """
+    Board from a string of 9 cells: X, O or - for empty.
+    """
+
+    return Board.from_list(
+        [{"X": 1, "O": -1, "-": 0}[cell] for cell in cells])
+
+
+@pytest.fixture
+def player():
+    # A fixed number of playouts keeps the search deterministic
+    return MCTSPlayer(time_budget=60, playouts=4000, workers=1, seed=1)
+
+
+def test_takes_the_win(player):
+    assert player.select_move(board("OO-XX-X--"), -1) == 2
+
+
+def test_blocks_the_win(player):
+    assert player.select_move(board("XX--O----"), -1) == 2
+
+
+def test_keeps_the_tree_of_the_game(player):
+    position = board("X--------")
+    move = player.select_move(position, -1)
+    assert not player.last_reused
+    position.make_move(move, -1)
+    position.make_move(position.legal_moves()[0], 1)
+    player.select_move(position, -1)
+    assert player.last_reused
+
+
+def test_draws_against_perfect_play(player):
+    perfect = PerfectPlayer(build_perfect_play_table())
+    for opening in (0, 1, 4):
+        position, side = Board(), -1
+        position.make_move(opening, 1)
+        while not position.status()[0]:
+            if side == -1:
+                move = player.select_move(position, -1)
+            else:
+                move = perfect.select_move(position, 1)
+            position.make_move(move, side)
+            side = -side
+        assert position.status() == (True, 0)
+
+
+def test_pool_is_started_outside_the_time_budget():
+    player = MCTSPlayer(time_budget=0.1, workers=2, seed=1)
+    assert len(get_rollout_pool(2)._processes) == 2
+    started = time.perf_counter()
+    player.select_move(board("X--------"), -1)
+    assert time.perf_counter() - started < 0.3
+
+
+def test_the_faster_way_to_evaluate_is_used():
+    player = MCTSPlayer(workers=2, seed=1)
+    # Both ways are measured first
+    assert player._use_pool()
+    player._measure(True, 10, 1.0)
+    assert not player._use_pool()
+    player._measure(False, 40, 1.0)
+
+    # The pool is slower: only every PROBE_ROUNDS-th round uses it
+    uses = [player._use_pool() for _ in range(PROBE_ROUNDS * 2)]
+    assert uses.count(True) == 2
+    player._measure(True, 1000, 1.0)
+    player._measure(True, 1000, 1.0)
+    assert player._use_pool()
@@ -0,0 +1,139 @@
+"""
+Tests of the metrics registry, its exports and the API counters.
+"""
+
+import json
+import os
+import socket
+import time
+
+import pytest
+
+from tic_tac_toe import tic_tac_toe_metrics
+from tic_tac_toe.tic_tac_toe_metrics import (
+    BYTES_METRIC, CALLS_METRIC, ERRORS_METRIC, SPAN_METRIC,
+    InstrumentedClient, Metrics, fallback_file, format_labels,
+    payload_size)
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    metrics = Metrics(path="")
+    monkeypatch.setattr(tic_tac_toe_metrics, "get_metrics", lambda: metrics)
+    return metrics
+
+
+def counter(metrics, name, **labels):
+    return metrics.counters.get((name, tuple(sorted(labels.items()))), 0)
+
+
+def test_payload_size_estimates_without_serializing():
+    assert payload_size(b"abcd") == 4
+    assert payload_size([["ab", "c"], ["d"]]) == 4
+    assert payload_size({"range": "A1", "values": [[12]]}) == 15
+    assert payload_size((None, True, object())) == 0
+
+
+def test_label_values_are_escaped():
+    assert format_labels(()) == ""
+    assert format_labels((("path", 'a\\b"c\nd'),)) == (
+        '{path="a\\\\b\\"c\\nd"}')
+
+
+def test_spans_and_sessions(metrics):
+    metrics.start_session("game")
+    with metrics.span("predict", backend="tf"):
+        pass
+    metrics.observe("predict", 0.2, backend="tf")
+    summary = metrics.end_session()
+    assert summary["predict"]["count"] == 2
+    text = metrics.render_prometheus()
+    assert f"# TYPE {SPAN_METRIC} histogram" in text
+    assert (f'{SPAN_METRIC}_count{{backend="tf",span="predict"}} 2'
+            in text)
+    labels = 'backend="tf",span="predict",le="+Inf"'
+    assert f"{SPAN_METRIC}_bucket{{{labels}}} 2" in text
+
+
+def test_counters_and_gauges(metrics):
+    metrics.count("games_total", mode="cli")
+    metrics.count("games_total", 2, mode="cli")
+    metrics.gauge("queue_depth", lambda: 5, worksheet="boards")
+    text = metrics.render_prometheus()
+    assert 'games_total{mode="cli"} 3' in text
+    assert 'queue_depth{worksheet="boards"} 5' in text
+    assert metrics.snapshot()["gauges"] == [
+        {"worksheet": "boards", "name": "queue_depth", "value": 5}]
+
+
+def test_instrumented_client_counts_calls(metrics):
+    class Worksheet:
+        title = "boards"
+
+        def get(self, range_name):
+            return [["ab", "c"]]
+
+        def fail(self):
+            raise ConnectionError("offline")
+
+    client = InstrumentedClient(Worksheet(), "sheets")
+    assert client.title == "boards"
+    assert client.get("A1") == [["ab", "c"]]
+    with pytest.raises(ConnectionError):
+        client.fail()
+    assert counter(metrics, CALLS_METRIC, api="sheets", method="get") == 1
+    assert counter(metrics, ERRORS_METRIC, api="sheets", method="fail") == 1
+    assert counter(metrics, BYTES_METRIC, api="sheets",
+                   direction="sent") == 2
+    assert counter(metrics, BYTES_METRIC, api="sheets",
+                   direction="received") == 3
+
+
+def test_jsonl_file(tmp_path):
+    path = str(tmp_path / "metrics.jsonl")
+    metrics = Metrics(path=path)
+    metrics.start_session("game")
+    metrics.observe("ai_move", 0.01)
+    metrics.end_session()
+    metrics.write_snapshot()
+    metrics.file.close()
+    with open(path) as lines:
+        types = [json.loads(line)["type"] for line in lines]
+    assert types == ["span", "session", "snapshot"]
+
+
+def test_fallback_file_deletes_old_files(tmp_path):
+    directory = str(tmp_path / "metrics")
+    os.makedirs(directory)
+    old = os.path.join(directory, "tic_tac_toe_metrics.1.jsonl")
+    recent = os.path.join(directory, "tic_tac_toe_metrics.2.jsonl")
+    for path in (old, recent):
+        open(path, "w").close()
+    eight_days_ago = time.time() - 8 * 86400
+    os.utime(old, (eight_days_ago, eight_days_ago))
+
+    path = fallback_file(directory, retention=7)
+    assert path == os.path.join(
+        directory, f"tic_tac_toe_metrics.{os.getpid()}.jsonl")
+    assert sorted(os.listdir(directory)) == [
+        "tic_tac_toe_metrics.2.jsonl"]
+
+
+def test_taken_port_falls_back_to_the_directory(tmp_path, monkeypatch):
+    taken = socket.socket()
+    taken.bind(("127.0.0.1", 0))
+    taken.listen()
+    directory = str(tmp_path / "metrics")
+    monkeypatch.setattr(
+        tic_tac_toe_metrics, "METRICS_PORT", taken.getsockname()[1])
+    monkeypatch.setattr(tic_tac_toe_metrics, "METRICS_FILE", "")
+    monkeypatch.setattr(
+        tic_tac_toe_metrics, "fallback_file",
+        lambda: os.path.join(directory, "fallback.jsonl"))
+    os.makedirs(directory)
+    try:
+        metrics = tic_tac_toe_metrics.get_metrics.__wrapped__()
+    finally:
+        taken.close()
+    assert metrics.file.name == os.path.join(directory, "fallback.jsonl")
+    metrics.file.close()
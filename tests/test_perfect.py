@@ -0,0 +1,77 @@
+"""
+Tests of the perfect-play table.
+"""
+
+import os
+import stat
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_board import Board
+from tic_tac_toe.tic_tac_toe_perfect import (
+    PerfectPlayer, build_perfect_play_table, load_perfect_player,
+    save_perfect_play_table)
+
+
+@pytest.fixture(scope="module")
+def player():
+    return PerfectPlayer(build_perfect_play_table())
+
+
+def board(cells):
+    """
+    Board from a string of 9 cells: X, O or - for empty.
+    """
+
+    return Board.from_list(
+        [{"X": 1, "O": -1, "-": 0}[cell] for cell in cells])
+
+
+def test_empty_board_is_a_draw(player):
+    assert player.value(Board(), 1) == 0
+    assert player.value(Board(), -1) == 0
+
+
+def test_takes_the_win(player):
+    # O wins on the top row instead of blocking X
+    position = board("OO-XX----")
+    assert player.value(position, -1) == 1
+    assert player.select_move(position, -1) == 2
+
+
+def test_blocks_the_win(player):
+    position = board("XX--O----")
+    assert player.select_move(position, -1) == 2
+
+
+def test_answers_a_corner_with_the_centre(player):
+    assert player.select_move(board("X--------"), -1) == 4
+
+
+def test_lost_position(player):
+    # X has a fork: O cannot block both lines
+    position = board("XO--X---O")
+    assert player.value(position, 1) == 1
+    position.make_move(player.select_move(position, 1), 1)
+    assert player.value(position, -1) == -1
+
+
+def test_no_move_on_a_finished_board(player):
+    with pytest.raises(ValueError):
+        player.select_move(board("XXXOO----"), -1)
+
+
+def test_self_play_is_a_draw(player):
+    position, side = Board(), 1
+    while not position.status()[0]:
+        position.make_move(player.select_move(position, side), side)
+        side = -side
+    assert position.status() == (True, 0)
+
+
+def test_saved_table_is_readable_by_all(tmp_path):
+    path = str(tmp_path / "table.npy")
+    save_perfect_play_table(build_perfect_play_table(), path)
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o644
+    assert os.listdir(tmp_path) == ["table.npy"]
+    assert load_perfect_player(path).value(Board(), 1) == 0
@@ -0,0 +1,160 @@
+"""
+Tests of the coalescing and retries of the rate-limited worksheet.
+"""
+
+import threading
+import time
+
+import pytest
+
+from tic_tac_toe import tic_tac_toe_ratelimit
+from tic_tac_toe.tic_tac_toe_ratelimit import (
+    RateLimitedWorksheet, TokenBucket, call_with_backoff)
+from tic_tac_toe.tic_tac_toe_storage import LocalSpreadsheet, range_rows
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.response = type("Response", (), {"status_code": status})()
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(tic_tac_toe_ratelimit, "BACKOFF_BASE", 0)
+
+
+@pytest.fixture
+def worksheet(tmp_path):
+    return LocalSpreadsheet(str(tmp_path / "sheet.sqlite3")).worksheet(
+        "boards")
+
+
+def failing(statuses, result="ok"):
+    calls = []
+
+    def call():
+        calls.append(None)
+        if statuses:
+            raise HttpError(statuses.pop(0))
+        return result
+
+    return call, calls
+
+
+def test_quota_errors_are_retried():
+    call, calls = failing([429, 429])
+    assert call_with_backoff(call, idempotent=False) == "ok"
+    assert len(calls) == 3
+
+
+def test_server_errors_are_retried_only_if_idempotent():
+    call, calls = failing([503])
+    assert call_with_backoff(call) == "ok"
+    call, calls = failing([503])
+    with pytest.raises(HttpError):
+        call_with_backoff(call, idempotent=False)
+    assert len(calls) == 1
+
+
+def test_merged_appends_get_their_own_range(worksheet):
+    limited = RateLimitedWorksheet(
+        worksheet, TokenBucket(0, 1), TokenBucket(0, 1))
+    gate = threading.Event()
+    results = {}
+
+    def blocked_acquire():
+        gate.wait()
+
+    limited._writes.acquire = blocked_acquire
+
+    def append(name, rows):
+        results[name] = limited.append_rows(rows)
+
+    threads = [
+        threading.Thread(target=append, args=(name, rows))
+        for name, rows in (("a", [[1]]), ("b", [[2], [3]]), ("c", [[4]]))
+    ]
+    for thread in threads:
+        thread.start()
+    while limited.queue_depth() < 3:
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+
+    ranges = {name: range_rows(result["updates"]["updatedRange"])
+              for name, result in results.items()}
+    values = worksheet.get_all_values()
+    for name, rows in (("a", [[1]]), ("b", [[2], [3]]), ("c", [[4]])):
+        first, last = ranges[name]
+        assert values[first - 1:last] == [
+            [str(value) for value in row] for row in rows]
+        assert results[name]["updates"]["updatedRows"] == len(rows)
+
+
+def test_first_writer_hands_the_queue_over(worksheet):
+    limited = RateLimitedWorksheet(
+        worksheet, TokenBucket(0, 1), TokenBucket(0, 1))
+    release = threading.Event()
+    append_rows = worksheet.append_rows
+    calls = []
+
+    class Blocking:
+        id = worksheet.id
+        title = worksheet.title
+
+        def append_rows(self, values, **kwargs):
+            calls.append(values)
+            if len(calls) == 1:
+                # The second write is queued behind the first one
+                while limited.queue_depth() < 1:
+                    time.sleep(0.01)
+            else:
+                release.wait(5)
+            return append_rows(values, **kwargs)
+
+    limited._worksheet = Blocking()
+    first = threading.Thread(target=limited.append_rows, args=([[1]],))
+    second = threading.Thread(target=limited.append_rows, args=([[2]],))
+    first.start()
+    while not calls:
+        time.sleep(0.01)
+    second.start()
+    # The first writer returns while the second write is still sent
+    first.join(5)
+    assert not first.is_alive()
+    assert second.is_alive()
+    release.set()
+    second.join(5)
+    assert worksheet.get_all_values() == [["1"], ["2"]]
+
+
+def test_range_updates_are_merged(worksheet):
+    worksheet.append_rows([["a", 1], ["b", 2]])
+    limited = RateLimitedWorksheet(
+        worksheet, TokenBucket(0, 1), TokenBucket(0, 1))
+    gate = threading.Event()
+    limited._writes.acquire = gate.wait
+    batches = []
+    batch_update = worksheet.batch_update
+
+    def recording(data, **kwargs):
+        batches.append(data)
+        return batch_update(data, **kwargs)
+
+    worksheet.batch_update = recording
+    threads = [
+        threading.Thread(target=limited.batch_update, args=(
+            [{"range": f"B{row}", "values": [[row * 10]]}],))
+        for row in (1, 2)
+    ]
+    for thread in threads:
+        thread.start()
+        while limited.queue_depth() < threads.index(thread) + 1:
+            time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(batches) == 1
+    assert worksheet.get_all_values() == [["a", "10"], ["b", "20"]]
@@ -0,0 +1,113 @@
+"""
+Tests of the local storage backend.
+"""
+
+import multiprocessing
+import sqlite3
+
+import pytest
+
+from tic_tac_toe.tic_tac_toe_storage import (
+    LocalSpreadsheet, LocalStorage, appended_rows, column_letters,
+    range_rows, rowcol_to_a1)
+
+
+@pytest.fixture
+def spreadsheet(tmp_path):
+    return LocalSpreadsheet(str(tmp_path / "sheet.sqlite3"))
+
+
+def test_a1_helpers():
+    assert column_letters(1) == "A"
+    assert column_letters(27) == "AA"
+    assert rowcol_to_a1(5, 28) == "AB5"
+    assert range_rows("'leadersboard'!A5:E7") == (5, 7)
+    assert appended_rows({"updates": {"updatedRange": "t!A2:C2"}}) == (2, 2)
+    assert appended_rows({}) is None
+
+
+def test_new_worksheet_has_default_header(spreadsheet):
+    worksheet = spreadsheet.worksheet("leadersboard")
+    assert worksheet.get_all_values() == [[
+        "human_nickname", "total_games", "win_human", "win_ai", "draws"]]
+    assert spreadsheet.worksheet("leadersboard").id == worksheet.id
+
+
+def test_append_returns_updated_range(spreadsheet):
+    worksheet = spreadsheet.worksheet("boards")
+    response = worksheet.append_rows([["a", 1], ["b", 2]])
+    assert response["updates"] == {
+        "updatedRange": "boards!A1:B2", "updatedRows": 2}
+    response = worksheet.append_row(["c", 3, "x"])
+    assert appended_rows(response) == (3, 3)
+    assert worksheet.get_all_values() == [
+        ["a", "1", ""], ["b", "2", ""], ["c", "3", "x"]]
+
+
+def test_get_and_batch_get_read_ranges(spreadsheet):
+    worksheet = spreadsheet.worksheet("boards")
+    worksheet.append_rows([["a", 1, "p"], ["b", 2, "q"], ["c", 3, "r"]])
+    assert worksheet.get("B2:C3") == [["2", "q"], ["3", "r"]]
+    assert worksheet.get("A2:A") == [["b"], ["c"]]
+    assert worksheet.batch_get(["A1:C1", "C3:C3"]) == [
+        [["a", "1", "p"]], [["r"]]]
+
+
+def test_batch_update_and_insert_rows(spreadsheet):
+    worksheet = spreadsheet.worksheet("boards")
+    worksheet.append_rows([["a", 1], ["b", 2]])
+    worksheet.batch_update([
+        {"range": "B1", "values": [[10]]},
+        {"range": "C2:D2", "values": [["x", "y"]]},
+    ])
+    worksheet.insert_rows([["new", 0]], row=2)
+    assert worksheet.get_all_values() == [
+        ["a", "10", "", ""], ["new", "0", "", ""], ["b", "2", "x", "y"]]
+
+
+def append_in_process(path, name, count, start):
+    worksheet = LocalSpreadsheet(path).worksheet("boards")
+    start.wait()
+    for i in range(count):
+        worksheet.append_row([name, i])
+
+
+def test_appends_of_two_processes_are_all_kept(tmp_path):
+    path = str(tmp_path / "sheet.sqlite3")
+    LocalSpreadsheet(path).worksheet("boards")
+    context = multiprocessing.get_context("spawn")
+    start = context.Barrier(2)
+    processes = [
+        context.Process(
+            target=append_in_process, args=(path, name, 200, start))
+        for name in "ab"
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+    values = LocalSpreadsheet(path).worksheet("boards").get_all_values()
+    assert sorted(map(tuple, values)) == sorted(
+        (name, str(i)) for name in "ab" for i in range(200))
+
+
+def test_new_row_never_replaces_a_row(spreadsheet):
+    worksheet = spreadsheet.worksheet("boards")
+    worksheet.append_row(["a"])
+    with pytest.raises(sqlite3.IntegrityError):
+        with spreadsheet.transaction():
+            worksheet._write_row(1, ["b"], replace=False)
+    assert worksheet.get_all_values() == [["a"]]
+
+
+def test_model_files(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    file_id = storage.upload_file({"name": "model.h5"}, b"v1")
+    assert storage.download_file(file_id) == b"v1"
+    assert [found["id"] for found in storage.find_files("model.h5")] == [
+        file_id]
+    storage.update_file(file_id, {"name": "model.h5"}, b"v2")
+    assert storage.download_file(file_id) == b"v2"
+    storage.delete_file(file_id)
+    assert storage.find_files("model.h5") == []
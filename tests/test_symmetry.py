@@ -0,0 +1,91 @@
+"""
+Tests of the board symmetries and canonical forms.
+"""
+
+import random
+
+import numpy as np
+import pytest
+
+from tic_tac_toe.tic_tac_toe_board import Board, CELLS
+from tic_tac_toe.tic_tac_toe_symmetry import (
+    TRANSFORMS, augment, canonicalize, canonicalize_move, inverse_move,
+    transform_board, transform_move)
+
+
+def random_board(rng, moves):
+    board, player = Board(), 1
+    for move in rng.sample(range(CELLS), moves):
+        board.make_move(move, player)
+        player = -player
+    return board
+
+
+@pytest.fixture
+def boards():
+    rng = random.Random(7)
+    return [random_board(rng, rng.randint(0, 8)) for _ in range(200)]
+
+
+def test_there_are_eight_distinct_transforms():
+    assert len(set(TRANSFORMS)) == 8
+    assert TRANSFORMS[0] == tuple(range(CELLS))
+    assert all(sorted(perm) == list(range(CELLS)) for perm in TRANSFORMS)
+
+
+def test_quarter_turn():
+    # 0 1 2      6 3 0
+    # 3 4 5  ->  7 4 1
+    # 6 7 8      8 5 2
+    board = Board.from_list([1, 0, 0, 0, 0, 0, 0, 0, -1])
+    assert transform_board(board, 2).to_list() == [
+        0, 0, 1, 0, 0, 0, -1, 0, 0]
+
+
+@pytest.mark.parametrize("transform", range(8))
+def test_move_round_trip(transform):
+    for move in range(CELLS):
+        assert inverse_move(transform_move(move, transform),
+                            transform) == move
+
+
+@pytest.mark.parametrize("transform", range(8))
+def test_moves_follow_the_board(boards, transform):
+    for board in boards:
+        transformed = transform_board(board, transform)
+        for move in range(CELLS):
+            assert transformed.cell(transform_move(move, transform)) == (
+                board.cell(move))
+
+
+def test_canonical_form_is_shared_by_all_symmetric_copies(boards):
+    for board in boards:
+        canonical, transform = canonicalize(board)
+        assert transform_board(board, transform) == canonical
+        for other in range(8):
+            assert canonicalize(transform_board(board, other))[0] == (
+                canonical)
+
+
+def test_canonical_move_maps_back(boards):
+    for board in boards:
+        for move in board.legal_moves():
+            canonical, canonical_move = canonicalize_move(board, move)
+            transform = canonicalize(board)[1]
+            assert canonical.is_empty(canonical_move)
+            assert inverse_move(canonical_move, transform) == move
+
+
+def test_augment_matches_transform_board(boards):
+    arrays = np.array([board.to_list() for board in boards[:5]])
+    moves = np.array([board.legal_moves()[0] if board.legal_moves() else 0
+                      for board in boards[:5]])
+    all_boards, all_moves = augment(arrays, moves)
+    assert all_boards.shape == (40, CELLS)
+    assert all_moves.shape == (40,)
+    for transform in range(8):
+        for i, board in enumerate(boards[:5]):
+            row = transform * 5 + i
+            assert list(all_boards[row]) == (
+                transform_board(board, transform).to_list())
+            assert all_moves[row] == transform_move(moves[i], transform)
@@ -0,0 +1,139 @@
+"""
+Tests of the training worker schedule and watermark.
+"""
+
+import sys
+import types
+
+import pytest
+
+from tic_tac_toe import tic_tac_toe_trainer
+from tic_tac_toe.tic_tac_toe_history import GameHistory
+from tic_tac_toe.tic_tac_toe_trainer import TrainingWorker
+
+
+class StubModel:
+    def __init__(self, watermark, score):
+        self.training_watermark = watermark
+        self.score = score
+
+
+def published(watermark, version="1"):
+    return {
+        "id": "model",
+        "appProperties": {
+            "watermark": str(watermark), "watermark_cursor": "id",
+            "version": version,
+        },
+    }
+
+
+@pytest.fixture
+def history(tmp_path):
+    history = GameHistory(str(tmp_path / "history.sqlite3"))
+    yield history
+    history.close()
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    """
+    Replace the Drive calls and the training with stubs: the published
+    model scores 0.9 and every candidate 0.5.
+    """
+
+    state = types.SimpleNamespace(
+        published=published(0), trained=0, saved=[])
+
+    def train_model_incremental(model, history, cursor="id"):
+        state.trained += 1
+        return StubModel(history.last_id(), 0.5)
+
+    tf = types.ModuleType("tic_tac_toe.tic_tac_toe_tf")
+    tf.train_model = lambda history, cursor="id": StubModel(
+        history.last_id(), 0.5)
+    tf.train_model_incremental = train_model_incremental
+    monkeypatch.setitem(sys.modules, "tic_tac_toe.tic_tac_toe_tf", tf)
+    monkeypatch.setattr(
+        tic_tac_toe_trainer, "get_published_model",
+        lambda name: state.published)
+    monkeypatch.setattr(
+        tic_tac_toe_trainer, "download_model_from_google_drive",
+        lambda file_id: StubModel(0, 0.9))
+    monkeypatch.setattr(
+        tic_tac_toe_trainer, "save_model_to_google_drive",
+        state.saved.append)
+    monkeypatch.setattr(
+        tic_tac_toe_trainer, "score_model",
+        lambda model, positions: model.score)
+    monkeypatch.setattr(
+        tic_tac_toe_trainer, "validation_positions", lambda: [])
+    return state
+
+
+def add_moves(history, count):
+    history.import_rows(
+        [["X        ", "4"]] * count, history.last_sheet_row() + 1)
+
+
+def test_pending_records_follow_the_published_watermark(history, stubs):
+    add_moves(history, 10)
+    worker = TrainingWorker(history, min_records=5, cursor="id")
+    assert worker.pending_records(published(4)) == 6
+    assert worker.pending_records(None) == 10
+    other_cursor = published(4)
+    other_cursor["appProperties"]["watermark_cursor"] = "sheet_row"
+    assert worker.pending_records(other_cursor) == 10
+
+
+def test_rejected_candidate_is_not_retrained_on_every_poll(
+        history, stubs, capsys):
+    add_moves(history, 10)
+    worker = TrainingWorker(history, min_records=5, interval=3600,
+                            cursor="id")
+    assert not worker.run_once()
+    assert "not published" in capsys.readouterr().out
+    assert stubs.trained == 1
+
+    # Every poll without new moves does nothing
+    for _ in range(3):
+        assert not worker.run_once()
+    assert stubs.trained == 1
+
+    # Not enough new moves yet
+    add_moves(history, 4)
+    assert not worker.run_once()
+    assert stubs.trained == 1
+
+    add_moves(history, 1)
+    assert not worker.run_once()
+    assert stubs.trained == 2
+    assert stubs.saved == []
+
+
+def test_rejected_candidate_is_retried_after_the_interval(history, stubs):
+    add_moves(history, 10)
+    worker = TrainingWorker(history, min_records=5, interval=3600,
+                            cursor="id")
+    worker.run_once()
+    worker.last_run -= 3600
+    worker.run_once()
+    assert stubs.trained == 2
+
+
+def test_new_published_model_clears_the_rejection(history, stubs):
+    add_moves(history, 10)
+    worker = TrainingWorker(history, min_records=5, cursor="id")
+    worker.run_once()
+    stubs.published = published(0, version="2")
+    worker.run_once()
+    assert stubs.trained == 2
+
+
+def test_better_candidate_is_published(history, stubs):
+    add_moves(history, 10)
+    worker = TrainingWorker(history, min_records=5, cursor="id")
+    sys.modules["tic_tac_toe.tic_tac_toe_tf"].train_model_incremental = (
+        lambda model, history, cursor="id": StubModel(10, 0.95))
+    assert worker.run_once()
+    assert [model.training_watermark for model in stubs.saved] == [10]
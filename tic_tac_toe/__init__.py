@@ -2,8 +2,19 @@
 This module initializes the tic-tac-toe package, setting up the namespace for
 easy import and usage of its components.
 It may also specify the `__all__` list to define the public API of the package.
+
+Only the light modules are imported here. The modules that pull in
+TensorFlow, NumPy or the Google clients are imported on first access
+of one of their names, so a session only pays for what it uses.
 """
 
+import importlib
+
+from .tic_tac_toe_board import (
+    Board,
+    CELLS,
+    WIN_MASKS,
+)
 
 from .tic_tac_toe_ui import (
     display_start_game,
@@ -11,28 +22,103 @@ from .tic_tac_toe_ui import (
     display_leadersboard
 )
 
-from .tic_tac_toe_google import (
-    save_model_to_google_drive,
-    load_data_from_google_sheets,
-    update_leadersboard,
-    save_board_to_google_sheets,
-    get_model_id_by_name,
-    download_model_from_google_drive,
-)
+# Public name -> module it is imported from on first access
+_LAZY_IMPORTS = {
+    'canonicalize': '.tic_tac_toe_symmetry',
+    'canonicalize_move': '.tic_tac_toe_symmetry',
+    'inverse_move': '.tic_tac_toe_symmetry',
+    'augment': '.tic_tac_toe_symmetry',
+    'save_model_to_google_drive': '.tic_tac_toe_google',
+    'load_data_from_google_sheets': '.tic_tac_toe_google',
+    'update_leadersboard': '.tic_tac_toe_google',
+    'get_leadersboard': '.tic_tac_toe_google',
+    'save_board_to_google_sheets': '.tic_tac_toe_google',
+    'flush_board_buffers': '.tic_tac_toe_google',
+    'get_model_id_by_name': '.tic_tac_toe_google',
+    'download_model_from_google_drive': '.tic_tac_toe_google',
+    'load_numpy_model_from_google_drive': '.tic_tac_toe_google',
+    'NumpyModel': '.tic_tac_toe_numpy_model',
+    'train_model': '.tic_tac_toe_tf',
+    'train_model_incremental': '.tic_tac_toe_tf',
+    'train_model_on_arrays': '.tic_tac_toe_tf',
+    'CachedPredictor': '.tic_tac_toe_predict',
+    'submit_google_io': '.tic_tac_toe_async_io',
+    'wait_google_io': '.tic_tac_toe_async_io',
+    'worksheet_key': '.tic_tac_toe_async_io',
+    'PerfectPlayer': '.tic_tac_toe_perfect',
+    'load_perfect_player': '.tic_tac_toe_perfect',
+    'GameHistory': '.tic_tac_toe_history',
+    'get_game_history': '.tic_tac_toe_history',
+    'new_game_id': '.tic_tac_toe_history',
+    'SHEETS_MIRROR': '.tic_tac_toe_history',
+    'NKBoard': '.tic_tac_toe_engine',
+    'AlphaBetaPlayer': '.tic_tac_toe_engine',
+    'parse_variant': '.tic_tac_toe_engine',
+    'MCTSPlayer': '.tic_tac_toe_mcts',
+    'get_metrics': '.tic_tac_toe_metrics',
+    'span': '.tic_tac_toe_metrics',
+    'timed': '.tic_tac_toe_metrics',
+    'session_metrics': '.tic_tac_toe_metrics',
+    'RateLimitedWorksheet': '.tic_tac_toe_ratelimit',
+    'sheets_queue_depth': '.tic_tac_toe_ratelimit',
+}
+
+
+def __getattr__(name):
+    """
+    Import the module of a lazily loaded name on first access.
+    """
+
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    globals()[name] = value
+    return value
 
-from .tic_tac_toe_tf import (
-    train_model,
-)
 
 __all__ = [
+    'Board',
+    'CELLS',
+    'WIN_MASKS',
+    'canonicalize',
+    'canonicalize_move',
+    'inverse_move',
+    'augment',
     'display_start_game',
     'display_board',
     'display_leadersboard',
     'save_model_to_google_drive',
     'load_data_from_google_sheets',
     'update_leadersboard',
+    'get_leadersboard',
     'save_board_to_google_sheets',
+    'flush_board_buffers',
     'get_model_id_by_name',
     'download_model_from_google_drive',
+    'load_numpy_model_from_google_drive',
+    'NumpyModel',
     'train_model',
+    'train_model_incremental',
+    'train_model_on_arrays',
+    'CachedPredictor',
+    'submit_google_io',
+    'wait_google_io',
+    'worksheet_key',
+    'PerfectPlayer',
+    'load_perfect_player',
+    'GameHistory',
+    'get_game_history',
+    'new_game_id',
+    'SHEETS_MIRROR',
+    'NKBoard',
+    'AlphaBetaPlayer',
+    'parse_variant',
+    'MCTSPlayer',
+    'get_metrics',
+    'span',
+    'timed',
+    'session_metrics',
+    'RateLimitedWorksheet',
+    'sheets_queue_depth',
 ]
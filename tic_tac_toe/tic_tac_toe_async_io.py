@@ -0,0 +1,223 @@
+"""
+This module contains the non-blocking I/O layer for the Google services.
+Blocking calls (Sheets writes, leadersboard updates, Drive uploads) are
+handed to an asyncio loop running in a background thread, which runs
+them in a thread pool, so the game continues at once.
+
+- Concurrency is bounded by a semaphore.
+- Calls with the same key (e.g. the same worksheet) run one after
+  another in the order they were submitted.
+- All pending calls are flushed on shutdown.
+
+Each call runs in its own short-lived thread rather than in a
+ThreadPoolExecutor, because executors refuse new work once the
+interpreter starts shutting down, which is exactly when the last
+writes have to be flushed.
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from concurrent.futures import Future
+
+from .tic_tac_toe_metrics import bind_session
+
+
+# Largest number of Google calls running at the same time
+MAX_CONCURRENCY = int(os.environ.get("TIC_TAC_TOE_IO_CONCURRENCY", "4"))
+
+
+class GoogleIO:
+    """
+    Background executor for blocking Google client calls
+    with per-key ordering.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY):
+        self.loop = asyncio.new_event_loop()
+        self.semaphore = None
+        # Key -> the last task submitted with that key
+        self.tails = {}
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.closed = False
+
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run_loop, args=(max_concurrency, ready),
+            name="google-io-loop", daemon=True)
+        self.thread.start()
+        ready.wait()
+
+    def _run_loop(self, max_concurrency, ready):
+        """
+        Run the event loop of the background thread.
+        """
+
+        asyncio.set_event_loop(self.loop)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        ready.set()
+        self.loop.run_forever()
+
+    def _in_thread(self, fn, args, kwargs):
+        """
+        Run a blocking call in a new thread and return an asyncio future
+        of its result.
+        """
+
+        result = self.loop.create_future()
+
+        def set_result(value, error):
+            if error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(value)
+
+        def run():
+            try:
+                value, error = fn(*args, **kwargs), None
+            except Exception as e:
+                value, error = None, e
+            self.loop.call_soon_threadsafe(set_result, value, error)
+
+        threading.Thread(target=run, name="google-io", daemon=True).start()
+        return result
+
+    async def _run(self, previous, fn, args, kwargs):
+        """
+        Wait for the previous call with the same key, then run the call
+        in a worker thread within the concurrency limit.
+        """
+
+        if previous is not None:
+            # Only the order matters, not the result of the previous call
+            await asyncio.wait([previous])
+        async with self.semaphore:
+            return await self._in_thread(fn, args, kwargs)
+
+    def _schedule(self, key, fn, args, kwargs):
+        """
+        Create the task on the loop thread and make it the tail of its key.
+        """
+
+        previous = self.tails.get(key)
+        task = self.loop.create_task(
+            self._run(previous, fn, args, kwargs))
+        self.tails[key] = task
+
+        def forget(done):
+            if self.tails.get(key) is done:
+                del self.tails[key]
+
+        task.add_done_callback(forget)
+        return task
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) in the background after all earlier calls
+        with the same key. Returns a concurrent.futures.Future.
+        """
+
+        # The spans of the call count for the session that submitted it
+        fn = bind_session(fn)
+        with self.lock:
+            closed = self.closed
+            if not closed:
+                self.pending += 1
+        if closed:
+            # After shutdown, fall back to running the call directly
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+        async def schedule():
+            return await self._schedule(key, fn, args, kwargs)
+
+        future = asyncio.run_coroutine_threadsafe(schedule(), self.loop)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        """
+        Count the finished call and report its error, if any.
+        """
+
+        with self.lock:
+            self.pending -= 1
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error in background Google call: {future.exception()}")
+
+    def wait(self, key=None, timeout=None):
+        """
+        Wait until the calls with the key (or all calls) are done.
+        """
+
+        async def tails():
+            if key is None:
+                tasks = list(self.tails.values())
+            else:
+                tasks = [self.tails[key]] if key in self.tails else []
+            if tasks:
+                await asyncio.wait(tasks)
+
+        asyncio.run_coroutine_threadsafe(
+            tails(), self.loop).result(timeout)
+
+    def shutdown(self, timeout=None):
+        """
+        Flush all pending calls and stop the background thread.
+        """
+
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        self.wait(timeout=timeout)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+
+_google_io = None
+_google_io_lock = threading.Lock()
+
+
+def get_google_io():
+    """
+    Return the shared background I/O layer, starting it on first use.
+    """
+
+    global _google_io
+    with _google_io_lock:
+        if _google_io is None:
+            _google_io = GoogleIO()
+            atexit.register(_google_io.shutdown)
+        return _google_io
+
+
+def worksheet_key(worksheet):
+    """
+    Return the ordering key of a worksheet.
+    """
+
+    return f"sheet:{worksheet.id}"
+
+
+def submit_google_io(key, fn, *args, **kwargs):
+    """
+    Run a blocking Google call in the background, in order per key.
+    """
+
+    return get_google_io().submit(key, fn, *args, **kwargs)
+
+
+def wait_google_io(key=None, timeout=None):
+    """
+    Wait for the background calls of a key, or for all of them.
+    """
+
+    if _google_io is not None:
+        _google_io.wait(key, timeout)
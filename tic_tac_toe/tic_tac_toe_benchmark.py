@@ -0,0 +1,508 @@
+"""
+This module contains the tournament and benchmark harness.
+Every pair of agents plays a match of games, each side taking the first
+move in half of them, and the games run in parallel worker processes.
+Every game starts from a random opening, played by both agents with
+either side, so deterministic agents do not replay the same two games.
+The report has win/draw/loss counts with 95% confidence intervals, Elo
+differences and ratings, per-move latency percentiles and games per
+second. It is written as JSON, and can be compared with an earlier
+report to catch regressions in strength or speed before a model is
+published.
+
+Agents are given as SPEC or NAME=SPEC, where SPEC is random, perfect,
+published (the latest published model), mcts (MCTS with the published
+model as the prior) or the path of a .npz or .h5 model file.
+
+Usage:
+    python -m tic_tac_toe.tic_tac_toe_benchmark published \\
+        candidate=candidate.npz perfect random --games 200 \\
+        --output benchmark.json [--baseline previous.json]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from .tic_tac_toe_board import Board
+from .tic_tac_toe_inference import percentile
+
+
+# Worker processes playing the games
+BENCHMARK_WORKERS = int(
+    os.environ.get("TIC_TAC_TOE_BENCHMARK_WORKERS", str(os.cpu_count() or 1)))
+# z value of the 95% confidence intervals
+Z_95 = 1.96
+# Regression limits used with --baseline
+MAX_ELO_DROP = 50.0
+MAX_LATENCY_RATIO = 1.5
+# Random moves played before the agents take over (at most 4, so the
+# opening never ends the game)
+OPENING_MOVES = 2
+
+
+class RandomPlayer:
+    """
+    Agent that plays a random legal move.
+    """
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+
+    def select_move(self, board, player=-1):
+        return self.rng.choice(board.legal_moves())
+
+
+def resolve_agent(spec):
+    """
+    Turn an agent spec into a (kind, model) pair that can be sent to the
+    worker processes. Models are loaded once here, as NumpyModel copies.
+    """
+
+    from .tic_tac_toe_numpy_model import NumpyModel, load_npz
+
+    if spec in ("random", "perfect"):
+        return spec, None
+    if spec in ("published", "mcts"):
+        from .tic_tac_toe_google import (
+            MODEL_NAME, get_model_id_by_name,
+            download_model_from_google_drive,
+            load_numpy_model_from_google_drive)
+        model = load_numpy_model_from_google_drive()
+        if model is None:
+            file_id = get_model_id_by_name(MODEL_NAME)
+            if file_id is not None:
+                model = NumpyModel.from_keras(
+                    download_model_from_google_drive(file_id))
+        if model is None and spec == "published":
+            raise ValueError("No model is published yet.")
+        return ("mcts" if spec == "mcts" else "model"), model
+    if spec.endswith(".npz"):
+        return "model", load_npz(spec)
+    if spec.endswith(".h5"):
+        import tensorflow as tf
+        return "model", NumpyModel.from_keras(
+            tf.keras.models.load_model(spec, compile=False))
+    raise ValueError(f"Unknown agent: {spec}")
+
+
+def build_player(agent, seed, mcts_time):
+    """
+    Build the player of a resolved agent inside a worker process.
+    """
+
+    kind, model = agent
+    if kind == "random":
+        return RandomPlayer(seed)
+    if kind == "perfect":
+        from .tic_tac_toe_perfect import load_perfect_player
+        return load_perfect_player()
+
+    from .tic_tac_toe_predict import CachedPredictor
+
+    # Models are used through the prediction cache, as in the game
+    predictor = CachedPredictor(model) if model is not None else None
+    if kind == "mcts":
+        from .tic_tac_toe_mcts import MCTSPlayer
+        return MCTSPlayer(predictor, time_budget=mcts_time, workers=1,
+                          seed=seed)
+    return predictor
+
+
+def random_opening(rng, moves=OPENING_MOVES):
+    """
+    Return a sequence of random legal moves, X first.
+    """
+
+    board = Board()
+    opening = []
+    for ply in range(moves):
+        move = rng.choice(board.legal_moves())
+        board.make_move(move, 1 if ply % 2 == 0 else -1)
+        opening.append(move)
+    return opening
+
+
+def play_game(players, latencies, opening=()):
+    """
+    Play one game between players[1] (X) and players[-1] (O) from the
+    opening moves and return the winner and all moves of the game.
+    An illegal move loses the game.
+    """
+
+    board = Board()
+    player = 1
+    moves = list(opening)
+    for move in opening:
+        board.make_move(move, player)
+        player = -player
+    while True:
+        start = time.perf_counter()
+        move = players[player].select_move(board, player)
+        latencies[player].append(time.perf_counter() - start)
+        moves.append(move)
+        if not 0 <= move < 9 or not board.is_empty(move):
+            return -player, tuple(moves)
+        board.make_move(move, player)
+        game_over, winner = board.status()
+        if game_over:
+            return winner, tuple(moves)
+        player = -player
+
+
+def play_match(agent_a, agent_b, games, offset, seed, mcts_time,
+               opening_seed=0, opening_moves=OPENING_MOVES):
+    """
+    Play a part of a match in a worker process. Agent A is X in the
+    games with an even number (counted from offset). Games 2k and
+    2k + 1 start from the same random opening.
+    Returns the win/draw/loss counts of A, the move latencies and the
+    set of distinct games played (A's side and the moves).
+    """
+
+    a = build_player(agent_a, seed, mcts_time)
+    b = build_player(agent_b, seed + 1, mcts_time)
+    counts = [0, 0, 0]
+    latencies_a, latencies_b = [], []
+    distinct = set()
+    for game in range(offset, offset + games):
+        opening = random_opening(
+            random.Random(f"{opening_seed}-{game // 2}"), opening_moves)
+        if game % 2 == 0:
+            players = {1: a, -1: b}
+            latencies = {1: latencies_a, -1: latencies_b}
+            a_side = 1
+        else:
+            players = {1: b, -1: a}
+            latencies = {1: latencies_b, -1: latencies_a}
+            a_side = -1
+        winner, moves = play_game(players, latencies, opening)
+        distinct.add((a_side, moves))
+        if winner == a_side:
+            counts[0] += 1
+        elif winner == 0:
+            counts[1] += 1
+        else:
+            counts[2] += 1
+    return counts, latencies_a, latencies_b, distinct
+
+
+def wilson_interval(successes, total, z=Z_95):
+    """
+    Return the Wilson score interval of a proportion.
+    """
+
+    if total == 0:
+        return 0.0, 1.0
+    rate = successes / total
+    denominator = 1 + z * z / total
+    center = (rate + z * z / (2 * total)) / denominator
+    margin = z * math.sqrt(
+        rate * (1 - rate) / total + z * z / (4 * total * total)
+    ) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+def score_interval(wins, draws, losses, samples=None, z=Z_95):
+    """
+    Return the mean score (win 1, draw 0.5, loss 0) and its Wilson
+    interval, with a draw counted as half a success. This is a little
+    wider than needed with draws, but never collapses to one point
+    when a match is one-sided. The interval is taken over samples
+    games (e.g. only the distinct ones), by default all of them.
+    """
+
+    total = wins + draws + losses
+    score = (wins + draws / 2) / total
+    if samples is None:
+        samples = total
+    low, high = wilson_interval(score * samples, samples, z)
+    return score, low, high
+
+
+def rate_interval(count, total, samples, z=Z_95):
+    """
+    Return the Wilson interval of the rate count / total, taken over
+    samples independent games.
+    """
+
+    if not total:
+        return wilson_interval(0, 0, z)
+    return wilson_interval(count / total * samples, samples, z)
+
+
+def elo_difference(score, games):
+    """
+    Return the Elo difference that gives the expected score. Scores of
+    0 and 1 are moved half a game inwards, so the result stays finite.
+    """
+
+    score = min(max(score, 0.5 / games), 1 - 0.5 / games)
+    return -400 * math.log10(1 / score - 1)
+
+
+def elo_ratings(names, matches, iterations=1000):
+    """
+    Fit Bradley-Terry ratings to all matches (draws count as half a
+    win, plus one virtual draw per pair to keep the ratings finite).
+    Ratings are on the Elo scale with a mean of zero.
+    """
+
+    points = {name: 0.0 for name in names}
+    games = {}
+    for match in matches:
+        a, b = match["a"], match["b"]
+        wins, draws, losses = match["wins"], match["draws"], match["losses"]
+        points[a] += wins + draws / 2 + 0.5
+        points[b] += losses + draws / 2 + 0.5
+        games[a, b] = games[b, a] = wins + draws + losses + 1
+
+    strength = {name: 1.0 for name in names}
+    for _ in range(iterations):
+        for name in names:
+            denominator = sum(
+                count / (strength[name] + strength[other])
+                for (player, other), count in games.items()
+                if player == name)
+            if denominator:
+                strength[name] = points[name] / denominator
+    ratings = {
+        name: 400 * math.log10(strength[name]) if strength[name] else 0.0
+        for name in names
+    }
+    mean = sum(ratings.values()) / len(ratings)
+    return {name: round(rating - mean, 1) for name, rating in ratings.items()}
+
+
+def latency_summary(latencies):
+    """
+    Return the move latency percentiles in milliseconds.
+    """
+
+    values = sorted(latencies)
+    return {
+        "moves": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+        "p90_ms": round(percentile(values, 0.90) * 1000, 3),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 3),
+    }
+
+
+def run_tournament(agents, games, workers=BENCHMARK_WORKERS, seed=0,
+                   mcts_time=0.05, opening_moves=OPENING_MOVES):
+    """
+    Play a round robin of matches of the given number of games between
+    the agents (name -> resolved agent) and return the report.
+    A game that is replayed move for move adds no information, so the
+    confidence intervals only count the distinct games of a match.
+    """
+
+    names = list(agents)
+    pairs = list(itertools.combinations(names, 2))
+    chunk = max(1, math.ceil(games / max(1, workers)))
+    tasks = [
+        (a, b, agents[a], agents[b], min(chunk, games - offset), offset,
+         seed + 2 * len(pairs) * offset + 2 * index, mcts_time,
+         seed * len(pairs) + index, opening_moves)
+        for index, (a, b) in enumerate(pairs)
+        for offset in range(0, games, chunk)
+    ]
+
+    start = time.perf_counter()
+    if workers <= 1:
+        results = [play_match(*task[2:]) for task in tasks]
+    else:
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = [pool.submit(play_match, *task[2:]) for task in tasks]
+            results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    totals = {pair: [0, 0, 0] for pair in pairs}
+    distinct = {pair: set() for pair in pairs}
+    latencies = {name: [] for name in names}
+    for task, (counts, latencies_a, latencies_b, games_played) in zip(
+            tasks, results):
+        a, b = task[0], task[1]
+        for i in range(3):
+            totals[a, b][i] += counts[i]
+        distinct[a, b] |= games_played
+        latencies[a].extend(latencies_a)
+        latencies[b].extend(latencies_b)
+
+    matches = []
+    for (a, b), (wins, draws, losses) in totals.items():
+        total = wins + draws + losses
+        samples = len(distinct[a, b])
+        score, score_low, score_high = score_interval(
+            wins, draws, losses, samples)
+        matches.append({
+            "a": a,
+            "b": b,
+            "games": total,
+            "distinct_games": samples,
+            "wins": wins,
+            "draws": draws,
+            "losses": losses,
+            "win_rate_ci": [
+                round(v, 4) for v in rate_interval(wins, total, samples)],
+            "draw_rate_ci": [
+                round(v, 4) for v in rate_interval(draws, total, samples)],
+            "loss_rate_ci": [
+                round(v, 4) for v in rate_interval(losses, total, samples)],
+            "score": round(score, 4),
+            "score_ci": [round(score_low, 4), round(score_high, 4)],
+            "elo_diff": round(elo_difference(score, total), 1),
+            "elo_diff_ci": [
+                round(elo_difference(score_low, samples), 1),
+                round(elo_difference(score_high, samples), 1),
+            ],
+        })
+
+    ratings = elo_ratings(names, matches)
+    total_games = games * len(pairs)
+    return {
+        "config": {
+            "agents": names,
+            "games_per_match": games,
+            "workers": workers,
+            "seed": seed,
+            "mcts_time": mcts_time,
+            "opening_moves": opening_moves,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "games": total_games,
+        "games_per_second": round(total_games / elapsed, 1) if elapsed else 0,
+        "agents": {
+            name: {"elo": ratings[name],
+                   "latency": latency_summary(latencies[name])}
+            for name in names
+        },
+        "matches": matches,
+    }
+
+
+def compare_to_baseline(report, baseline, max_elo_drop=MAX_ELO_DROP,
+                        max_latency_ratio=MAX_LATENCY_RATIO):
+    """
+    Return the regressions of a report against an earlier one: agents
+    whose Elo dropped or whose p99 move latency grew too much.
+    The ratings are centred on the mean of the agent set, so reports
+    of different agent sets or openings are not compared (ValueError).
+    """
+
+    config, previous_config = report["config"], baseline.get("config", {})
+    if sorted(config["agents"]) != sorted(
+            previous_config.get("agents", [])):
+        raise ValueError(
+            f"The baseline was played by other agents "
+            f"({', '.join(previous_config.get('agents', []))}); "
+            f"ratings can only be compared for the same agent set.")
+    if config["opening_moves"] != previous_config.get(
+            "opening_moves", config["opening_moves"]):
+        raise ValueError(
+            "The baseline was played with other openings "
+            f"({previous_config['opening_moves']} moves).")
+
+    regressions = []
+    for name, agent in report["agents"].items():
+        previous = baseline.get("agents", {}).get(name)
+        if previous is None:
+            continue
+        if agent["elo"] < previous["elo"] - max_elo_drop:
+            regressions.append(
+                f"{name}: Elo {agent['elo']} < {previous['elo']} "
+                f"- {max_elo_drop}")
+        p99 = agent["latency"]["p99_ms"]
+        previous_p99 = previous["latency"]["p99_ms"]
+        if previous_p99 and p99 > previous_p99 * max_latency_ratio:
+            regressions.append(
+                f"{name}: p99 latency {p99} ms > {previous_p99} ms "
+                f"x {max_latency_ratio}")
+    return regressions
+
+
+def parse_agents(specs):
+    """
+    Resolve the NAME=SPEC arguments into name -> resolved agent.
+    """
+
+    agents = {}
+    for spec in specs:
+        name, _, value = spec.rpartition("=")
+        name = name or os.path.basename(value)
+        if name in agents:
+            raise ValueError(f"Duplicate agent name: {name}")
+        agents[name] = resolve_agent(value)
+    return agents
+
+
+def main(argv=None):
+    """
+    Command line entry point of the benchmark.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("agents", nargs="+", help="[NAME=]SPEC of an agent")
+    parser.add_argument("--games", type=int, default=200,
+                        help="games per pair of agents")
+    parser.add_argument("--workers", type=int, default=BENCHMARK_WORKERS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mcts-time", type=float, default=0.05,
+                        help="seconds per move of mcts agents")
+    parser.add_argument("--opening-moves", type=int, default=OPENING_MOVES,
+                        choices=range(5), metavar="{0-4}",
+                        help="random moves played before the agents")
+    parser.add_argument("--output", help="JSON report file (default stdout)")
+    parser.add_argument("--baseline", help="earlier JSON report to compare")
+    parser.add_argument("--max-elo-drop", type=float, default=MAX_ELO_DROP)
+    parser.add_argument("--max-latency-ratio", type=float,
+                        default=MAX_LATENCY_RATIO)
+    args = parser.parse_args(argv)
+    if len(args.agents) < 2:
+        parser.error("at least two agents are needed")
+
+    report = run_tournament(
+        parse_agents(args.agents), args.games, args.workers, args.seed,
+        args.mcts_time, args.opening_moves)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+        for match in report["matches"]:
+            print(f"{match['a']} vs {match['b']}: +{match['wins']} "
+                  f"={match['draws']} -{match['losses']} "
+                  f"(Elo {match['elo_diff']:+})")
+        print(f"{report['games']} games, "
+              f"{report['games_per_second']} games/s")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        try:
+            regressions = compare_to_baseline(
+                report, baseline, args.max_elo_drop, args.max_latency_ratio)
+        except ValueError as e:
+            print(f"Baseline not compared: {e}", file=sys.stderr)
+            sys.exit(2)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+This module contains the bitboard representation of the tic-tac-toe board.
+The positions of X and O are kept in two 9-bit integers, so moves, undo,
+legal-move generation and win checks are simple bit operations and
+table lookups without building any lists.
+"""
+
+
+# Number of cells on the board and side length of the board
+CELLS = 9
+SIZE = 3
+
+# Mask with all nine cells set
+FULL_MASK = (1 << CELLS) - 1
+
+# Bit masks of the eight winning lines (bit i is cell i, row by row)
+WIN_MASKS = (
+    # Horizontal
+    0b000000111,
+    0b000111000,
+    0b111000000,
+    # Vertical
+    0b001001001,
+    0b010010010,
+    0b100100100,
+    # Diagonals
+    0b100010001,
+    0b001010100,
+)
+
+# For every possible 9-bit mask: does it contain a full winning line?
+IS_WINNING = tuple(
+    any(mask & line == line for line in WIN_MASKS)
+    for mask in range(1 << CELLS)
+)
+
+# For every possible 9-bit mask of free cells: the list of free cell indexes
+MOVES_FROM_MASK = tuple(
+    tuple(i for i in range(CELLS) if mask >> i & 1)
+    for mask in range(1 << CELLS)
+)
+
+
+class Board:
+    """
+    Tic-tac-toe board stored as two bitmasks: one for the
+    player X (value 1) and one for the player O (value -1).
+    """
+
+    __slots__ = ("x", "o")
+
+    def __init__(self, x=0, o=0):
+        self.x = x
+        self.o = o
+
+    @classmethod
+    def from_list(cls, cells):
+        """
+        Build a board from a flat list of 9 values (1, -1 or 0).
+        """
+
+        x = o = 0
+        for i, cell in enumerate(cells):
+            if cell == 1:
+                x |= 1 << i
+            elif cell == -1:
+                o |= 1 << i
+        return cls(x, o)
+
+    @classmethod
+    def from_string(cls, board_str):
+        """
+        Build a board from a 9 character string of 'X', 'O' and ' '.
+        """
+
+        x = o = 0
+        for i, cell in enumerate(board_str[:CELLS]):
+            if cell == "X":
+                x |= 1 << i
+            elif cell == "O":
+                o |= 1 << i
+        return cls(x, o)
+
+    def copy(self):
+        """
+        Return an independent copy of the board.
+        """
+
+        return Board(self.x, self.o)
+
+    def key(self):
+        """
+        Pack the whole position into one 18-bit integer.
+        """
+
+        return self.x | self.o << CELLS
+
+    def cell(self, index):
+        """
+        Return the value of a cell: 1 for X, -1 for O and 0 if empty.
+        """
+
+        bit = 1 << index
+        if self.x & bit:
+            return 1
+        if self.o & bit:
+            return -1
+        return 0
+
+    def is_empty(self, index):
+        """
+        Check whether the cell with the given index is free.
+        """
+
+        return not (self.x | self.o) >> index & 1
+
+    def make_move(self, index, player):
+        """
+        Put the player's symbol (1 or -1) on the cell with the given index.
+        """
+
+        if player == 1:
+            self.x |= 1 << index
+        else:
+            self.o |= 1 << index
+
+    def unmake_move(self, index):
+        """
+        Clear the cell with the given index.
+        """
+
+        mask = ~(1 << index)
+        self.x &= mask
+        self.o &= mask
+
+    def free_mask(self):
+        """
+        Return the bitmask of empty cells.
+        """
+
+        return ~(self.x | self.o) & FULL_MASK
+
+    def legal_moves(self):
+        """
+        Return the indexes of all empty cells.
+        """
+
+        return MOVES_FROM_MASK[~(self.x | self.o) & FULL_MASK]
+
+    def move_count(self):
+        """
+        Return the number of symbols on the board.
+        """
+
+        return bin(self.x | self.o).count("1")
+
+    def winner(self):
+        """
+        Return 1 if X has a line, -1 if O has a line, otherwise 0.
+        """
+
+        if IS_WINNING[self.x]:
+            return 1
+        if IS_WINNING[self.o]:
+            return -1
+        return 0
+
+    def is_full(self):
+        """
+        Check whether all cells are taken.
+        """
+
+        return self.x | self.o == FULL_MASK
+
+    def status(self):
+        """
+        Return a (game_over, winner) pair: winner is 1 or -1 for a win,
+        0 for a draw and None while the game is still going.
+        """
+
+        if IS_WINNING[self.x]:
+            return True, 1
+        if IS_WINNING[self.o]:
+            return True, -1
+        if self.x | self.o == FULL_MASK:
+            return True, 0
+        return False, None
+
+    def to_list(self):
+        """
+        Return the board as a flat list of 9 values (1, -1 or 0),
+        the format used as the model input.
+        """
+
+        x, o = self.x, self.o
+        return [
+            1 if x >> i & 1 else -1 if o >> i & 1 else 0
+            for i in range(CELLS)
+        ]
+
+    def to_string(self):
+        """
+        Return the board as a 9 character string of 'X', 'O' and ' '.
+        """
+
+        x, o = self.x, self.o
+        return "".join(
+            "X" if x >> i & 1 else "O" if o >> i & 1 else " "
+            for i in range(CELLS)
+        )
+
+    def row(self, index):
+        """
+        Return the values of one row of the board as a list.
+        """
+
+        return [self.cell(index * SIZE + i) for i in range(SIZE)]
+
+    def __eq__(self, other):
+        if not isinstance(other, Board):
+            return NotImplemented
+        return self.x == other.x and self.o == other.o
+
+    def __hash__(self):
+        return self.key()
+
+    def __repr__(self):
+        return f"Board({self.to_string()!r})"
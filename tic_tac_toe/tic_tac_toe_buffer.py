@@ -0,0 +1,195 @@
+"""
+This module contains the write-behind buffer for Google Sheets.
+Rows are collected in memory and sent to the worksheet as one bulk
+append when the game ends, when the buffer is big or old enough, or on
+exit. Rows that cannot be sent are kept in a local spill file and sent
+again by the next flush, so no records are lost. The spill files left
+by ended processes are taken over by the next buffer of the worksheet.
+
+A flush is a single append with no retries of its own. The rate-limited
+worksheet retries it on 429 only: a 5xx answer may come after the rows
+were written, so it is not retried, to avoid duplicate rows. Those rows
+wait in the spill file for the next flush, which in a short CLI session
+may be the one at exit, or the first one of the next process.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+
+# Flush when this many rows are waiting
+MAX_ROWS = int(os.environ.get("TIC_TAC_TOE_BUFFER_ROWS", "50"))
+# Flush when the oldest waiting row is older than this (seconds)
+MAX_AGE = float(os.environ.get("TIC_TAC_TOE_BUFFER_AGE", "30"))
+# Directory for the rows that could not be sent
+SPILL_DIR = os.environ.get("TIC_TAC_TOE_SPILL_DIR", ".sheets_spill")
+
+
+# Tokens of the buffers of this process; a spill file with the PID of
+# this process and another token was left by an earlier process
+LIVE_TOKENS = set()
+
+
+def process_alive(pid):
+    """
+    Check whether a process with the given PID is running.
+    """
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class SheetWriteBuffer:
+    """
+    Buffered writer that appends rows to a worksheet in bulk.
+    Every buffer spills to its own file (<title>.<pid>-<token>.jsonl),
+    so processes sharing the spill directory never overwrite or delete
+    each other's rows.
+    """
+
+    def __init__(self, worksheet, max_rows=MAX_ROWS, max_age=MAX_AGE,
+                 spill_dir=SPILL_DIR):
+        self.worksheet = worksheet
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.spill_dir = spill_dir
+        self.token = uuid.uuid4().hex[:12]
+        LIVE_TOKENS.add(self.token)
+        self.owner = f"{os.getpid()}-{self.token}"
+        self.spill_file = os.path.join(
+            spill_dir, f"{worksheet.title}.{self.owner}.jsonl")
+        self.rows = []
+        self.first_added = None
+        # Spill files taken over from dead processes, kept until their
+        # rows (the first claimed_rows rows) have been sent
+        self.claimed = []
+        self.claimed_rows = 0
+        self.lock = threading.Lock()
+        self._load_spill()
+
+    def _orphaned_spills(self):
+        """
+        Return the spill files of this worksheet whose process has ended.
+        """
+
+        if not os.path.isdir(self.spill_dir):
+            return []
+        pattern = re.compile(
+            re.escape(self.worksheet.title)
+            + r"(?:\.(\d+)-([0-9a-f]+)(?:\.claimed\d+)?)?\.jsonl")
+        orphaned = []
+        for name in sorted(os.listdir(self.spill_dir)):
+            match = pattern.fullmatch(name)
+            if match is None:
+                continue
+            pid, token = match.groups()
+            if pid is not None:
+                pid = int(pid)
+                if pid == os.getpid():
+                    if token in LIVE_TOKENS:
+                        continue
+                elif process_alive(pid):
+                    continue
+            orphaned.append(os.path.join(self.spill_dir, name))
+        return orphaned
+
+    def _load_spill(self):
+        """
+        Take over the rows left in the spill files of ended processes.
+        A file is claimed by renaming it to a name of this buffer, so
+        only one process sends it, and it is deleted once its rows
+        have been sent.
+        """
+
+        for path in self._orphaned_spills():
+            claimed = os.path.join(
+                self.spill_dir,
+                f"{self.worksheet.title}.{self.owner}"
+                f".claimed{len(self.claimed)}.jsonl")
+            try:
+                os.replace(path, claimed)
+            except OSError:
+                continue  # Another process claimed it first
+            with open(claimed, encoding="utf-8") as spill:
+                self.rows.extend(
+                    json.loads(line) for line in spill if line.strip())
+            self.claimed.append(claimed)
+        self.claimed_rows = len(self.rows)
+        if self.rows:
+            self.first_added = time.monotonic()
+
+    def _write_spill(self):
+        """
+        Save the waiting rows that are not in a claimed file to the
+        spill file of this buffer, or remove it when there are none.
+        """
+
+        rows = self.rows[self.claimed_rows:]
+        if not rows:
+            if os.path.exists(self.spill_file):
+                os.remove(self.spill_file)
+            return
+        os.makedirs(self.spill_dir or ".", exist_ok=True)
+        tmp_file = f"{self.spill_file}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as spill:
+            for row in rows:
+                spill.write(json.dumps(row) + "\n")
+        os.replace(tmp_file, self.spill_file)
+
+    def _sent(self):
+        """
+        Forget the rows that have been sent, with their spill files.
+        """
+
+        self.rows = []
+        self.first_added = None
+        self._write_spill()
+        for claimed in self.claimed:
+            if os.path.exists(claimed):
+                os.remove(claimed)
+        self.claimed = []
+        self.claimed_rows = 0
+
+    def add(self, row):
+        """
+        Add one row to the buffer and flush if a threshold is reached.
+        """
+
+        with self.lock:
+            self.rows.append(row)
+            if self.first_added is None:
+                self.first_added = time.monotonic()
+            full = len(self.rows) >= self.max_rows
+            old = time.monotonic() - self.first_added >= self.max_age
+        if full or old:
+            self.flush()
+
+    def flush(self):
+        """
+        Send all waiting rows as one append. Returns True on success.
+        On failure the rows stay in the buffer and in the spill file.
+        """
+
+        with self.lock:
+            if not self.rows:
+                return True
+            try:
+                self.worksheet.append_rows(
+                    self.rows, value_input_option="RAW")
+            except Exception as e:
+                print(f"Error saving data to Google Sheets: {e}")
+                self._write_spill()
+                return False
+            self._sent()
+            return True
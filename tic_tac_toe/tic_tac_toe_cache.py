@@ -0,0 +1,99 @@
+"""
+This module contains the local on-disk cache for the models stored in
+Google Drive. Cached files are keyed by the Drive file ID and the
+md5Checksum (or modifiedTime) of the remote file, so a model is only
+downloaded again when it has changed. Only the last few versions are kept.
+"""
+
+import hashlib
+import os
+import re
+
+
+CACHE_DIR = os.environ.get("TIC_TAC_TOE_MODEL_CACHE", ".model_cache")
+# Number of cached model versions kept on disk
+KEEP_VERSIONS = int(os.environ.get("TIC_TAC_TOE_MODEL_CACHE_KEEP", "3"))
+
+
+def md5_of_file(path):
+    """
+    Returns the md5 hex digest of a file, as reported by Google Drive.
+    """
+
+    digest = hashlib.md5()
+    with open(path, "rb") as cached:
+        for chunk in iter(lambda: cached.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelCache:
+    """
+    Directory of downloaded model files keyed by Drive file ID
+    and content version.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, keep=KEEP_VERSIONS,
+                 suffix=".h5"):
+        self.cache_dir = cache_dir
+        self.keep = keep
+        self.suffix = suffix
+
+    def path_for(self, file_id, checksum=None, modified_time=None):
+        """
+        Returns the cache path of one version of a Drive file.
+        """
+
+        version = checksum or modified_time or "latest"
+        version = re.sub(r"[^0-9A-Za-z]", "", version)
+        return os.path.join(
+            self.cache_dir, f"{file_id}-{version}{self.suffix}")
+
+    def get(self, file_id, checksum=None, modified_time=None):
+        """
+        Returns the path of a valid cached copy or None.
+        A copy whose content does not match the checksum is removed.
+        """
+
+        path = self.path_for(file_id, checksum, modified_time)
+        if not os.path.exists(path):
+            return None
+        if checksum and md5_of_file(path) != checksum:
+            print("Cached model is corrupted, downloading it again.")
+            os.remove(path)
+            return None
+        # Mark the copy as recently used for the eviction order
+        os.utime(path)
+        return path
+
+    def put(self, file_id, data, checksum=None, modified_time=None):
+        """
+        Stores the downloaded bytes of a model and returns their path.
+        """
+
+        if checksum and hashlib.md5(data).hexdigest() != checksum:
+            raise ValueError(
+                f"Downloaded model {file_id} does not match its checksum.")
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.path_for(file_id, checksum, modified_time)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as cached:
+            cached.write(data)
+        os.replace(tmp_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """
+        Removes all but the most recently used cached versions.
+        """
+
+        paths = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(self.suffix)
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.keep:]:
+            os.remove(path)
@@ -0,0 +1,73 @@
+"""
+This module is the terminal front end of the game server.
+It connects to the server socket, sends every line typed by the player
+and prints everything the session writes back. If no server is running,
+it falls back to playing the game in this process with run.py.
+
+Usage:
+    python -m tic_tac_toe.tic_tac_toe_client
+"""
+
+import os
+import socket
+import sys
+import threading
+
+from .tic_tac_toe_server import SOCKET_PATH
+
+
+def send_input(connection):
+    """
+    Forward the player's input lines to the server.
+    """
+
+    try:
+        for line in sys.stdin:
+            connection.sendall(line.encode())
+    except OSError:
+        return  # The server closed the connection
+    try:
+        connection.shutdown(socket.SHUT_WR)
+    except OSError:
+        pass
+
+
+def attach(path=SOCKET_PATH):
+    """
+    Attach the terminal to a session on the game server.
+    Returns False if the server is not reachable.
+    """
+
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(path)
+    except OSError:
+        connection.close()
+        return False
+
+    threading.Thread(
+        target=send_input, args=(connection,), daemon=True).start()
+    with connection:
+        while True:
+            data = connection.recv(4096)
+            if not data:
+                break
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+    return True
+
+
+def main():
+    """
+    Attach to the server, or run the game locally without one.
+    """
+
+    if not attach():
+        run_py = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            "run.py")
+        os.execv(sys.executable, [sys.executable, run_py])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+This module converts the logged game records into NumPy arrays for
+training. Board strings are decoded to an int8 (N, 9) array in one
+vectorized step, and identical (board, move) pairs are merged with their
+counts kept as sample weights.
+"""
+
+import numpy as np
+
+from .tic_tac_toe_board import CELLS
+
+
+# Byte value -> cell value: 'X' is 1, 'O' is -1, anything else is empty
+CELL_VALUES = np.zeros(256, dtype=np.int8)
+CELL_VALUES[ord("X")] = 1
+CELL_VALUES[ord("O")] = -1
+
+
+def boards_to_array(board_strs):
+    """
+    Decode a sequence of 9 character board strings ('X', 'O', ' ')
+    into an int8 array of shape (N, 9).
+    """
+
+    if not len(board_strs):
+        return np.zeros((0, CELLS), dtype=np.int8)
+    raw = "".join(
+        board_str[:CELLS].ljust(CELLS) for board_str in board_strs
+    ).encode("latin-1", "replace")
+    codes = np.frombuffer(raw, dtype=np.uint8).reshape(-1, CELLS)
+    return CELL_VALUES[codes]
+
+
+def array_to_boards(boards):
+    """
+    Encode an (N, 9) array of cell values back into board strings.
+    """
+
+    symbols = np.array([ord(" "), ord("X"), ord("O")], dtype=np.uint8)
+    codes = symbols[np.asarray(boards, dtype=np.int8) % 3]
+    raw = codes.tobytes().decode("latin-1")
+    return [raw[i:i + CELLS] for i in range(0, len(raw), CELLS)]
+
+
+def rows_to_arrays(rows):
+    """
+    Convert worksheet rows of (board string, move) into an int8 board
+    array of shape (N, 9) and an int8 move array of shape (N,).
+    Rows without a board or a move are skipped.
+    """
+
+    rows = [row for row in rows if len(row) >= 2 and row[0] and row[1] != ""]
+    boards = boards_to_array([row[0] for row in rows])
+    moves = np.array([row[1] for row in rows], dtype=np.int64)
+    return boards, moves.astype(np.int8)
+
+
+def deduplicate(boards, moves):
+    """
+    Merge identical (board, move) pairs. Returns the unique boards,
+    the moves and the number of times each pair was seen, which is
+    used as the sample weight.
+    """
+
+    if not len(boards):
+        return boards, moves, np.zeros(0, dtype=np.float32)
+    pairs = np.concatenate(
+        [boards, moves.reshape(-1, 1).astype(np.int8)], axis=1)
+    unique_pairs, counts = np.unique(pairs, axis=0, return_counts=True)
+    return (
+        unique_pairs[:, :CELLS],
+        unique_pairs[:, CELLS],
+        counts.astype(np.float32),
+    )
@@ -0,0 +1,503 @@
+"""
+This module contains the generalized game engine for N×N boards with
+K in a row (4×4, 5×5 with 4 in a row, 15×15 gomoku, ...), where the
+3×3 lookup tables and brute-force solving no longer work.
+
+- Every line segment of K cells ("window") keeps the number of X and O
+  stones in it. A move only updates the windows through its cell, which
+  gives incremental win detection around the last move and an
+  incremental evaluation of the position.
+- The AI is an iterative-deepening alpha-beta (negamax) search with a
+  Zobrist-hashed transposition table and move ordering (table move,
+  killer moves, history and the evaluation gain of each move). It always
+  answers within its per-move time budget with the best move of the
+  deepest finished iteration.
+"""
+
+import os
+import random
+import re
+import time
+from functools import lru_cache
+
+
+# Seconds the AI may think about one move
+MOVE_TIME = float(os.environ.get("TIC_TAC_TOE_MOVE_TIME", "1.0"))
+# Largest number of transposition table entries kept
+TT_MAX_ENTRIES = int(os.environ.get("TIC_TAC_TOE_TT_SIZE", "1000000"))
+
+# Directions of the lines: row, column, diagonal, anti-diagonal
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+# Score of a won game; faster wins score higher
+WIN_SCORE = 1000000
+INFINITY = 10 * WIN_SCORE
+
+# Transposition table entry types
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Boards larger than this only consider cells near the stones
+NEAR_ONLY_CELLS = 25
+NEAR_DISTANCE = 2
+
+# The time is checked once every this many nodes
+TIME_CHECK_NODES = 64
+
+
+def parse_variant(variant):
+    """
+    Parse a variant like "3x3", "4x4", "5x5k4" or "15x15k5" into
+    (size, k). Without k, the whole row has to be filled (k = size),
+    but never more than 5 in a row.
+    """
+
+    match = re.fullmatch(r"(\d+)x(\d+)(?:k(\d+))?", variant.strip().lower())
+    if match is None or match.group(1) != match.group(2):
+        raise ValueError(f"Unknown board variant: {variant}")
+    size = int(match.group(1))
+    k = int(match.group(3)) if match.group(3) else min(size, 5)
+    if not 1 <= k <= size:
+        raise ValueError(f"K must be between 1 and {size}: {variant}")
+    return size, k
+
+
+class Rules:
+    """
+    Precomputed tables of one N×N, K-in-a-row variant.
+    """
+
+    def __init__(self, size, k):
+        self.size = size
+        self.k = k
+        self.cells = size * size
+
+        # Every window of k cells in a line
+        self.windows = []
+        for row in range(size):
+            for column in range(size):
+                for d_row, d_column in DIRECTIONS:
+                    end_row = row + d_row * (k - 1)
+                    end_column = column + d_column * (k - 1)
+                    if 0 <= end_row < size and 0 <= end_column < size:
+                        self.windows.append(tuple(
+                            (row + d_row * i) * size + column + d_column * i
+                            for i in range(k)))
+        # Cell -> indexes of the windows through it
+        self.cell_windows = [[] for _ in range(self.cells)]
+        for index, window in enumerate(self.windows):
+            for cell in window:
+                self.cell_windows[cell].append(index)
+
+        # Evaluation of a window with n stones of one player only,
+        # and of a window with (X stones, O stones) for X
+        self.weights = [0] + [10 ** n for n in range(1, k)] + [0]
+        self.values = [
+            [
+                0 if x and o else self.weights[x] - self.weights[o]
+                for o in range(k + 1)
+            ]
+            for x in range(k + 1)
+        ]
+
+        # Cell -> cells within NEAR_DISTANCE, for the move generation
+        self.near = [
+            [
+                r * size + c
+                for r in range(max(0, row - NEAR_DISTANCE),
+                               min(size, row + NEAR_DISTANCE + 1))
+                for c in range(max(0, column - NEAR_DISTANCE),
+                               min(size, column + NEAR_DISTANCE + 1))
+            ]
+            for row in range(size) for column in range(size)
+        ]
+        # Cells ordered from the centre outwards
+        center = (size - 1) / 2
+        self.center_order = sorted(
+            range(self.cells),
+            key=lambda cell: abs(cell // size - center)
+            + abs(cell % size - center))
+
+        # Zobrist keys of X and O on every cell (fixed seed, so the
+        # hashes are the same in every process)
+        generator = random.Random(size * 1000 + k)
+        self.zobrist = [
+            (generator.getrandbits(64), generator.getrandbits(64))
+            for _ in range(self.cells)
+        ]
+        # Added to the hash when O is to move
+        self.side_key = generator.getrandbits(64)
+
+
+@lru_cache(maxsize=None)
+def get_rules(size, k):
+    """
+    Return the shared tables of a variant.
+    """
+
+    return Rules(size, k)
+
+
+class NKBoard:
+    """
+    N×N board with K in a row. It has the same interface as the 3×3
+    Board used by the game (is_empty, make_move, status, row, ...).
+    """
+
+    def __init__(self, size=3, k=3):
+        self.rules = get_rules(size, k)
+        self.size = size
+        self.k = k
+        self.cells = [0] * self.rules.cells
+        # Stones of X and O in every window
+        self.x_counts = [0] * len(self.rules.windows)
+        self.o_counts = [0] * len(self.rules.windows)
+        self.hash = 0
+        # Evaluation from the point of view of X
+        self.score = 0
+        self.winner_ = 0
+        self.stack = []
+
+    def copy(self):
+        """
+        Return an independent copy of the board.
+        """
+
+        board = NKBoard.__new__(NKBoard)
+        board.rules = self.rules
+        board.size = self.size
+        board.k = self.k
+        board.cells = self.cells[:]
+        board.x_counts = self.x_counts[:]
+        board.o_counts = self.o_counts[:]
+        board.hash = self.hash
+        board.score = self.score
+        board.winner_ = self.winner_
+        board.stack = self.stack[:]
+        return board
+
+    def make_move(self, index, player):
+        """
+        Put the player's symbol (1 or -1) on the cell with the given index.
+        Only the windows through the cell are updated.
+        """
+
+        x_counts, o_counts = self.x_counts, self.o_counts
+        counts = x_counts if player == 1 else o_counts
+        values = self.rules.values
+        score = self.score
+        for window in self.rules.cell_windows[index]:
+            score -= values[x_counts[window]][o_counts[window]]
+            counts[window] += 1
+            if counts[window] == self.k:
+                self.winner_ = player
+            score += values[x_counts[window]][o_counts[window]]
+        self.score = score
+        self.cells[index] = player
+        self.hash ^= self.rules.zobrist[index][0 if player == 1 else 1]
+        self.stack.append(index)
+
+    def unmake_move(self, index=None):
+        """
+        Take back the last move.
+        """
+
+        index = self.stack.pop()
+        player = self.cells[index]
+        x_counts, o_counts = self.x_counts, self.o_counts
+        counts = x_counts if player == 1 else o_counts
+        values = self.rules.values
+        score = self.score
+        for window in self.rules.cell_windows[index]:
+            score -= values[x_counts[window]][o_counts[window]]
+            counts[window] -= 1
+            score += values[x_counts[window]][o_counts[window]]
+        self.score = score
+        self.cells[index] = 0
+        self.hash ^= self.rules.zobrist[index][0 if player == 1 else 1]
+        # The game was still going before the move
+        self.winner_ = 0
+
+    def move_gain(self, index, player):
+        """
+        Return how much a move changes the evaluation for the player,
+        counting both its own lines and the opponent lines it blocks.
+        """
+
+        own, other = (
+            (self.x_counts, self.o_counts) if player == 1
+            else (self.o_counts, self.x_counts))
+        weights = self.rules.weights
+        gain = 0
+        for window in self.rules.cell_windows[index]:
+            if other[window] == 0:
+                # Extends an open line (a win is the best gain)
+                gain += (INFINITY if own[window] + 1 == self.k
+                         else weights[own[window] + 1] - weights[own[window]])
+            elif own[window] == 0:
+                # Blocks an opponent line
+                gain += weights[other[window]] * 2
+        return gain
+
+    def is_empty(self, index):
+        return self.cells[index] == 0
+
+    def legal_moves(self):
+        """
+        Return the indexes of all empty cells.
+        """
+
+        return [i for i, cell in enumerate(self.cells) if cell == 0]
+
+    def candidate_moves(self):
+        """
+        Return the moves worth searching: all empty cells on small
+        boards, otherwise only the empty cells near the stones.
+        """
+
+        if self.rules.cells <= NEAR_ONLY_CELLS:
+            return self.legal_moves()
+        if not self.stack:
+            return [self.rules.center_order[0]]
+        near = set()
+        for index in self.stack:
+            near.update(self.rules.near[index])
+        return [index for index in near if self.cells[index] == 0]
+
+    def move_count(self):
+        return len(self.stack)
+
+    def winner(self):
+        """
+        Return 1 if X has K in a row, -1 if O has, otherwise 0.
+        """
+
+        return self.winner_
+
+    def is_full(self):
+        return len(self.stack) == self.rules.cells
+
+    def status(self):
+        """
+        Return (game_over, winner) of the board.
+        """
+
+        if self.winner_:
+            return True, self.winner_
+        return self.is_full(), 0
+
+    def row(self, i):
+        """
+        Return the values of one row.
+        """
+
+        return self.cells[i * self.size:(i + 1) * self.size]
+
+    def to_list(self):
+        return self.cells[:]
+
+    def __repr__(self):
+        return f"NKBoard(size={self.size}, k={self.k}, moves={self.stack})"
+
+
+def to_table(value, ply):
+    """
+    Store win and loss scores as distances from the node, not the root,
+    so a table entry is valid wherever the position is found again.
+    """
+
+    if value > WIN_SCORE // 2:
+        return value + ply
+    if value < -WIN_SCORE // 2:
+        return value - ply
+    return value
+
+
+def from_table(value, ply):
+    """
+    Turn a stored win or loss score back into a distance from the root.
+    """
+
+    if value > WIN_SCORE // 2:
+        return value - ply
+    if value < -WIN_SCORE // 2:
+        return value + ply
+    return value
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the time budget is used up.
+    """
+
+
+class AlphaBetaPlayer:
+    """
+    AI backend for NKBoard: iterative-deepening alpha-beta search with
+    a transposition table, kept between moves.
+    """
+
+    def __init__(self, time_budget=MOVE_TIME, max_depth=None):
+        self.time_budget = time_budget
+        self.max_depth = max_depth
+        # Zobrist hash -> (depth, value, entry type, best move)
+        self.table = {}
+        # Move -> history score of cutoffs it caused
+        self.history = {}
+        self.killers = {}
+        self.nodes = 0
+        self.deadline = 0.0
+        # Statistics of the last search
+        self.last_depth = 0
+        self.last_nodes = 0
+
+    def select_move(self, board, player=-1):
+        """
+        Return the best move found within the time budget.
+        """
+
+        moves = board.candidate_moves()
+        if not moves:
+            raise ValueError(f"No move available for {board!r}")
+        ordered = self._ordered(board, moves, player, None, 0)
+        best_move = ordered[0]
+        if len(moves) == 1:
+            return best_move
+
+        if len(self.table) > TT_MAX_ENTRIES:
+            self.table.clear()
+        self.killers.clear()
+        self.nodes = 0
+        self.deadline = time.perf_counter() + self.time_budget
+        root_moves = len(board.stack)
+        max_depth = self.max_depth or (board.rules.cells - root_moves)
+
+        self.last_depth = 0
+        for depth in range(1, max_depth + 1):
+            try:
+                value, move = self._root(board, player, depth)
+            except SearchTimeout:
+                # Take back the moves of the unfinished iteration
+                while len(board.stack) > root_moves:
+                    board.unmake_move()
+                break
+            best_move = move
+            self.last_depth = depth
+            if abs(value) >= WIN_SCORE - board.rules.cells:
+                break  # A forced win or loss was found
+        self.last_nodes = self.nodes
+        return best_move
+
+    def _root(self, board, player, depth):
+        """
+        Search all root moves to the given depth.
+        Returns (value, best move).
+        """
+
+        key = self._key(board, player)
+        entry = self.table.get(key)
+        table_move = entry[3] if entry else None
+        moves = self._ordered(
+            board, board.candidate_moves(), player, table_move, 0)
+        alpha, best_move = -INFINITY, moves[0]
+        for move in moves:
+            board.make_move(move, player)
+            value = -self._negamax(board, -player, depth - 1,
+                                   -INFINITY, -alpha, 1)
+            board.unmake_move()
+            if value > alpha:
+                alpha, best_move = value, move
+        self.table[key] = (depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+    def _key(self, board, player):
+        """
+        Return the table key of the position with the player to move.
+        """
+
+        if player == -1:
+            return board.hash ^ board.rules.side_key
+        return board.hash
+
+    def _ordered(self, board, moves, player, table_move, ply):
+        """
+        Order the moves: the table move, killer moves, then by
+        history score and evaluation gain.
+        """
+
+        killers = self.killers.get(ply, ())
+        history = self.history
+
+        def priority(move):
+            if move == table_move:
+                return INFINITY * 4
+            if move in killers:
+                return INFINITY * 2
+            return history.get(move, 0) + board.move_gain(move, player)
+
+        return sorted(moves, key=priority, reverse=True)
+
+    def _negamax(self, board, player, depth, alpha, beta, ply):
+        """
+        Return the value of the position for the player to move.
+        """
+
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_NODES == 0 and (
+                time.perf_counter() > self.deadline):
+            raise SearchTimeout()
+
+        if board.winner_:
+            # The previous move won; later losses are better
+            return -(WIN_SCORE - ply)
+        if board.is_full():
+            return 0
+        if depth == 0:
+            return player * board.score
+
+        original_alpha = alpha
+        key = self._key(board, player)
+        entry = self.table.get(key)
+        table_move = None
+        if entry is not None:
+            entry_depth, entry_value, entry_type, table_move = entry
+            entry_value = from_table(entry_value, ply)
+            if entry_depth >= depth:
+                if entry_type == EXACT:
+                    return entry_value
+                if entry_type == LOWER:
+                    alpha = max(alpha, entry_value)
+                else:
+                    beta = min(beta, entry_value)
+                if alpha >= beta:
+                    return entry_value
+
+        best_value, best_move = -INFINITY, None
+        moves = self._ordered(
+            board, board.candidate_moves(), player, table_move, ply)
+        for move in moves:
+            board.make_move(move, player)
+            value = -self._negamax(
+                board, -player, depth - 1, -beta, -alpha, ply + 1)
+            board.unmake_move()
+            if value > best_value:
+                best_value, best_move = value, move
+            if value > alpha:
+                alpha = value
+            if alpha >= beta:
+                # Remember the move that caused the cutoff
+                killers = self.killers.setdefault(ply, [])
+                if move not in killers:
+                    killers.insert(0, move)
+                    del killers[2:]
+                self.history[move] = self.history.get(move, 0) + depth * depth
+                break
+
+        if best_value <= original_alpha:
+            entry_type = UPPER
+        elif best_value >= beta:
+            entry_type = LOWER
+        else:
+            entry_type = EXACT
+        self.table[key] = (
+            depth, to_table(best_value, ply), entry_type, best_move)
+        return best_value
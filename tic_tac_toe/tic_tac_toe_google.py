@@ -3,47 +3,76 @@ This module handles interactions with Google services such
 as Google Sheets and Google Drive.
 It includes functions to load and save game data, manage the leaderboard,
 and handle model storage and retrieval.
+The calls go through the storage backend of tic_tac_toe_storage.py,
+so the same functions also work on the local SQLite/directory backend.
 """
 
 
 # work with warnings
 import warnings
-# Google Sheet
-import gspread
-from google.oauth2.service_account import Credentials
 # work with filesystem
 import os
-# AI model
-import tensorflow as tf
-# Google Drive
-from googleapiclient.discovery import build
 import io
-from googleapiclient.http import MediaIoBaseUpload
-from googleapiclient.http import MediaIoBaseDownload
-import h5py
+# Content hash of the model weights
+import hashlib
+# Exit hook for the buffered writes
+import atexit
+# Clients are created once, on first use
+from functools import lru_cache
+# Sessions of the game server share the buffers and leadersboards
+import threading
+
+from .tic_tac_toe_buffer import SheetWriteBuffer
+from .tic_tac_toe_leadersboard import LeadersboardService
+from .tic_tac_toe_cache import ModelCache
+from .tic_tac_toe_symmetry import canonicalize_move
+# Timing of the hot calls and counting of the API calls
+from .tic_tac_toe_metrics import InstrumentedClient, span, timed
+# Quota-aware wrapper shared by all sessions
+from .tic_tac_toe_ratelimit import rate_limited
+# Google (or local) backend of the sheets and the model files
+from .tic_tac_toe_storage import get_service, get_storage
 
 # Suppress all UserWarnings
 warnings.filterwarnings("ignore", category=UserWarning)
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "2"
 
-print(f"use tensorflow version {tf.__version__}")
 
-SERVICE_ACCOUNT_FILE = "creds.json"
-SCOPES = [
-    "https://www.googleapis.com/auth/drive",
-    "https://www.googleapis.com/auth/spreadsheets",
-    "https://www.googleapis.com/auth/drive.file",
-]
+@lru_cache(maxsize=None)
+def get_tensorflow():
+    """
+    Imports TensorFlow on first use, only for sessions that load
+    or save a Keras model.
+    """
 
-CREDENTIALS = Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+    import tensorflow as tf
+    print(f"use tensorflow version {tf.__version__}")
+    return tf
 
-# Authorize the credentials and create a client using gspread.
-CLIENT = gspread.authorize(CREDENTIALS)
 
-SERVICE = build("drive", "v3", credentials=CREDENTIALS)
 MODEL_NAME = "tic_tac_toe_model.h5"
+# Weights-only copy of the model, loaded for inference without TensorFlow
+MODEL_NPZ_NAME = "tic_tac_toe_model.npz"
+# Precision of the weights-only copy: float32 or float16
+MODEL_NPZ_DTYPE = os.environ.get("TIC_TAC_TOE_MODEL_DTYPE", "float32")
+# Drive metadata used to validate the local model cache
+MODEL_FIELDS = "id, name, md5Checksum, modifiedTime, appProperties"
+
+# Number of model versions (Drive revisions) kept
+MODEL_KEEP_VERSIONS = int(
+    os.environ.get("TIC_TAC_TOE_MODEL_REVISIONS", "3"))
+
+# Metadata of the models found by get_model_id_by_name, by file ID
+MODEL_METADATA = {}
+MODEL_CACHE = ModelCache()
+NPZ_CACHE = ModelCache(suffix=".npz")
+
+# Write-behind buffers for the boards, one per worksheet
+BOARD_BUFFERS = {}
+# In-memory leadersboards, one per worksheet
+LEADERSBOARDS = {}
+REGISTRY_LOCK = threading.Lock()
 
 
 def share_file_with_user(file_id, user_email):
@@ -57,18 +86,120 @@ def share_file_with_user(file_id, user_email):
         "role": "writer",
         "emailAddress": user_email}
 
-    SERVICE.permissions().create(
+    get_service().permissions().create(
         fileId=file_id,
         body=user_permission,
         fields="id",
     ).execute()
 
 
+def weights_hash(model):
+    """
+    Returns a hash of the model weights. Unlike the bytes of the h5 file,
+    it only changes when the weights change.
+    """
+
+    digest = hashlib.sha256()
+    for weights in model.get_weights():
+        digest.update(str(weights.shape).encode())
+        digest.update(weights.tobytes())
+    return digest.hexdigest()
+
+
+def model_version(metadata):
+    """
+    Returns the version number stored with a model file (0 if none).
+    """
+
+    app_properties = metadata.get("appProperties") or {}
+    return int(app_properties.get("version", 0))
+
+
+def newest_model(items):
+    """
+    Returns the metadata of the newest model: the highest version,
+    then the latest modification, then the file ID.
+    """
+
+    if not items:
+        return None
+    return max(
+        items,
+        key=lambda item: (
+            model_version(item), item.get("modifiedTime", ""), item["id"]),
+    )
+
+
+def get_published_model(name=MODEL_NAME):
+    """
+    Returns the metadata of the newest published version of a model
+    file, or None if there is none.
+    """
+
+    items = get_storage().find_files(name, MODEL_FIELDS)
+    for item in items:
+        MODEL_METADATA[item["id"]] = item
+    return newest_model(items)
+
+
+def upload_model_file(name, data, version, app_properties):
+    """
+    Uploads one file of the model as the given version: updates the
+    newest file with this name in place (pruning its old revisions),
+    or creates it, and deletes the other files with the same name.
+    """
+
+    storage = get_storage()
+    items = storage.find_files(name, MODEL_FIELDS)
+    current = newest_model(items)
+
+    # Set metadata for a file that will be uploaded to Google Drive
+    file_metadata = {
+        "name": name,
+        "mimeType": "application/octet-stream",  # MIME type for model files
+        # Adding a Folder ID (TicTacToe folder)
+        "parents": "1MgctFDUGBgx2E-ZZac9V71MFAKj-cTqD",
+        "appProperties": dict(app_properties, version=str(version)),
+    }
+
+    # Uploading a file to Google Drive, or a new revision of it
+    if current is None:
+        file_id = storage.upload_file(file_metadata, data)
+    else:
+        file_id = storage.update_file(current["id"], file_metadata, data)
+        storage.prune_revisions(file_id, MODEL_KEEP_VERSIONS)
+
+    # Files with the same name are older copies of the model
+    for item in items:
+        if item["id"] != file_id:
+            storage.delete_file(item["id"])
+            MODEL_METADATA.pop(item["id"], None)
+    # The checksum of the file has changed
+    MODEL_METADATA.pop(file_id, None)
+
+    print(f"Model {name} ID: {file_id} success updated (version {version})")
+    return file_id
+
+
+@timed("save_model")
 def save_model_to_google_drive(model):
     """
-    Serializes and uploads a Keras model to Google Drive in HDF5 format.
+    Serializes and uploads a Keras model to Google Drive in HDF5 format,
+    together with its compact weights-only .npz copy for inference.
+    Nothing is uploaded if the weights have not changed. Otherwise the
+    model files are updated in place with the next version number, and
+    old revisions and duplicate files are pruned.
     """
 
+    content_hash = weights_hash(model)
+    if content_hash == getattr(model, "weights_hash", None):
+        print(f"Model {MODEL_NAME} is unchanged, upload skipped.")
+        return
+
+    import h5py
+    from .tic_tac_toe_numpy_model import model_to_npz_bytes
+    tf = get_tensorflow()
+
     # Serializing a Keras model in h5 format into memory
     model_buffer = io.BytesIO()
 
@@ -77,72 +208,116 @@ def save_model_to_google_drive(model):
         tf.keras.models.save_model(model, h5file)
     model_buffer.seek(0)  # Move the pointer to the beginning of the stream
 
-    # Set metadata for a file that will be uploaded to Google Drive
-    file_metadata = {
-        "name": MODEL_NAME,
-        "mimeType": "application/octet-stream",  # MIME type for .h5 file
-        # Adding a Folder ID (TicTacToe folder)
-        "parents": "1MgctFDUGBgx2E-ZZac9V71MFAKj-cTqD",
+    # The version follows the newest model on Drive
+    current = newest_model(
+        get_storage().find_files(MODEL_NAME, MODEL_FIELDS))
+    version = model_version(current) + 1 if current else 1
+    app_properties = {
+        # Last history move (ID or sheet row) the model is trained on
+        "watermark": str(getattr(model, "training_watermark", 0)),
+        "watermark_cursor": getattr(model, "training_cursor", "id"),
+        "weights_hash": content_hash,
     }
 
-    # Preparing a streaming download
-    media = MediaIoBaseUpload(
-        model_buffer, mimetype="application/octet-stream", resumable=True
-    )
+    # The weights-only copy is written first, so a loader never sees
+    # an h5 version without its .npz
+    upload_model_file(
+        MODEL_NPZ_NAME, model_to_npz_bytes(model, MODEL_NPZ_DTYPE),
+        version, app_properties)
+    upload_model_file(
+        MODEL_NAME, model_buffer.getvalue(), version, app_properties)
 
-    # Uploading a file to Google Drive
-    file = (
-        SERVICE.files()
-        .create(body=file_metadata, media_body=media, fields="id")
-        .execute()
-    )
-
-    print(f'Model {MODEL_NAME} ID: {file.get("id")} success updated')
+    model.weights_hash = content_hash
+    model.model_version = version
     print()
 
 
-def get_model_id_by_name():
+def get_model_id_by_name(name=MODEL_NAME):
     """
-    Retrieves the file ID of a Keras model stored in Google Drive by its name.
+    Retrieves the file ID of the newest version of a model file
+    stored in Google Drive by its name.
     """
 
-    results = (
-        SERVICE.files()
-        .list(q=f"name='{MODEL_NAME}'", pageSize=10, fields="files(id, name)")
-        .execute()
-    )
-    items = results.get("files", [])
+    items = get_storage().find_files(name, MODEL_FIELDS)
+    # Remember the checksums, so the download can use the local cache
+    for item in items:
+        MODEL_METADATA[item["id"]] = item
 
     if not items:
-        print(f"No files with name {MODEL_NAME} found.")
+        print(f"No files with name {name} found.")
         return None
     else:
         # If several files with the same name are found,
-        # we return the ID of the first
-        model_id = items[0]["id"]
+        # we return the ID of the newest version
+        model_id = newest_model(items)["id"]
         print()
-        print(f"Found model {MODEL_NAME} with ID: {model_id}")
+        print(f"Found model {name} with ID: {model_id}")
         return model_id
 
 
+def get_model_file(file_id, cache):
+    """
+    Returns the metadata of a model file and the path of its local copy,
+    downloading it only when the cache has no copy with the same
+    md5Checksum.
+    """
+
+    storage = get_storage()
+    metadata = MODEL_METADATA.get(file_id)
+    if metadata is None:
+        metadata = storage.get_file_metadata(file_id, MODEL_FIELDS)
+        MODEL_METADATA[file_id] = metadata
+    checksum = metadata.get("md5Checksum")
+    modified_time = metadata.get("modifiedTime")
+
+    model_path = cache.get(file_id, checksum, modified_time)
+    if model_path is None:
+        with span("model_download"):
+            data = storage.download_file(file_id)
+        model_path = cache.put(file_id, data, checksum, modified_time)
+    else:
+        print("Model loaded from the local cache.")
+    return metadata, model_path
+
+
+def load_numpy_model_from_google_drive():
+    """
+    Loads the newest weights-only copy of the model for inference.
+    TensorFlow is not imported. Returns None if there is no copy.
+    """
+
+    from .tic_tac_toe_numpy_model import load_npz
+
+    file_id = get_model_id_by_name(MODEL_NPZ_NAME)
+    if file_id is None:
+        return None
+    metadata, model_path = get_model_file(file_id, NPZ_CACHE)
+    model = load_npz(model_path)
+
+    # Restore the training watermark and the version saved with the model
+    app_properties = metadata.get("appProperties") or {}
+    model.training_watermark = int(app_properties.get("watermark", 0))
+    model.training_cursor = app_properties.get("watermark_cursor", "id")
+    model.model_version = model_version(metadata)
+    model.weights_hash = app_properties.get("weights_hash")
+    return model
+
+
 def download_model_from_google_drive(file_id):
     """
     Downloads a Keras model from Google Drive using its
     file ID and compiles it.
+    The file is only downloaded when the local cache has no copy
+    with the same md5Checksum.
     """
 
-    request = SERVICE.files().get_media(fileId=file_id)
-    fh = io.BytesIO()
-    downloader = MediaIoBaseDownload(fh, request)
-    done = False
-    while done is False:
-        status, done = downloader.next_chunk()
-        print("Download %d%%." % int(status.progress() * 100))
-    fh.seek(0)
+    import h5py
+    tf = get_tensorflow()
 
-    # Load the Keras model from the h5py File object that
-    # is created from the buffer
-    with h5py.File(fh, "r") as h5file:
+    metadata, model_path = get_model_file(file_id, MODEL_CACHE)
+
+    # Load the Keras model from the h5py File object of the cached copy
+    with h5py.File(model_path, "r") as h5file:
         model = tf.keras.models.load_model(h5file, compile=False)
 
         # Compiling the model specifying the optimizer,
@@ -153,6 +328,14 @@ def download_model_from_google_drive(file_id):
             metrics=["accuracy"],  # Metrics to track
         )
 
+    # Restore the training watermark and the version saved with the model
+    app_properties = metadata.get("appProperties") or {}
+    model.training_watermark = int(app_properties.get("watermark", 0))
+    model.training_cursor = app_properties.get("watermark_cursor", "id")
+    model.model_version = model_version(metadata)
+    # An unchanged model is not uploaded again
+    model.weights_hash = weights_hash(model)
+
     return model
 
 
@@ -163,95 +346,86 @@ def load_data_from_google_sheets():
 
     # Try to open the spreadsheet and the worksheets within it.
     try:
-        sheet = CLIENT.open("tic_tac_toe")
-        leadersboard_data_sheet = sheet.worksheet("leadersboard")
-        tic_tac_toe_data_sheet = sheet.worksheet("tic_tac_toe_data_sheet")
-    except gspread.exceptions.SpreadsheetNotFound:
-        print("The spreadsheet 'tic_tac_toe' was not found.")
-        return None, None, None
-    except gspread.exceptions.WorksheetNotFound:
-        print("A required worksheet was not found in the spreadsheet.")
-        return None, None, None
+        sheet = get_storage().open_spreadsheet("tic_tac_toe")
+        # The worksheets are rate-limited, and every call sent to the
+        # API is counted and timed
+        leadersboard_data_sheet = rate_limited(InstrumentedClient(
+            sheet.worksheet("leadersboard"), "sheets"))
+        tic_tac_toe_data_sheet = rate_limited(InstrumentedClient(
+            sheet.worksheet("tic_tac_toe_data_sheet"), "sheets"))
     except Exception as e:
-        print(f"An error occurred while opening the spreadsheet: {e}")
-        return None, None, None
+        # gspread is only imported by the Google backend, so its
+        # errors are told apart by name
+        error = type(e).__name__
+        if error == "SpreadsheetNotFound":
+            print("The spreadsheet 'tic_tac_toe' was not found.")
+        elif error == "WorksheetNotFound":
+            print("A required worksheet was not found in the spreadsheet.")
+        else:
+            print(f"An error occurred while opening the spreadsheet: {e}")
+        return None, None
 
     return leadersboard_data_sheet, tic_tac_toe_data_sheet
 
 
+def get_leadersboard(leadersboard_data_sheet):
+    """
+    Returns the in-memory leadersboard of a worksheet,
+    reading the sheet on first use.
+    """
+
+    with REGISTRY_LOCK:
+        leadersboard = LEADERSBOARDS.get(leadersboard_data_sheet.id)
+        if leadersboard is None:
+            leadersboard = LeadersboardService(leadersboard_data_sheet)
+            LEADERSBOARDS[leadersboard_data_sheet.id] = leadersboard
+    return leadersboard
+
+
+@timed("update_leadersboard")
 def update_leadersboard(leadersboard_data_sheet, nickname, result):
     """
     Updates or adds a player's result to the leadersboard in a Google Sheet.
+    The whole result is written with a single round-trip.
     """
 
-    # Fetching the current data from the sheet
-    leadersboard_data = leadersboard_data_sheet.get_all_values()
-    headers = leadersboard_data[0]  # Assuming the first row contains headers
-
-    # Find the indexes for the relevant columns
-    nickname_index = (
-        headers.index("human_nickname") + 1
-    )  # +1 for Google Sheets indexing
-    total_index = headers.index("total_games") + 1
-    win_index = headers.index("win_human") + 1
-    lose_index = headers.index("win_ai") + 1
-    draws_index = headers.index("draws") + 1
-
-    # Find the player in the leaderboard
-    player_row = None
-    for i, row in enumerate(
-        leadersboard_data[1:], start=2
-    ):  # Start=2 to account for header row
-        if (
-            row[nickname_index - 1] == nickname
-        ):  # -1 to convert back from Google Sheets indexing
-            player_row = i
-            break
-
-    if player_row:
-        # Player exists, update their record
-        cell = leadersboard_data_sheet.cell(player_row, total_index)
-        leadersboard_data_sheet.update_cell(
-            player_row, total_index, int(cell.value) + 1
-        )
-        if result == "Win":
-            cell = leadersboard_data_sheet.cell(player_row, win_index)
-            leadersboard_data_sheet.update_cell(
-                player_row, win_index, int(cell.value) + 1
-            )
-        elif result == "Lose":
-            cell = leadersboard_data_sheet.cell(player_row, lose_index)
-            leadersboard_data_sheet.update_cell(
-                player_row, lose_index, int(cell.value) + 1
-            )
-        elif result == "Draw":
-            cell = leadersboard_data_sheet.cell(player_row, draws_index)
-            leadersboard_data_sheet.update_cell(
-                player_row, draws_index, int(cell.value) + 1
-            )
-    else:
-        # Player doesn't exist, append a new row
-        new_row_values = [""] * len(headers)
-        new_row_values[nickname_index - 1] = nickname
-        new_row_values[total_index - 1] = 1
-        new_row_values[win_index - 1] = 1 if result == "Win" else 0
-        new_row_values[lose_index - 1] = 1 if result == "Lose" else 0
-        new_row_values[draws_index - 1] = 1 if result == "Draw" else 0
-        leadersboard_data_sheet.append_row(new_row_values)
+    get_leadersboard(leadersboard_data_sheet).update(nickname, result)
+
+
+def get_board_buffer(worksheet):
+    """
+    Returns the write-behind buffer of a worksheet, creating it on first use.
+    """
+
+    with REGISTRY_LOCK:
+        buffer = BOARD_BUFFERS.get(worksheet.id)
+        if buffer is None:
+            buffer = BOARD_BUFFERS[worksheet.id] = SheetWriteBuffer(worksheet)
+    return buffer
+
+
+@timed("flush_board_buffers")
+def flush_board_buffers():
+    """
+    Sends all buffered boards to Google Sheets.
+    """
+
+    for buffer in list(BOARD_BUFFERS.values()):
+        buffer.flush()
+
+
+atexit.register(flush_board_buffers)
 
 
 def save_board_to_google_sheets(worksheet, board, move):
     """
-    Saves the current state of the Tic Tac Toe board
-    and the last move to a Google Sheet.
+    Queues the current state of the Tic Tac Toe board
+    and the last move for saving to a Google Sheet.
+    Boards are stored in their canonical symmetric form, so rotated or
+    mirrored positions are logged as the same record.
+    The rows are appended in bulk by the write-behind buffer.
     """
 
-    board_str = "".join(
-        [
-            "X" if cell == 1 else "O" if cell == -1 else " "
-            for row in board
-            for cell in row
-        ]
-    )
-    data_to_insert = [[board_str, move]]
-    worksheet.insert_rows(data_to_insert, 2)
+    canonical_board, canonical_move = canonicalize_move(board, move)
+    board_str = canonical_board.to_string()
+    get_board_buffer(worksheet).add([board_str, canonical_move])
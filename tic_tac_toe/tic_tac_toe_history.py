@@ -0,0 +1,349 @@
+"""
+This module contains the local game-history store.
+Every move is recorded in SQLite with its game ID, player, turn number
+and timestamp, indexed by board and by player, so training and analytics
+read only the slices they need instead of the whole Google Sheet.
+The Google Sheet is kept as an optional mirror (TIC_TAC_TOE_SHEETS_MIRROR),
+and the history can be exported to Parquet/Arrow for offline training.
+
+Usage:
+    python -m tic_tac_toe.tic_tac_toe_history export history.parquet
+    python -m tic_tac_toe.tic_tac_toe_history stats --player bob
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+from .tic_tac_toe_symmetry import canonicalize_move
+
+
+HISTORY_FILE = os.environ.get(
+    "TIC_TAC_TOE_HISTORY", ".game_history.sqlite3")
+# Also append the boards to the Google Sheet (1) or not (0)
+SHEETS_MIRROR = os.environ.get("TIC_TAC_TOE_SHEETS_MIRROR", "1") == "1"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS moves (
+    id INTEGER PRIMARY KEY,
+    game_id TEXT,
+    player TEXT,
+    turn INTEGER,
+    side INTEGER,
+    board TEXT NOT NULL,
+    move INTEGER NOT NULL,
+    created REAL NOT NULL,
+    sheet_row INTEGER
+);
+CREATE INDEX IF NOT EXISTS moves_board ON moves (board);
+CREATE INDEX IF NOT EXISTS moves_player ON moves (player, game_id);
+CREATE INDEX IF NOT EXISTS moves_game ON moves (game_id, turn);
+"""
+
+# The row of the mirror sheet a move was imported from (the sync cursor)
+SHEET_ROW_INDEX = """
+CREATE UNIQUE INDEX IF NOT EXISTS moves_sheet_row ON moves (sheet_row)
+WHERE sheet_row IS NOT NULL;
+"""
+
+# Columns a training watermark can refer to: the ID of the move in
+# this history, or the mirror sheet row it was imported from (the same
+# on every machine that syncs from the sheet)
+CURSORS = ("id", "sheet_row")
+
+COLUMNS = (
+    "id", "game_id", "player", "turn", "side", "board", "move", "created",
+    "sheet_row",
+)
+
+
+def new_game_id():
+    """
+    Return a new unique game ID.
+    """
+
+    return uuid.uuid4().hex
+
+
+class GameHistory:
+    """
+    SQLite store of all recorded moves, shared by the game sessions.
+    """
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets the exports read while the game keeps writing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self._migrate()
+        self.connection.executescript(SHEET_ROW_INDEX)
+
+    def _migrate(self):
+        """
+        Add the sheet_row column to histories created before it.
+        Moves imported back then (without a game) used their sheet row
+        as ID.
+        """
+
+        columns = [
+            row[1] for row in self.connection.execute(
+                "PRAGMA table_info(moves)")
+        ]
+        if "sheet_row" not in columns:
+            self.connection.execute(
+                "ALTER TABLE moves ADD COLUMN sheet_row INTEGER")
+            self.connection.execute(
+                "UPDATE moves SET sheet_row = id WHERE game_id IS NULL")
+            self.connection.commit()
+
+    def record(self, game_id, player, board, move, side):
+        """
+        Record a move. The board (after the move) and the move are stored
+        in their canonical symmetric form, like the sheet records.
+        """
+
+        canonical_board, canonical_move = canonicalize_move(board, move)
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO moves "
+                "(game_id, player, turn, side, board, move, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (game_id, player, board.move_count(), side,
+                 canonical_board.to_string(), canonical_move, time.time()))
+            self.connection.commit()
+
+    def count(self, since_id=0, cursor="id"):
+        """
+        Return the number of moves after since_id. With the sheet_row
+        cursor, only the moves imported from the sheet are counted.
+        """
+
+        if cursor not in CURSORS:
+            raise ValueError(f"Unknown history cursor: {cursor}")
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT COUNT(*) FROM moves WHERE {cursor} > ?",
+                (since_id,)).fetchone()[0]
+
+    def last_id(self):
+        """
+        Return the ID of the last recorded move (0 if there is none).
+        """
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COALESCE(MAX(id), 0) FROM moves").fetchone()[0]
+
+    def last_sheet_row(self):
+        """
+        Return the last mirror sheet row imported (0 if there is none).
+        """
+
+        with self.lock:
+            return self.connection.execute(
+                "SELECT COALESCE(MAX(sheet_row), 0) FROM moves").fetchone()[0]
+
+    def import_rows(self, rows, first_row=1):
+        """
+        Import (board string, move) rows of the data sheet as moves
+        without game information. The sheet row number is kept in the
+        sheet_row column, and rows already imported are skipped.
+        Returns the number of imported rows.
+        """
+
+        records = []
+        now = time.time()
+        for row_number, row in enumerate(rows, start=first_row):
+            if len(row) < 2 or not row[0] or row[1] == "":
+                continue
+            board_str = row[0][:9].ljust(9)
+            turn = 9 - board_str.count(" ")
+            records.append((row_number, turn, board_str, int(row[1]), now))
+        with self.lock:
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO moves "
+                "(sheet_row, turn, board, move, created) "
+                "VALUES (?, ?, ?, ?, ?)", records)
+            self.connection.commit()
+        return cursor.rowcount
+
+    def seed_from_worksheet(self, worksheet):
+        """
+        Fill an empty history from the mirror sheet, e.g. on a new machine.
+        """
+
+        if worksheet is None or self.count():
+            return 0
+        imported = self.import_rows(worksheet.get_all_values())
+        if imported:
+            print(f"Imported {imported} records from the data sheet.")
+        return imported
+
+    def sync_from_worksheet(self, worksheet):
+        """
+        Import the mirror sheet rows added after the last imported row,
+        e.g. for a training worker that does not share the disk of the
+        game sessions. Only the new rows are read. The cursor is the
+        sheet row, independent of the IDs of the moves recorded here.
+        """
+
+        first_row = self.last_sheet_row() + 1
+        imported = self.import_rows(
+            worksheet.get(f"A{first_row}:B"), first_row)
+        if imported:
+            print(f"Imported {imported} new records from the data sheet.")
+        return imported
+
+    def query(self, board=None, player=None, game_id=None, since_id=0,
+              limit=None):
+        """
+        Return the moves matching the filters as dictionaries,
+        oldest first. Every filter uses an index.
+        """
+
+        conditions = ["id > ?"]
+        parameters = [since_id]
+        for column, value in (
+                ("board", board), ("player", player), ("game_id", game_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                parameters.append(value)
+        sql = (
+            f"SELECT {', '.join(COLUMNS)} FROM moves "
+            f"WHERE {' AND '.join(conditions)} ORDER BY id"
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        with self.lock:
+            cursor = self.connection.execute(sql, parameters)
+            return [dict(zip(COLUMNS, row)) for row in cursor]
+
+    def move_counts(self, board):
+        """
+        Return {move: times played} for a canonical board string.
+        """
+
+        with self.lock:
+            cursor = self.connection.execute(
+                "SELECT move, COUNT(*) FROM moves WHERE board = ? "
+                "GROUP BY move", (board,))
+            return dict(cursor.fetchall())
+
+    def player_summary(self, player):
+        """
+        Return the number of games and moves recorded for a player.
+        """
+
+        with self.lock:
+            games, moves = self.connection.execute(
+                "SELECT COUNT(DISTINCT game_id), COUNT(*) FROM moves "
+                "WHERE player = ?", (player,)).fetchone()
+        return {"player": player, "games": games, "moves": moves}
+
+    def training_arrays(self, since_id=0, player=None, cursor="id"):
+        """
+        Return the boards (N, 9), moves (N,) after since_id and the
+        cursor value (ID or sheet row) of the last one, which is the
+        next training watermark.
+        """
+
+        from .tic_tac_toe_data import rows_to_arrays
+
+        if cursor not in CURSORS:
+            raise ValueError(f"Unknown history cursor: {cursor}")
+        sql = f"SELECT {cursor}, board, move FROM moves WHERE {cursor} > ?"
+        parameters = [since_id]
+        if player is not None:
+            sql += " AND player = ?"
+            parameters.append(player)
+        with self.lock:
+            rows = self.connection.execute(
+                sql + f" ORDER BY {cursor}", parameters).fetchall()
+        last_id = rows[-1][0] if rows else since_id
+        boards, moves = rows_to_arrays([row[1:] for row in rows])
+        return boards, moves, last_id
+
+    def to_arrow(self, since_id=0):
+        """
+        Return the moves recorded after since_id as a pyarrow Table.
+        """
+
+        import pyarrow as pa
+
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM moves WHERE id > ? "
+                "ORDER BY id", (since_id,)).fetchall()
+        columns = list(zip(*rows)) if rows else [()] * len(COLUMNS)
+        return pa.table({
+            name: list(values) for name, values in zip(COLUMNS, columns)
+        })
+
+    def export_parquet(self, path, since_id=0):
+        """
+        Write the moves recorded after since_id to a Parquet file.
+        Returns the number of exported moves.
+        """
+
+        import pyarrow.parquet as pq
+
+        table = self.to_arrow(since_id)
+        pq.write_table(table, path)
+        return table.num_rows
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+
+        with self.lock:
+            self.connection.close()
+
+
+@lru_cache(maxsize=None)
+def get_game_history():
+    """
+    Return the shared game history, opening it on first use.
+    """
+
+    return GameHistory()
+
+
+def main(argv=None):
+    """
+    Command line entry point: export the history or show statistics.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export to Parquet")
+    export.add_argument("output")
+    export.add_argument("--since", type=int, default=0,
+                        help="export only moves after this ID")
+    stats = commands.add_parser("stats", help="show history statistics")
+    stats.add_argument("--player")
+    stats.add_argument("--board", help="canonical 9 character board")
+    args = parser.parse_args(argv)
+
+    history = get_game_history()
+    if args.command == "export":
+        exported = history.export_parquet(args.output, args.since)
+        print(f"Exported {exported} moves to {args.output}")
+    else:
+        print(f"Moves recorded: {history.count()}")
+        if args.player:
+            print(history.player_summary(args.player))
+        if args.board:
+            print(history.move_counts(args.board))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+This module contains the inference scheduler shared by all game sessions.
+AI move requests from many sessions are gathered for a short window
+(or until the batch is full) and run through the model in one batched
+forward pass. Each caller gets its own row of the result back, and the
+batch sizes and request latencies are kept as metrics.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+# Longest time the first request of a batch waits for more requests
+BATCH_WINDOW = float(
+    os.environ.get("TIC_TAC_TOE_BATCH_WINDOW_MS", "2")) / 1000
+# Largest number of boards in one forward pass
+MAX_BATCH = int(os.environ.get("TIC_TAC_TOE_MAX_BATCH", "64"))
+# Number of recent latencies kept for the percentiles
+LATENCY_SAMPLES = 10000
+
+
+def percentile(sorted_values, fraction):
+    """
+    Return a percentile of an already sorted list (nearest rank).
+    """
+
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class InferenceBatcher:
+    """
+    Background scheduler that groups single-board requests
+    into batched forward passes.
+    """
+
+    def __init__(self, forward, max_batch=MAX_BATCH, window=BATCH_WINDOW):
+        self.forward = forward
+        self.max_batch = max_batch
+        self.window = window
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+
+        # Metrics
+        self.requests = 0
+        self.batches = 0
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+        self.thread = threading.Thread(
+            target=self._run, name="inference", daemon=True)
+        self.thread.start()
+
+    def set_forward(self, forward):
+        """
+        Use a new forward function (e.g. after the model was retrained).
+        """
+
+        with self.condition:
+            self.forward = forward
+
+    def submit(self, board_input):
+        """
+        Queue one model input (9 values) and return a Future
+        of its 9 move scores.
+        """
+
+        future = Future()
+        with self.condition:
+            closed = self.closed
+            if not closed:
+                self.pending.append(
+                    (board_input, future, time.perf_counter()))
+                self.condition.notify()
+        if closed:
+            # A late request after close is run on its own
+            try:
+                inputs = np.array([board_input], dtype=np.float32)
+                future.set_result(np.asarray(self.forward(inputs))[0])
+            except Exception as e:
+                future.set_exception(e)
+        return future
+
+    def predict(self, board_input):
+        """
+        Return the 9 move scores of one model input,
+        waiting for the batch it is part of.
+        """
+
+        return self.submit(board_input).result()
+
+    def _next_batch(self):
+        """
+        Wait for the first request, then gather more until the window
+        has passed or the batch is full. Returns (batch, forward),
+        or (None, None) when closed.
+        """
+
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            if not self.pending:
+                return None, None
+            deadline = time.perf_counter() + self.window
+            while len(self.pending) < self.max_batch and not self.closed:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self.condition.wait(remaining)
+            size = min(self.max_batch, len(self.pending))
+            batch = [self.pending.popleft() for _ in range(size)]
+            return batch, self.forward
+
+    def _run(self):
+        """
+        Main loop of the scheduler thread.
+        """
+
+        while True:
+            batch, forward = self._next_batch()
+            if batch is None:
+                return
+            inputs = np.array([item[0] for item in batch], dtype=np.float32)
+            try:
+                outputs = np.asarray(forward(inputs))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            with self.condition:
+                self.batches += 1
+                self.requests += len(batch)
+                for _, _, submitted in batch:
+                    self.latencies.append(done - submitted)
+            for row, (_, future, _) in zip(outputs, batch):
+                future.set_result(row)
+
+    def metrics(self):
+        """
+        Return the scheduler metrics: requests, batches, mean batch size,
+        queue depth and latency percentiles in milliseconds.
+        """
+
+        with self.condition:
+            latencies = sorted(self.latencies)
+            requests, batches = self.requests, self.batches
+            queue_depth = len(self.pending)
+        return {
+            "requests": requests,
+            "batches": batches,
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "queue_depth": queue_depth,
+            "latency_p50_ms": percentile(latencies, 0.50) * 1000,
+            "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+    def close(self):
+        """
+        Stop the scheduler after the pending requests are served.
+        """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
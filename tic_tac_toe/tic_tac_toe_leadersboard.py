@@ -0,0 +1,291 @@
+"""
+This module keeps the leadersboard of the tic-tac-toe game in memory.
+The sheet is read once, the rows of the players and the column offsets
+are remembered, and every game result is written back with a single
+request: a batch update of the player's counter cells, or an append of
+the row of a new player.
+The players are also kept in a ranking index ordered by wins, so the
+top players, a player's rank and its neighbours are found without
+sorting the whole board on every view.
+"""
+
+import threading
+from bisect import bisect_left, insort
+
+from .tic_tac_toe_storage import (
+    appended_rows, column_letters, rowcol_to_a1)
+
+
+# Map a game result to the header of the column it increments
+RESULT_COLUMNS = {
+    "Win": "win_human",
+    "Lose": "win_ai",
+    "Draw": "draws",
+}
+
+
+# Number of players on one page of the leadersboard
+PAGE_SIZE = 10
+
+
+class RankingIndex:
+    """
+    Players sorted by wins (then win rate, then nickname).
+    Rank lookups are a binary search; an update moves one entry.
+    """
+
+    def __init__(self):
+        # Sorted list of (-wins, -win rate, nickname)
+        self.keys = []
+        # Nickname -> its current key
+        self.key_of = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, nickname, wins, total):
+        """
+        Insert a player or move it to the position of its new score.
+        """
+
+        old_key = self.key_of.get(nickname)
+        if old_key is not None:
+            del self.keys[bisect_left(self.keys, old_key)]
+        key = (-wins, -(wins / total if total else 0.0), nickname)
+        self.key_of[nickname] = key
+        insort(self.keys, key)
+
+    def rank(self, nickname):
+        """
+        Return the 1-based rank of a player, or None if unknown.
+        """
+
+        key = self.key_of.get(nickname)
+        if key is None:
+            return None
+        return bisect_left(self.keys, key) + 1
+
+    def nicknames(self, start, stop):
+        """
+        Return the nicknames at 0-based positions start to stop.
+        """
+
+        return [key[2] for key in self.keys[max(start, 0):stop]]
+
+
+class LeadersboardService:
+    """
+    In-memory index of the leadersboard sheet that groups
+    result updates into one round-trip.
+    The in-memory counters are the source of truth, so one writer
+    process is assumed: the game server, which hosts all sessions.
+    Processes writing the same sheet at the same time can lose each
+    other's results.
+    """
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        # Sessions of the game server share one leadersboard
+        self.lock = threading.Lock()
+
+        # The only full read of the sheet
+        leadersboard_data = worksheet.get_all_values()
+        self.headers = leadersboard_data[0]
+
+        # Column offsets (0-based) of the relevant columns
+        self.nickname_index = self.headers.index("human_nickname")
+        self.total_index = self.headers.index("total_games")
+        self.result_indexes = {
+            result: self.headers.index(header)
+            for result, header in RESULT_COLUMNS.items()
+        }
+        self.counter_indexes = [
+            self.total_index, *self.result_indexes.values()]
+
+        # Nickname -> sheet row number (1-based, header is row 1)
+        self.rows = {}
+        # Nickname -> list of the row values
+        self.values = {}
+        for i, row in enumerate(leadersboard_data[1:], start=2):
+            row = self._parse_row(row)
+            nickname = row[self.nickname_index]
+            if nickname not in self.rows:
+                self.rows[nickname] = i
+                self.values[nickname] = row
+
+        # Players whose counters changed since the last write
+        self.dirty = set()
+
+        # Players ordered by wins
+        self.wins_index = self.result_indexes["Win"]
+        self.ranking = RankingIndex()
+        for nickname, row in self.values.items():
+            self._rank(nickname, row)
+
+    def _parse_row(self, row):
+        """
+        Pad a row read from the sheet to the width of the header,
+        with the counters as numbers.
+        """
+
+        row = list(row) + [""] * (len(self.headers) - len(row))
+        for index in self.counter_indexes:
+            row[index] = int(row[index]) if row[index] else 0
+        return row
+
+    def _new_row(self, nickname):
+        """
+        Return the row values of a player without games.
+        """
+
+        row = [""] * len(self.headers)
+        row[self.nickname_index] = nickname
+        for index in self.counter_indexes:
+            row[index] = 0
+        return row
+
+    def _rank(self, nickname, row):
+        """
+        Update the position of a player in the ranking index.
+        """
+
+        self.ranking.update(
+            nickname, row[self.wins_index], row[self.total_index])
+
+    def record(self, nickname, result):
+        """
+        Apply a game result ("Win", "Lose" or "Draw") in memory.
+        """
+
+        with self.lock:
+            self._record(nickname, result)
+
+    def _record(self, nickname, result):
+        """
+        Apply a game result while holding the lock.
+        """
+
+        row = self.values.get(nickname)
+        if row is None:
+            row = self.values[nickname] = self._new_row(nickname)
+        row[self.total_index] += 1
+        if result in self.result_indexes:
+            row[self.result_indexes[result]] += 1
+        self.dirty.add(nickname)
+        self._rank(nickname, row)
+
+    def _resolve(self):
+        """
+        Read the nickname column to find the rows of the players, for
+        an append response without the range it wrote.
+        """
+
+        column = column_letters(self.nickname_index + 1)
+        nicknames = self.worksheet.get(f"{column}2:{column}")
+        self.rows = {}
+        for i, cells in enumerate(nicknames, start=2):
+            nickname = cells[0] if cells else ""
+            if nickname and nickname not in self.rows:
+                self.rows[nickname] = i
+
+    def flush(self):
+        """
+        Write all changed results: the counter cells of known players
+        with one batch update and the rows of new players with one
+        append.
+        """
+
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """
+        Write the changed results while holding the lock.
+        """
+
+        known = [nickname for nickname in self.dirty
+                 if nickname in self.rows]
+        new = [nickname for nickname in self.dirty
+               if nickname not in self.rows]
+        if known:
+            self.worksheet.batch_update([
+                {
+                    "range": rowcol_to_a1(self.rows[nickname], index + 1),
+                    "values": [[self.values[nickname][index]]],
+                }
+                for nickname in known
+                for index in self.counter_indexes
+            ])
+            self.dirty.difference_update(known)
+        if new:
+            response = self.worksheet.append_rows(
+                [self.values[nickname] for nickname in new])
+            self.dirty.difference_update(new)
+            appended = appended_rows(response)
+            if appended is None:
+                self._resolve()
+            else:
+                for i, nickname in enumerate(new):
+                    self.rows[nickname] = appended[0] + i
+
+    def update(self, nickname, result):
+        """
+        Apply one game result and write it to the sheet at once.
+        """
+
+        with self.lock:
+            self._record(nickname, result)
+            self._flush()
+
+    def _ranked(self, start, stop):
+        """
+        Return (rank, row values) of the players at 0-based positions
+        start to stop, while holding the lock.
+        """
+
+        start = max(start, 0)
+        return [
+            (rank, list(self.values[nickname]))
+            for rank, nickname in enumerate(
+                self.ranking.nicknames(start, stop), start=start + 1)
+        ]
+
+    def top(self, k=PAGE_SIZE):
+        """
+        Return (rank, row values) of the k best players.
+        """
+
+        with self.lock:
+            return self._ranked(0, k)
+
+    def rank(self, nickname):
+        """
+        Return the 1-based rank of a player, or None if unknown.
+        """
+
+        with self.lock:
+            return self.ranking.rank(nickname)
+
+    def around(self, nickname, neighbors=2):
+        """
+        Return (rank, row values) of a player and the players
+        ranked just above and below it.
+        """
+
+        with self.lock:
+            rank = self.ranking.rank(nickname)
+            if rank is None:
+                return []
+            return self._ranked(rank - 1 - neighbors, rank + neighbors)
+
+    def page(self, number, size=PAGE_SIZE):
+        """
+        Return (rank, row values) of the players on a 1-based page
+        and the number of pages.
+        """
+
+        with self.lock:
+            pages = max(1, -(-len(self.ranking) // size))
+            number = min(max(number, 1), pages)
+            start = (number - 1) * size
+            return self._ranked(start, start + size), pages
@@ -0,0 +1,330 @@
+"""
+This module contains the Monte Carlo Tree Search AI backend.
+The tree is searched with PUCT: the network's move scores are the
+prior of every new node, so the search looks at the moves the model
+likes first and still finds forks and blocks the model misses.
+Leaves are valued by random playouts that run in a pool of worker
+processes. Every round selects a batch of leaves with a virtual loss,
+so more cores evaluate more leaves per round. The pool is started with
+the player, outside the time budget of the moves, and a round is only
+sent to the pool while the pool evaluates more leaves per second than
+the game process does alone. The tree of a game is kept between its
+moves.
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from .tic_tac_toe_board import FULL_MASK, IS_WINNING, MOVES_FROM_MASK
+from .tic_tac_toe_symmetry import canonicalize, inverse_move
+
+
+# Seconds of search per move
+MCTS_TIME = float(os.environ.get("TIC_TAC_TOE_MCTS_TIME", "0.5"))
+# Playouts per move; 0 - only the time budget limits the search
+MCTS_PLAYOUTS = int(os.environ.get("TIC_TAC_TOE_MCTS_PLAYOUTS", "0"))
+# Rollout worker processes; 0 or 1 - rollouts run in the game process
+MCTS_WORKERS = int(
+    os.environ.get("TIC_TAC_TOE_MCTS_WORKERS", str(os.cpu_count() or 1)))
+# Exploration constant of PUCT
+C_PUCT = float(os.environ.get("TIC_TAC_TOE_MCTS_CPUCT", "1.5"))
+# Random playouts per leaf, and leaves per worker in every round
+ROLLOUTS_PER_LEAF = 8
+LEAVES_PER_WORKER = 8
+# Temporary loss added on the path of a leaf that is being evaluated
+VIRTUAL_LOSS = 1.0
+# Rounds between two measurements of the slower way to evaluate leaves
+PROBE_ROUNDS = 32
+
+
+def rollout_values(leaves, rollouts, seed):
+    """
+    Play random games from every leaf (x, o, player to move) and return
+    the mean result of each leaf for X (1 - win, -1 - loss, 0 - draw).
+    Runs in the worker processes.
+    """
+
+    rng = random.Random(seed)
+    values = []
+    for x, o, player in leaves:
+        free = list(MOVES_FROM_MASK[~(x | o) & FULL_MASK])
+        total = 0
+        for _ in range(rollouts):
+            rng.shuffle(free)
+            board_x, board_o, side = x, o, player
+            for move in free:
+                if side == 1:
+                    board_x |= 1 << move
+                    if IS_WINNING[board_x]:
+                        total += 1
+                        break
+                else:
+                    board_o |= 1 << move
+                    if IS_WINNING[board_o]:
+                        total -= 1
+                        break
+                side = -side
+        values.append(total / rollouts)
+    return values
+
+
+@lru_cache(maxsize=None)
+def get_rollout_pool(workers):
+    """
+    Return the process pool shared by all searches. Workers are started
+    by a fork server (or spawned), never forked from the threads of the
+    game server.
+    """
+
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context(
+        "forkserver" if "forkserver" in methods else "spawn")
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    # Start every worker now: a worker is started on first use, which
+    # would take most of the time budget of the first move
+    for future in [pool.submit(rollout_values, [], 1, 0)
+                   for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+class Node:
+    """
+    Position in the search tree. The value sum is kept from the point
+    of view of the player who made the move into the node.
+    """
+
+    __slots__ = ("board", "player", "prior", "children", "visits",
+                 "value_sum", "result")
+
+    def __init__(self, board, player, prior=1.0):
+        self.board = board
+        self.player = player
+        self.prior = prior
+        # Move -> child node, set when the node is expanded
+        self.children = None
+        self.visits = 0
+        self.value_sum = 0.0
+        game_over, winner = board.status()
+        self.result = winner if game_over else None
+
+
+class MCTSPlayer:
+    """
+    AI backend that searches with MCTS, using a model (CachedPredictor,
+    NumpyModel or Keras model) as the policy prior. Without a model
+    every legal move has the same prior.
+    """
+
+    def __init__(self, prior=None, time_budget=MCTS_TIME,
+                 playouts=MCTS_PLAYOUTS, workers=MCTS_WORKERS,
+                 c_puct=C_PUCT, seed=None):
+        self.prior = prior
+        self.time_budget = time_budget
+        self.playouts = playouts
+        self.workers = workers
+        self.c_puct = c_puct
+        self.rng = random.Random(seed)
+        # Every game server session keeps its own tree
+        self.local = threading.local()
+        # Leaves per second of a round in the game process (False)
+        # and in the pool (True), measured during the searches
+        self.rates = {}
+        self.rounds = 0
+        # Statistics of the last search
+        self.last_playouts = 0
+        self.last_reused = False
+        if workers > 1:
+            get_rollout_pool(workers)
+
+    def policy(self, board):
+        """
+        Return the prior probability of every legal move.
+        """
+
+        moves = board.legal_moves()
+        if self.prior is None:
+            return {move: 1 / len(moves) for move in moves}
+        # The model is trained on canonical boards
+        canonical_board, transform = canonicalize(board)
+        if hasattr(self.prior, "predict_board"):
+            prediction = self.prior.predict_board(canonical_board)
+        else:
+            boards = np.array([canonical_board.to_list()], dtype=np.float32)
+            prediction = np.asarray(self.prior.predict(boards))[0]
+        canonical_moves = canonical_board.legal_moves()
+        weights = np.maximum(
+            np.asarray(prediction, dtype=np.float64)[list(canonical_moves)],
+            1e-6)
+        weights /= weights.sum()
+        return {
+            inverse_move(move, transform): weight
+            for move, weight in zip(canonical_moves, weights)
+        }
+
+    def _root(self, board, player):
+        """
+        Return the node of the board from the tree of the previous move,
+        or a new root.
+        """
+
+        root = getattr(self.local, "root", None)
+        self.last_reused = False
+        if root is not None:
+            candidates = [root] + list((root.children or {}).values())
+            for node in candidates:
+                if node.player == player and node.board == board:
+                    self.last_reused = True
+                    return node
+        return Node(board.copy(), player)
+
+    def _expand(self, node):
+        """
+        Create the children of a node with their prior probabilities.
+        """
+
+        node.children = {}
+        for move, prior in self.policy(node.board).items():
+            child_board = node.board.copy()
+            child_board.make_move(move, node.player)
+            node.children[move] = Node(child_board, -node.player, prior)
+
+    def _best_child(self, node):
+        """
+        Return the child with the highest PUCT score.
+        """
+
+        exploration = self.c_puct * math.sqrt(node.visits + 1)
+        best_score, best_child = -math.inf, None
+        for child in node.children.values():
+            value = child.value_sum / child.visits if child.visits else 0.0
+            score = value + exploration * child.prior / (1 + child.visits)
+            if score > best_score:
+                best_score, best_child = score, child
+        return best_child
+
+    def _select(self, root):
+        """
+        Walk down to a leaf, add a virtual loss on the way and expand
+        the leaf. Returns the path from the root to the leaf.
+        """
+
+        node = root
+        path = [node]
+        while node.children:
+            node = self._best_child(node)
+            path.append(node)
+        for visited in path:
+            visited.visits += 1
+            visited.value_sum -= VIRTUAL_LOSS
+        if node.result is None:
+            self._expand(node)
+        return path
+
+    def _backup(self, path, value):
+        """
+        Replace the virtual loss on a path by the value of its leaf
+        (the result for X).
+        """
+
+        for node in path:
+            node.value_sum += VIRTUAL_LOSS - value * node.player
+
+    def _use_pool(self):
+        """
+        Check whether the next round is evaluated by the worker pool.
+        Both ways are measured first, then the faster one is used, and
+        the slower one is measured again every PROBE_ROUNDS rounds.
+        """
+
+        if self.workers <= 1:
+            return False
+        for parallel in (True, False):
+            if parallel not in self.rates:
+                return parallel
+        self.rounds += 1
+        faster = self.rates[True] > self.rates[False]
+        if self.rounds % PROBE_ROUNDS == 0:
+            return not faster
+        return faster
+
+    def _measure(self, parallel, leaves, seconds):
+        """
+        Update the leaves per second of a way to evaluate leaves.
+        """
+
+        rate = leaves / max(seconds, 1e-9)
+        previous = self.rates.get(parallel)
+        self.rates[parallel] = (
+            rate if previous is None else 0.5 * previous + 0.5 * rate)
+
+    def _evaluate(self, leaves, parallel=True):
+        """
+        Return the rollout values of the leaves, computed by the worker
+        processes in parallel, or in the game process.
+        """
+
+        if self.workers <= 1 or not parallel:
+            return rollout_values(
+                leaves, ROLLOUTS_PER_LEAF, self.rng.getrandbits(32))
+        pool = get_rollout_pool(self.workers)
+        chunk = math.ceil(len(leaves) / self.workers)
+        futures = [
+            pool.submit(rollout_values, leaves[i:i + chunk],
+                        ROLLOUTS_PER_LEAF, self.rng.getrandbits(32))
+            for i in range(0, len(leaves), chunk)
+        ]
+        return [value for future in futures for value in future.result()]
+
+    def select_move(self, board, player=-1):
+        """
+        Return the most visited move after searching within the
+        time and playout budget.
+        """
+
+        root = self._root(board, player)
+        deadline = time.perf_counter() + self.time_budget
+        playouts = 0
+        while True:
+            parallel = self._use_pool()
+            # Every worker gets its share of leaves; the game process
+            # alone keeps the batch (and the virtual losses) small
+            batch = LEAVES_PER_WORKER * (self.workers if parallel else 1)
+            started = time.perf_counter()
+            paths, leaves = [], []
+            for _ in range(batch):
+                path = self._select(root)
+                leaf = path[-1]
+                if leaf.result is not None:
+                    # Finished games are valued exactly
+                    self._backup(path, leaf.result)
+                    playouts += 1
+                else:
+                    paths.append(path)
+                    leaves.append((leaf.board.x, leaf.board.o, leaf.player))
+            if leaves:
+                for path, value in zip(
+                        paths, self._evaluate(leaves, parallel)):
+                    self._backup(path, value)
+                playouts += len(leaves) * ROLLOUTS_PER_LEAF
+                if self.workers > 1:
+                    self._measure(parallel, len(leaves),
+                                  time.perf_counter() - started)
+            if time.perf_counter() >= deadline or (
+                    self.playouts and playouts >= self.playouts):
+                break
+
+        move, child = max(
+            root.children.items(), key=lambda item: item[1].visits)
+        # The next search of this game starts from the chosen move
+        self.local.root = child
+        self.last_playouts = playouts
+        return move
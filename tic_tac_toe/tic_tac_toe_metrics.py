@@ -0,0 +1,535 @@
+"""
+This module contains the timing instrumentation of the game.
+
+- Spans time the hot calls (model predictions, sheet writes, leadersboard
+  updates, Drive downloads, training) into histograms, for the whole
+  process and for each game session.
+- Counters count the Google API calls and an estimate of the bytes
+  sent and received. InstrumentedClient wraps a worksheet or the
+  storage backend and counts every call made through it.
+- The metrics are served as Prometheus text on a local HTTP endpoint
+  (TIC_TAC_TOE_METRICS_PORT) and/or appended to a JSONL file
+  (TIC_TAC_TOE_METRICS_FILE): one line per span, a summary line at
+  the end of every session and a snapshot of all metrics at exit.
+  Only one process can serve the port; the other processes (e.g. the
+  run.py processes started per connection by the web front end) write
+  a JSONL file of their own in TIC_TAC_TOE_METRICS_DIR instead, where
+  the files not written to for TIC_TAC_TOE_METRICS_RETENTION days are
+  deleted.
+"""
+
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Port of the local Prometheus endpoint; 0 - no endpoint
+METRICS_PORT = int(os.environ.get("TIC_TAC_TOE_METRICS_PORT", "0"))
+# JSONL file of the spans and session summaries; empty - no file
+METRICS_FILE = os.environ.get("TIC_TAC_TOE_METRICS_FILE", "")
+# Directory of the JSONL files of the processes that cannot serve
+# METRICS_PORT because another process already does
+METRICS_DIR = os.environ.get("TIC_TAC_TOE_METRICS_DIR", ".metrics")
+# Days the files in METRICS_DIR are kept after their last write
+METRICS_RETENTION = float(
+    os.environ.get("TIC_TAC_TOE_METRICS_RETENTION", "7"))
+
+# Upper bounds (seconds) of the histogram buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+SPAN_METRIC = "tic_tac_toe_span_seconds"
+CALLS_METRIC = "tic_tac_toe_api_calls_total"
+ERRORS_METRIC = "tic_tac_toe_api_errors_total"
+BYTES_METRIC = "tic_tac_toe_api_bytes_estimated_total"
+
+# The session of the current thread, if any
+_current = threading.local()
+
+
+class Histogram:
+    """
+    Histogram of durations with fixed buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                break
+        else:
+            i = len(BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, fraction):
+        """
+        Return the upper bound of the bucket holding the quantile.
+        """
+
+        rank = fraction * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else self.max
+        return 0.0
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def payload_size(value):
+    """
+    Estimate the size in bytes of a request or response from the
+    lengths of its strings, without serializing it again. Byte strings
+    (Drive downloads and uploads) are counted exactly; other objects
+    (worksheets, clients) are not traffic and count as 0.
+    """
+
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, bool) or value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return len(str(value))
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], str):
+            # A row of cells, the most common case
+            try:
+                return sum(map(len, value))
+            except TypeError:
+                pass
+        return sum(payload_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(
+            payload_size(key) + payload_size(item)
+            for key, item in value.items())
+    return 0
+
+
+def escape_label(value):
+    """
+    Escape a label value for the Prometheus text format.
+    """
+
+    return (str(value).replace("\\", "\\\\").replace('"', '\\"')
+            .replace("\n", "\\n"))
+
+
+def format_labels(labels):
+    """
+    Format labels for the Prometheus text format.
+    """
+
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def fallback_file(directory=METRICS_DIR, retention=METRICS_RETENTION):
+    """
+    Return the path of the JSONL file of this process in the metrics
+    directory, after deleting the files older than retention days.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    expired = time.time() - retention * 86400
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith(".jsonl") and os.path.getmtime(path) < expired:
+                os.remove(path)
+        except OSError:
+            pass  # Deleted by another process meanwhile
+    return os.path.join(
+        directory, f"tic_tac_toe_metrics.{os.getpid()}.jsonl")
+
+
+class Metrics:
+    """
+    Thread-safe registry of counters and histograms.
+    """
+
+    def __init__(self, path=METRICS_FILE):
+        self.lock = threading.Lock()
+        # (name, sorted labels) -> value or Histogram
+        self.counters = {}
+        self.histograms = {}
+        # Session ID -> span name -> Histogram
+        self.sessions = {}
+        # (name, sorted labels) -> function returning the current value
+        self.gauges = {}
+        self.file = None
+        self.server = None
+        if path:
+            self.open_file(path)
+
+    def open_file(self, path):
+        """
+        Append the spans and session summaries to a JSONL file, and a
+        snapshot of all metrics at exit.
+        """
+
+        self.file = open(path, "a", buffering=1)
+        atexit.register(self.write_snapshot)
+
+    def _write(self, record):
+        if self.file is not None:
+            self.file.write(json.dumps(record) + "\n")
+
+    def write_snapshot(self):
+        """
+        Append a snapshot of all metrics to the JSONL file.
+        """
+
+        if self.file is None or self.file.closed:
+            return
+        snapshot = self.snapshot()
+        with self.lock:
+            self._write(dict(
+                snapshot, type="snapshot", ts=round(time.time(), 6)))
+
+    def count(self, name, value=1, **labels):
+        """
+        Add to a counter.
+        """
+
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(self, name, fn, **labels):
+        """
+        Register a gauge whose value is read from fn on every export.
+        """
+
+        with self.lock:
+            self.gauges[name, tuple(sorted(labels.items()))] = fn
+
+    def _gauge_values(self):
+        """
+        Read the current values of the gauges (without the lock, as
+        the functions take their own locks).
+        """
+
+        with self.lock:
+            gauges = list(self.gauges.items())
+        return [(key, fn()) for key, fn in gauges]
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record one duration of a span, for the process and the session
+        of the current thread.
+        """
+
+        session = getattr(_current, "session", None)
+        key = (SPAN_METRIC, tuple(sorted(dict(labels, span=name).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+            if session is not None and session in self.sessions:
+                spans = self.sessions[session]
+                if name not in spans:
+                    spans[name] = Histogram()
+                spans[name].observe(seconds)
+            if self.file is not None:
+                self._write(dict(
+                    labels, type="span", ts=round(time.time(), 6),
+                    span=name, seconds=round(seconds, 6), session=session))
+
+    @contextmanager
+    def span(self, name, **labels):
+        """
+        Time the body of a with block.
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def start_session(self, session=None):
+        """
+        Start collecting the spans of the current thread for a session
+        and return the session ID.
+        """
+
+        session = session or uuid.uuid4().hex[:12]
+        with self.lock:
+            self.sessions[session] = {}
+        _current.session = session
+        return session
+
+    def end_session(self):
+        """
+        Stop collecting for the session of the current thread and return
+        its span summaries (also written to the JSONL file).
+        """
+
+        session = getattr(_current, "session", None)
+        _current.session = None
+        with self.lock:
+            spans = self.sessions.pop(session, None)
+            if spans is None:
+                return None
+            summary = {name: histogram.summary()
+                       for name, histogram in spans.items()}
+            self._write({"type": "session", "ts": round(time.time(), 6),
+                         "session": session, "spans": summary})
+        return summary
+
+    def snapshot(self):
+        """
+        Return the counters and span summaries as a dict.
+        """
+
+        gauges = self._gauge_values()
+        with self.lock:
+            return {
+                "counters": [
+                    dict(labels, name=name, value=value)
+                    for (name, labels), value in self.counters.items()
+                ],
+                "gauges": [
+                    dict(labels, name=name, value=value)
+                    for (name, labels), value in gauges
+                ],
+                "spans": [
+                    dict(labels, **histogram.summary())
+                    for (_, labels), histogram in self.histograms.items()
+                ],
+            }
+
+    def render_prometheus(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+
+        lines = []
+        seen = set()
+        for (name, labels), value in sorted(self._gauge_values()):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name}{format_labels(labels)} {value}")
+            if self.histograms:
+                lines.append(f"# TYPE {SPAN_METRIC} histogram")
+            for (name, labels), histogram in sorted(
+                    self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ("+Inf",),
+                                        histogram.counts):
+                    cumulative += count
+                    bucket_labels = labels + (("le", bound),)
+                    lines.append(f"{name}_bucket"
+                                 f"{format_labels(bucket_labels)} "
+                                 f"{cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} "
+                             f"{histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} "
+                             f"{histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=METRICS_PORT, host="127.0.0.1"):
+        """
+        Serve /metrics on a local HTTP endpoint in a daemon thread.
+        """
+
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep the game output clean
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(
+            target=self.server.serve_forever, name="metrics-http",
+            daemon=True).start()
+        return self.server
+
+
+@lru_cache(maxsize=None)
+def get_metrics():
+    """
+    Return the metrics registry of the process, starting the endpoint
+    if TIC_TAC_TOE_METRICS_PORT is set.
+    """
+
+    metrics = Metrics()
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+        except OSError as e:
+            # Another process serves the port
+            if metrics.file is None:
+                path = fallback_file()
+                metrics.open_file(path)
+            else:
+                path = metrics.file.name
+            print(f"The metrics endpoint could not be started ({e}), "
+                  f"the metrics are written to {path}.")
+    return metrics
+
+
+def span(name, **labels):
+    """
+    Time the body of a with block as a span.
+    """
+
+    return get_metrics().span(name, **labels)
+
+
+def count(name, value=1, **labels):
+    """
+    Add to a counter.
+    """
+
+    get_metrics().count(name, value, **labels)
+
+
+def register_gauge(name, fn, **labels):
+    """
+    Register a gauge read from fn on every export.
+    """
+
+    get_metrics().gauge(name, fn, **labels)
+
+
+def timed(name):
+    """
+    Decorator that times every call of a function as a span.
+    """
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def session_metrics(fn):
+    """
+    Decorator that collects the spans of each call of fn (a game
+    session) as one session.
+    """
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        metrics = get_metrics()
+        metrics.start_session()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.end_session()
+
+    return wrapper
+
+
+def bind_session(fn):
+    """
+    Return fn wrapped so its spans count for the session of the calling
+    thread even when it runs in another (background) thread.
+    """
+
+    session = getattr(_current, "session", None)
+    if session is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_current, "session", None)
+        _current.session = session
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.session = previous
+
+    return wrapper
+
+
+class InstrumentedClient:
+    """
+    Proxy of a worksheet or storage backend that counts and times
+    every method call as an API call, with an estimate of the bytes sent
+    and received.
+    Other attributes (id, title, ...) are passed through.
+    """
+
+    def __init__(self, target, api):
+        self._target = target
+        self._api = api
+
+    def __getattr__(self, name):
+        value = getattr(self._target, name)
+        if name.startswith("_") or not callable(value):
+            return value
+        api = self._api
+
+        @functools.wraps(value)
+        def call(*args, **kwargs):
+            count(CALLS_METRIC, api=api, method=name)
+            sent = payload_size(args + tuple(kwargs.values()))
+            if sent:
+                count(BYTES_METRIC, sent, api=api, direction="sent")
+            try:
+                with span(f"{api}.{name}"):
+                    result = value(*args, **kwargs)
+            except Exception:
+                count(ERRORS_METRIC, api=api, method=name)
+                raise
+            received = payload_size(result)
+            if received:
+                count(BYTES_METRIC, received, api=api, direction="received")
+            return result
+
+        return call
+
+    def __repr__(self):
+        return f"InstrumentedClient({self._target!r}, {self._api!r})"
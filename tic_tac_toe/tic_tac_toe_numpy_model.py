@@ -0,0 +1,170 @@
+"""
+This module contains the compact weights-only format of the model and a
+pure-NumPy forward pass. The dense layers of the Keras model are saved as
+raw float32 (or float16) arrays in an uncompressed .npz file, so the AI
+can be loaded and run in milliseconds without importing TensorFlow.
+TensorFlow is only needed to train the model.
+"""
+
+import io
+
+import numpy as np
+
+
+# Format version written into every file
+FORMAT_VERSION = 1
+
+
+def relu(x):
+    """
+    Rectified linear unit.
+    """
+
+    return np.maximum(x, 0)
+
+
+def softmax(x):
+    """
+    Softmax over the last axis, stable for large inputs.
+    """
+
+    exp = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def sigmoid(x):
+    """
+    Logistic sigmoid.
+    """
+
+    return 1 / (1 + np.exp(-x))
+
+
+def linear(x):
+    """
+    Identity activation.
+    """
+
+    return x
+
+
+# Keras activation name -> NumPy implementation
+ACTIVATIONS = {
+    "relu": relu,
+    "softmax": softmax,
+    "sigmoid": sigmoid,
+    "tanh": np.tanh,
+    "linear": linear,
+}
+
+
+class NumpyModel:
+    """
+    Stack of dense layers evaluated with NumPy.
+    It can be called like a Keras model: model(boards) returns
+    the move scores of a (N, 9) batch.
+    """
+
+    def __init__(self, layers):
+        # List of (kernel, bias, activation name)
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation: {activation}")
+        self.layers = layers
+        # float16 weights are converted once; the math runs in float32
+        self.compute_layers = [
+            (kernel.astype(np.float32), bias.astype(np.float32),
+             ACTIVATIONS[activation])
+            for kernel, bias, activation in layers
+        ]
+
+    @classmethod
+    def from_keras(cls, model):
+        """
+        Copy the weights of a Keras model made of Dense layers.
+        """
+
+        layers = []
+        for layer in model.layers:
+            weights = layer.get_weights()
+            if not weights:
+                continue  # Input and other layers without weights
+            kernel, bias = weights
+            layers.append((
+                np.asarray(kernel, dtype=np.float32),
+                np.asarray(bias, dtype=np.float32),
+                layer.activation.__name__,
+            ))
+        model_copy = cls(layers)
+        for name in ("training_watermark", "training_cursor",
+                     "model_version", "weights_hash"):
+            if hasattr(model, name):
+                setattr(model_copy, name, getattr(model, name))
+        return model_copy
+
+    def __call__(self, boards, training=False):
+        outputs = np.asarray(boards, dtype=np.float32)
+        for kernel, bias, activation in self.compute_layers:
+            outputs = activation(outputs @ kernel + bias)
+        return outputs
+
+    def predict(self, boards, verbose=0):
+        """
+        Return the move scores of a batch of boards, like Keras predict.
+        """
+
+        return self(boards)
+
+    def get_weights(self):
+        """
+        Return the weights as a flat list [kernel, bias, ...], like Keras.
+        """
+
+        return [weights for kernel, bias, _ in self.layers
+                for weights in (kernel, bias)]
+
+
+def save_npz(model, target, dtype=np.float32):
+    """
+    Write the weights of a Keras or NumPy model to a path or a file
+    object in the .npz format.
+    """
+
+    if not isinstance(model, NumpyModel):
+        model = NumpyModel.from_keras(model)
+    arrays = {
+        "format_version": np.array(FORMAT_VERSION),
+        "activations": np.array(
+            [activation for _, _, activation in model.layers]),
+    }
+    for i, (kernel, bias, _) in enumerate(model.layers):
+        arrays[f"kernel_{i}"] = kernel.astype(dtype)
+        arrays[f"bias_{i}"] = bias.astype(dtype)
+    # Uncompressed, so loading is a plain copy of the arrays
+    np.savez(target, **arrays)
+
+
+def model_to_npz_bytes(model, dtype=np.float32):
+    """
+    Return the .npz serialization of a model as bytes.
+    """
+
+    buffer = io.BytesIO()
+    save_npz(model, buffer, dtype)
+    return buffer.getvalue()
+
+
+def load_npz(source):
+    """
+    Read a NumpyModel from a .npz path or file object.
+    """
+
+    with np.load(source) as arrays:
+        if int(arrays["format_version"]) > FORMAT_VERSION:
+            raise ValueError("The model file has a newer format version.")
+        activations = [str(name) for name in arrays["activations"]]
+        layers = [
+            (arrays[f"kernel_{i}"], arrays[f"bias_{i}"], activation)
+            for i, activation in enumerate(activations)
+        ]
+    return NumpyModel(layers)
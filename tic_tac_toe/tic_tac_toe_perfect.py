@@ -0,0 +1,180 @@
+"""
+This module contains the perfect-play AI backend for the tic-tac-toe game.
+Every reachable position is solved once with minimax, the best move and
+the game value are stored in a compact table on disk, and the AI move is
+then a single array lookup.
+"""
+
+import os
+import tempfile
+
+import numpy as np
+
+from .tic_tac_toe_board import CELLS, FULL_MASK, IS_WINNING
+
+
+# The table is kept next to the package, whatever the working directory
+TABLE_FILE = os.environ.get(
+    "TIC_TAC_TOE_PERFECT_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                 "tic_tac_toe_perfect.npy"))
+
+# Number of base-3 encoded boards (each cell is empty, X or O)
+POSITIONS = 3 ** CELLS
+
+# Layout of the last axis of the table
+MOVE, VALUE = 0, 1
+
+# Marker for terminal or unreachable positions in the move column
+NO_MOVE = -1
+
+# Base-3 weight of every 9-bit mask, so a board index is two lookups
+BASE3 = tuple(
+    sum(3 ** i for i in range(CELLS) if mask >> i & 1)
+    for mask in range(1 << CELLS)
+)
+
+
+def side_index(player):
+    """
+    Return the table row of the side to move: 0 for X (1), 1 for O (-1).
+    """
+
+    return 0 if player == 1 else 1
+
+
+def position_index(board):
+    """
+    Return the base-3 index of the board (empty 0, X 1, O 2 per cell).
+    """
+
+    return BASE3[board.x] + 2 * BASE3[board.o]
+
+
+def _solve(x, o, player, memo):
+    """
+    Negamax over bitmasks. Returns (score, move) for the side to move,
+    where faster wins and slower losses get larger absolute scores.
+    """
+
+    key = (x, o, player)
+    if key in memo:
+        return memo[key]
+
+    other = o if player == 1 else x
+    free = ~(x | o) & FULL_MASK
+    if IS_WINNING[other]:
+        result = (-(1 + bin(free).count("1")), NO_MOVE)
+    elif not free:
+        result = (0, NO_MOVE)
+    else:
+        best_score, best_move = None, NO_MOVE
+        for move in range(CELLS):
+            bit = 1 << move
+            if not free & bit:
+                continue
+            if player == 1:
+                score = -_solve(x | bit, o, -1, memo)[0]
+            else:
+                score = -_solve(x, o | bit, 1, memo)[0]
+            if best_score is None or score > best_score:
+                best_score, best_move = score, move
+        result = (best_score, best_move)
+
+    memo[key] = result
+    return result
+
+
+def build_perfect_play_table():
+    """
+    Solve every position reachable from the empty board, with either
+    player moving first, and return the table as an int8 array of
+    shape (2, 3**9, 2): [side to move, position] -> (best move, value).
+    The value is 1 for a win, 0 for a draw and -1 for a loss of the
+    side to move.
+    """
+
+    memo = {}
+    _solve(0, 0, 1, memo)
+    _solve(0, 0, -1, memo)
+
+    table = np.zeros((2, POSITIONS, 2), dtype=np.int8)
+    table[:, :, MOVE] = NO_MOVE
+    for (x, o, player), (score, move) in memo.items():
+        entry = table[side_index(player), BASE3[x] + 2 * BASE3[o]]
+        entry[MOVE] = move
+        entry[VALUE] = (score > 0) - (score < 0)
+
+    return table
+
+
+def save_perfect_play_table(table, path=TABLE_FILE):
+    """
+    Save the table as a plain .npy file that can be memory-mapped.
+    The table is written to a temporary file that replaces the file
+    at once, so other processes never map a half-written table.
+    The file is readable by every user (mkstemp creates it private).
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=".tic_tac_toe_perfect.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp_file:
+            np.save(tmp_file, table)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def load_perfect_play_table(path=TABLE_FILE):
+    """
+    Memory-map the table from disk, building and saving it first
+    if the file does not exist yet.
+    """
+
+    if not os.path.exists(path):
+        print("Building the perfect-play table...")
+        save_perfect_play_table(build_perfect_play_table(), path)
+    return np.load(path, mmap_mode="r")
+
+
+class PerfectPlayer:
+    """
+    AI backend that answers every move with a lookup
+    in the precomputed perfect-play table.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def select_move(self, board, player=-1):
+        """
+        Return the best move for the player on the board.
+        """
+
+        move = int(
+            self.table[side_index(player), position_index(board), MOVE])
+        if move == NO_MOVE:
+            raise ValueError(f"No move available for {board!r}")
+        return move
+
+    def value(self, board, player=-1):
+        """
+        Return the game value for the player to move:
+        1 - win, 0 - draw, -1 - loss with perfect play.
+        """
+
+        return int(
+            self.table[side_index(player), position_index(board), VALUE])
+
+
+def load_perfect_player(path=TABLE_FILE):
+    """
+    Load the perfect-play table and wrap it in a PerfectPlayer.
+    """
+
+    return PerfectPlayer(load_perfect_play_table(path))
@@ -0,0 +1,125 @@
+"""
+This module contains the prediction cache that sits in front of the
+Keras model. Predictions are kept in a bounded LRU cache keyed by the
+packed canonical board, and a cache miss runs a compiled tf.function
+forward pass instead of the full model.predict batch machinery.
+A NumpyModel is called directly, without importing TensorFlow.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .tic_tac_toe_board import CELLS
+from .tic_tac_toe_inference import InferenceBatcher
+from .tic_tac_toe_metrics import span
+from .tic_tac_toe_numpy_model import NumpyModel
+from .tic_tac_toe_symmetry import canonicalize, inverse_move
+
+
+# Maximum number of cached board predictions
+CACHE_SIZE = int(os.environ.get("TIC_TAC_TOE_PREDICT_CACHE", "4096"))
+
+
+def make_forward(model):
+    """
+    Return the batch forward function of a model: the NumpyModel itself,
+    or a compiled tf.function around a Keras model.
+    """
+
+    if isinstance(model, NumpyModel):
+        return model
+
+    import tensorflow as tf
+
+    return tf.function(
+        lambda boards: model(boards, training=False),
+        input_signature=[tf.TensorSpec([None, CELLS], tf.float32)],
+    )
+
+
+class CachedPredictor:
+    """
+    Keras model wrapper with an LRU cache of board predictions.
+    With batched=True, cache misses of all threads are grouped by an
+    InferenceBatcher into batched forward passes.
+    """
+
+    def __init__(self, model, maxsize=CACHE_SIZE, batched=False):
+        self.maxsize = maxsize
+        self.batcher = None
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Changes with every model, so late results of an old model
+        # are never cached
+        self.generation = 0
+        self.set_model(model)
+        if batched:
+            self.batcher = InferenceBatcher(self.forward)
+
+    def set_model(self, model):
+        """
+        Use a new (or retrained) model and drop all cached predictions.
+        """
+
+        with self.lock:
+            self.model = model
+            self.forward = make_forward(model)
+            self.cache.clear()
+            self.generation += 1
+            if self.batcher is not None:
+                self.batcher.set_forward(self.forward)
+
+    def predict_board(self, board):
+        """
+        Return the model output (9 move scores) for one board.
+        """
+
+        key = board.key()
+        with self.lock:
+            prediction = self.cache.get(key)
+            if prediction is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return prediction
+            forward, generation = self.forward, self.generation
+
+        with span("predict"):
+            if self.batcher is not None:
+                prediction = self.batcher.predict(board.to_list())
+            else:
+                boards = np.array([board.to_list()], dtype=np.float32)
+                prediction = np.asarray(forward(boards))[0]
+
+        with self.lock:
+            self.misses += 1
+            if generation != self.generation:
+                return prediction
+            self.cache[key] = prediction
+            if len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        return prediction
+
+    def select_move(self, board, player=-1):
+        """
+        Return the best valid move for the board. The prediction is made
+        on the canonical form, so symmetric positions share cache entries.
+        """
+
+        canonical_board, transform = canonicalize(board)
+        prediction = self.predict_board(canonical_board)
+        valid_moves = canonical_board.legal_moves()
+        best_move = max(valid_moves, key=lambda i: prediction[i])
+        return inverse_move(best_move, transform)
+
+    def close(self):
+        """
+        Stop the inference batcher, if there is one.
+        """
+
+        if self.batcher is not None:
+            self.batcher.close()
@@ -0,0 +1,412 @@
+"""
+This module contains the quota-aware client of the Google Sheets API.
+RateLimitedWorksheet wraps the worksheets returned by
+load_data_from_google_sheets and is shared by all sessions:
+
+- Token buckets keep the reads and the writes of the process within
+  the per-minute Sheets quota.
+- Writes are queued. While a write waits for a token, the compatible
+  writes queued behind it (appends, cell and range updates) are merged,
+  so each merged group is sent as one values_append or batch_update.
+  The caller that finds the queue idle sends the queue until its own
+  write is sent, then hands the queue over to a waiting caller.
+- Calls answered with 429 are retried with jittered exponential
+  backoff, and so are the 5xx answers of the calls that can be sent
+  twice. Appends, inserts and deletes are not retried on 5xx: the
+  request may have been applied before the error.
+- The number of queued writes is exposed as the queue depth.
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+
+from .tic_tac_toe_metrics import count, register_gauge
+from .tic_tac_toe_storage import STORAGE_BACKEND, range_rows, rowcol_to_a1
+
+
+# Requests per minute allowed for reads and for writes; 0 - no limit
+# (the local backend has no quota)
+SHEETS_QUOTA = int(os.environ.get(
+    "TIC_TAC_TOE_SHEETS_QUOTA",
+    "60" if STORAGE_BACKEND == "google" else "0"))
+# Requests that can be sent at once after an idle period
+SHEETS_BURST = int(os.environ.get("TIC_TAC_TOE_SHEETS_BURST", "10"))
+# Retries of a request answered with 429 (or 5xx, if it can be repeated)
+SHEETS_RETRIES = int(os.environ.get("TIC_TAC_TOE_SHEETS_RETRIES", "5"))
+# First and largest backoff delay in seconds
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+
+# Write methods that are queued, by the call they are merged into
+APPEND_METHODS = ("append_row", "append_rows")
+UPDATE_METHODS = ("update_cell", "batch_update")
+INSERT_METHODS = ("insert_row", "insert_rows")
+# Queued, but sent as they are (the argument order changed in gspread 6)
+OTHER_WRITE_METHODS = ("update", "update_cells", "delete_rows", "clear")
+WRITE_METHODS = (
+    APPEND_METHODS + UPDATE_METHODS + INSERT_METHODS + OTHER_WRITE_METHODS)
+# Writes that add or remove rows again when they are sent twice
+NOT_IDEMPOTENT_METHODS = APPEND_METHODS + INSERT_METHODS + ("delete_rows",)
+
+# Wrapped worksheets, by worksheet ID
+WORKSHEETS = {}
+WORKSHEETS_LOCK = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at rate tokens per second, holding at most
+    capacity tokens.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        # Callers waiting for a token
+        self.waiting = 0
+
+    def acquire(self):
+        """
+        Take one token, waiting until one is available.
+        """
+
+        if not self.rate:
+            return
+        with self.lock:
+            self.waiting += 1
+        try:
+            while True:
+                with self.lock:
+                    now = time.monotonic()
+                    self.tokens = min(
+                        self.capacity,
+                        self.tokens + (now - self.updated) * self.rate)
+                    self.updated = now
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                time.sleep(wait)
+        finally:
+            with self.lock:
+                self.waiting -= 1
+
+
+@lru_cache(maxsize=None)
+def get_bucket(kind):
+    """
+    Return the token bucket of the process for "read" or "write" calls.
+    """
+
+    bucket = TokenBucket(SHEETS_QUOTA / 60, max(1, SHEETS_BURST))
+    register_gauge("tic_tac_toe_sheets_waiting", lambda: bucket.waiting,
+                   kind=kind)
+    return bucket
+
+
+def error_status(error):
+    """
+    Return the HTTP status of a gspread or googleapiclient error, if any.
+    """
+
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        return int(status)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error, idempotent=True):
+    """
+    Check whether an error is a quota (429) error, or a server (5xx)
+    error of a request that can be sent again.
+    """
+
+    status = error_status(error)
+    if status is None:
+        return False
+    return status == 429 or (idempotent and status >= 500)
+
+
+def call_with_backoff(fn, *args, retries=SHEETS_RETRIES, idempotent=True,
+                      **kwargs):
+    """
+    Call fn, retrying quota errors (and server errors, if idempotent)
+    with full-jitter exponential backoff. Other errors are raised at once.
+    """
+
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == retries or not is_retryable(e, idempotent):
+                raise
+            count("tic_tac_toe_sheets_retries_total",
+                  status=error_status(e))
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            time.sleep(random.uniform(0, delay))
+
+
+def _as_batch_data(method, args, kwargs):
+    """
+    Return an update call as the data of a batch_update.
+    """
+
+    if method == "batch_update":
+        return list(args[0] if args else kwargs["data"])
+    # update_cell(row, col, value)
+    row, column, value = args
+    return [{"range": rowcol_to_a1(row, column), "values": [[value]]}]
+
+
+def _split_append(response, sizes):
+    """
+    Split the response of a merged append into the responses of its
+    writes, each with the updatedRange of its own rows.
+    """
+
+    updates = (response or {}).get("updates") or {}
+    updated_range = updates.get("updatedRange")
+    if not updated_range:
+        return [response] * len(sizes)
+    sheet, _, cells = updated_range.rpartition("!")
+    columns = re.findall(r"[A-Za-z]+", cells)
+    first_column, last_column = columns[0], columns[-1]
+    row = range_rows(updated_range)[0]
+    responses = []
+    for size in sizes:
+        last_row = row + size - 1
+        cells = f"{first_column}{row}:{last_column}{last_row}"
+        split = dict(updates)
+        split["updatedRange"] = f"{sheet}!{cells}" if sheet else cells
+        split["updatedRows"] = size
+        if "updatedCells" in updates and updates.get("updatedRows"):
+            split["updatedCells"] = (
+                updates["updatedCells"] // updates["updatedRows"] * size)
+        responses.append(dict(response, updates=split))
+        row = last_row + 1
+    return responses
+
+
+class PendingWrite:
+    """
+    A queued write call and the future of its result.
+    """
+
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+
+    def rows(self):
+        """
+        Return the rows of an append or insert.
+        """
+
+        values = self.args[0] if self.args else self.kwargs["values"]
+        if self.method in ("append_row", "insert_row"):
+            return [values]
+        return list(values)
+
+    def group(self):
+        """
+        Return the key of the writes this write can be merged with.
+        """
+
+        if self.method in APPEND_METHODS:
+            return ("append", self.kwargs.get("value_input_option"))
+        if self.method == "update_cell":
+            # gspread writes single cells as user input
+            return ("update", "USER_ENTERED")
+        if self.method == "batch_update" and set(self.kwargs) <= {
+                "data", "value_input_option"}:
+            return ("update", self.kwargs.get("value_input_option"))
+        if self.method in INSERT_METHODS:
+            row = self.args[1] if len(self.args) > 1 else self.kwargs.get(
+                "row", 1)
+            return ("insert", row, self.kwargs.get("value_input_option"))
+        return None
+
+
+class RateLimitedWorksheet:
+    """
+    Worksheet wrapper that rate-limits, coalesces and retries the calls.
+    Writes return when they (or the merged call they are part of) have
+    been sent. Other attributes (id, title, ...) are passed through.
+    """
+
+    def __init__(self, worksheet, reads=None, writes=None):
+        self._worksheet = worksheet
+        self._reads = reads or get_bucket("read")
+        self._writes = writes or get_bucket("write")
+        self._pending = deque()
+        self._lock = threading.Lock()
+        # Notified whenever a group of writes has been sent
+        self._sent = threading.Condition(self._lock)
+        self._flushing = False
+        register_gauge("tic_tac_toe_sheets_queue_depth", self.queue_depth,
+                       worksheet=getattr(worksheet, "title", ""))
+
+    def __getattr__(self, name):
+        value = getattr(self._worksheet, name)
+        if name.startswith("_") or not callable(value):
+            return value
+        if name in WRITE_METHODS:
+            return lambda *args, **kwargs: self._write(name, args, kwargs)
+
+        def read(*args, **kwargs):
+            self._reads.acquire()
+            return call_with_backoff(value, *args, **kwargs)
+
+        return read
+
+    def queue_depth(self):
+        """
+        Return the number of writes waiting to be sent.
+        """
+
+        with self._lock:
+            return len(self._pending)
+
+    def _write(self, method, args, kwargs):
+        """
+        Queue a write and wait for its result. A caller that finds the
+        queue idle sends the queued writes for everyone until its own
+        write is sent; then a waiting caller takes over.
+        """
+
+        pending = PendingWrite(method, args, kwargs)
+        with self._lock:
+            self._pending.append(pending)
+            while self._flushing and not pending.future.done():
+                self._sent.wait()
+            leader = not pending.future.done()
+            if leader:
+                self._flushing = True
+        if leader:
+            try:
+                self._drain(pending)
+            finally:
+                with self._lock:
+                    self._flushing = False
+                    self._sent.notify_all()
+        return pending.future.result()
+
+    def _next_group(self):
+        """
+        Take the longest run of mergeable writes from the queue.
+        """
+
+        with self._lock:
+            writes = [self._pending.popleft()]
+            key = writes[0].group()
+            while key is not None and self._pending and (
+                    self._pending[0].group() == key):
+                writes.append(self._pending.popleft())
+        return writes
+
+    def _drain(self, own):
+        """
+        Send the queued writes in order until own has been sent.
+        """
+
+        while not own.future.done():
+            # Writes queued while waiting for the token are merged
+            self._writes.acquire()
+            writes = self._next_group()
+            try:
+                results = self._send(writes)
+            except Exception as e:
+                for write in writes:
+                    write.future.set_exception(e)
+            else:
+                for write, result in zip(writes, results):
+                    write.future.set_result(result)
+            with self._lock:
+                self._sent.notify_all()
+
+    def _send(self, writes):
+        """
+        Send a group of writes as one call and return the result of
+        every write.
+        """
+
+        first = writes[0]
+        if len(writes) > 1:
+            count("tic_tac_toe_sheets_coalesced_total", len(writes) - 1)
+        worksheet = self._worksheet
+        if len(writes) == 1:
+            return [call_with_backoff(
+                getattr(worksheet, first.method), *first.args,
+                idempotent=first.method not in NOT_IDEMPOTENT_METHODS,
+                **first.kwargs)]
+
+        kind = first.group()[0]
+        options = dict(first.kwargs)
+        options.pop("values", None)
+        if kind == "append":
+            rows = [row for write in writes for row in write.rows()]
+            response = call_with_backoff(
+                worksheet.append_rows, rows, idempotent=False, **options)
+            return _split_append(
+                response, [len(write.rows()) for write in writes])
+        if kind == "insert":
+            # Rows inserted later at the same row end up above the others
+            rows = [row for write in reversed(writes) for row in write.rows()]
+            options.pop("row", None)
+            result = call_with_backoff(
+                worksheet.insert_rows, rows, first.group()[1],
+                idempotent=False, **options)
+            return [result] * len(writes)
+        data = []
+        for write in writes:
+            data.extend(_as_batch_data(write.method, write.args,
+                                       write.kwargs))
+        value_input_option = first.group()[1]
+        if value_input_option:
+            result = call_with_backoff(
+                worksheet.batch_update, data,
+                value_input_option=value_input_option)
+        else:
+            result = call_with_backoff(worksheet.batch_update, data)
+        return [result] * len(writes)
+
+    def __repr__(self):
+        return f"RateLimitedWorksheet({self._worksheet!r})"
+
+
+def rate_limited(worksheet):
+    """
+    Return the shared rate-limited wrapper of a worksheet, so all
+    sessions queue their writes in the same place.
+    """
+
+    with WORKSHEETS_LOCK:
+        wrapper = WORKSHEETS.get(worksheet.id)
+        if wrapper is None:
+            wrapper = WORKSHEETS[worksheet.id] = RateLimitedWorksheet(
+                worksheet)
+    return wrapper
+
+
+def sheets_queue_depth():
+    """
+    Return the number of writes queued for all worksheets.
+    """
+
+    with WORKSHEETS_LOCK:
+        wrappers = list(WORKSHEETS.values())
+    return sum(wrapper.queue_depth() for wrapper in wrappers)
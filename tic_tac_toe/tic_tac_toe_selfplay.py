@@ -0,0 +1,295 @@
+"""
+This module contains the headless self-play simulator.
+Games between pluggable agents are played in vectorized batches of
+boards without any input or output, and the results are written as a
+compact .npz dataset that can be used for training.
+
+Usage:
+    python -m tic_tac_toe.tic_tac_toe_selfplay --games 100000 \\
+        --x random --o perfect --output selfplay.npz
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from .tic_tac_toe_board import CELLS, WIN_MASKS
+from .tic_tac_toe_perfect import MOVE, NO_MOVE, load_perfect_play_table
+
+
+# Cell indexes of the eight winning lines, shape (8, 3)
+WIN_LINES = np.array(
+    [[i for i in range(CELLS) if mask >> i & 1] for mask in WIN_MASKS],
+    dtype=np.intp,
+)
+# Base-3 weights of the cells, used to index the perfect-play table
+POWERS_OF_3 = 3 ** np.arange(CELLS)
+
+
+def batch_status(boards):
+    """
+    Return the status of every board in an (N, 9) batch:
+    1 or -1 for a win, 0 for a draw and 2 while the game is going.
+    """
+
+    line_sums = boards[:, WIN_LINES].sum(axis=2)
+    winners = np.full(len(boards), 2, dtype=np.int8)
+    winners[(boards != 0).all(axis=1)] = 0
+    winners[(line_sums == -3).any(axis=1)] = -1
+    winners[(line_sums == 3).any(axis=1)] = 1
+    return winners
+
+
+class RandomAgent:
+    """
+    Agent that plays a uniformly random legal move.
+    """
+
+    name = "random"
+
+    def select_moves(self, boards, players, rng):
+        """
+        Return one move per board of the batch.
+        """
+
+        scores = rng.random(boards.shape)
+        scores[boards != 0] = -1.0
+        return scores.argmax(axis=1)
+
+
+class PerfectAgent:
+    """
+    Agent that plays the perfect-play table move (minimax).
+    """
+
+    name = "perfect"
+
+    def __init__(self, table=None):
+        self.table = load_perfect_play_table() if table is None else table
+
+    def select_moves(self, boards, players, rng):
+        """
+        Return one move per board of the batch.
+        """
+
+        digits = np.where(boards == -1, 2, boards)
+        indexes = digits.astype(np.int64) @ POWERS_OF_3
+        sides = (players == -1).astype(np.intp)
+        moves = np.asarray(self.table[sides, indexes, MOVE], dtype=np.intp)
+        # Positions the table has never reached fall back to any free cell
+        missing = moves == NO_MOVE
+        if missing.any():
+            moves[missing] = (boards[missing] == 0).argmax(axis=1)
+        return moves
+
+
+class ModelAgent:
+    """
+    Agent that plays the best legal move of a Keras model.
+    """
+
+    name = "model"
+
+    def __init__(self, model):
+        self.model = model
+
+    def select_moves(self, boards, players, rng):
+        """
+        Return one move per board of the batch.
+        """
+
+        prediction = np.asarray(
+            self.model(boards.astype(np.float32), training=False))
+        prediction = np.where(boards == 0, prediction, -np.inf)
+        return prediction.argmax(axis=1)
+
+
+class EpsilonGreedyAgent:
+    """
+    Agent that plays a random move with probability epsilon
+    and the move of another agent otherwise.
+    """
+
+    def __init__(self, agent, epsilon=0.1):
+        self.agent = agent
+        self.epsilon = epsilon
+        self.random = RandomAgent()
+        self.name = f"{agent.name}-eps{epsilon}"
+
+    def select_moves(self, boards, players, rng):
+        """
+        Return one move per board of the batch.
+        """
+
+        moves = self.agent.select_moves(boards, players, rng)
+        explore = rng.random(len(boards)) < self.epsilon
+        if explore.any():
+            moves[explore] = self.random.select_moves(
+                boards[explore], players[explore], rng)
+        return moves
+
+
+def play_batch(agent_x, agent_o, n_games, rng, first_player=None):
+    """
+    Play n_games at once. Returns a dict of arrays: for every half-move
+    the board after the move, the move, the player and the game number,
+    and for every game its first player and winner.
+    """
+
+    boards = np.zeros((n_games, CELLS), dtype=np.int8)
+    if first_player is None:
+        # Alternate the first move between the games
+        players = np.where(np.arange(n_games) % 2 == 0, 1, -1)
+    else:
+        players = np.full(n_games, first_player)
+    players = players.astype(np.int8)
+    first_players = players.copy()
+    winners = np.full(n_games, 2, dtype=np.int8)
+    active = np.arange(n_games)
+
+    records = {"boards": [], "moves": [], "players": [], "games": []}
+    while len(active):
+        moves = np.empty(len(active), dtype=np.intp)
+        for player, agent in ((1, agent_x), (-1, agent_o)):
+            turn = players[active] == player
+            if turn.any():
+                games = active[turn]
+                moves[turn] = agent.select_moves(
+                    boards[games], players[games], rng)
+
+        boards[active, moves] = players[active]
+        records["boards"].append(boards[active].copy())
+        records["moves"].append(moves.astype(np.int8))
+        records["players"].append(players[active].copy())
+        records["games"].append(active.astype(np.int32))
+
+        status = batch_status(boards[active])
+        finished = status != 2
+        winners[active[finished]] = status[finished]
+        players[active] = -players[active]
+        active = active[~finished]
+
+    result = {key: np.concatenate(value) for key, value in records.items()}
+    result["first_players"] = first_players
+    result["winners"] = winners
+    return result
+
+
+def simulate(agent_x, agent_o, n_games, batch_size=10000, seed=None):
+    """
+    Play n_games in batches and return the merged dataset arrays
+    (empty arrays if n_games is 0).
+    """
+
+    if n_games <= 0:
+        return {
+            "boards": np.zeros((0, CELLS), dtype=np.int8),
+            "moves": np.zeros(0, dtype=np.int8),
+            "players": np.zeros(0, dtype=np.int8),
+            "games": np.zeros(0, dtype=np.int32),
+            "first_players": np.zeros(0, dtype=np.int8),
+            "winners": np.zeros(0, dtype=np.int8),
+        }
+    rng = np.random.default_rng(seed)
+    batches = []
+    offset = 0
+    while offset < n_games:
+        size = min(batch_size, n_games - offset)
+        batch = play_batch(agent_x, agent_o, size, rng)
+        batch["games"] += offset
+        batches.append(batch)
+        offset += size
+    return {
+        key: np.concatenate([batch[key] for batch in batches])
+        for key in batches[0]
+    }
+
+
+def save_dataset(dataset, path):
+    """
+    Write the dataset as a compressed .npz file.
+    """
+
+    np.savez_compressed(path, **dataset)
+
+
+def load_dataset(path):
+    """
+    Read a self-play dataset and return (boards, moves),
+    the same arrays as parsed from the data sheet.
+    """
+
+    with np.load(path) as dataset:
+        return dataset["boards"], dataset["moves"]
+
+
+def make_agent(name, epsilon=0.0, model_path=None):
+    """
+    Build an agent by name: random, perfect or model.
+    """
+
+    if name == "random":
+        agent = RandomAgent()
+    elif name == "perfect":
+        agent = PerfectAgent()
+    elif name == "model":
+        import tensorflow as tf
+        agent = ModelAgent(
+            tf.keras.models.load_model(model_path, compile=False))
+    else:
+        raise ValueError(f"Unknown agent: {name}")
+    if epsilon:
+        agent = EpsilonGreedyAgent(agent, epsilon)
+    return agent
+
+
+def positive_int(value):
+    """
+    Argument type of the counts that must be at least 1.
+    """
+
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return number
+
+
+def main():
+    """
+    Command line entry point of the simulator.
+    """
+
+    parser = argparse.ArgumentParser(description="Headless self-play.")
+    parser.add_argument("--games", type=positive_int, default=10000)
+    parser.add_argument("--batch-size", type=positive_int, default=10000)
+    parser.add_argument("--x", default="random",
+                        choices=["random", "perfect", "model"])
+    parser.add_argument("--o", default="perfect",
+                        choices=["random", "perfect", "model"])
+    parser.add_argument("--epsilon", type=float, default=0.0,
+                        help="Random move probability for both agents")
+    parser.add_argument("--model", help="Path of a .h5 model file")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", default="selfplay.npz")
+    args = parser.parse_args()
+
+    agent_x = make_agent(args.x, args.epsilon, args.model)
+    agent_o = make_agent(args.o, args.epsilon, args.model)
+
+    start = time.perf_counter()
+    dataset = simulate(
+        agent_x, agent_o, args.games, args.batch_size, args.seed)
+    elapsed = time.perf_counter() - start
+    save_dataset(dataset, args.output)
+
+    winners = dataset["winners"]
+    print(f"{args.games} games in {elapsed:.2f}s "
+          f"({args.games / elapsed:.0f} games/s)")
+    print(f"X wins: {(winners == 1).sum()}, O wins: {(winners == -1).sum()}, "
+          f"draws: {(winners == 0).sum()}")
+    print(f"Saved {len(dataset['moves'])} moves to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+"""
+This module contains the long-lived game server.
+One Python process hosts many independent game sessions, so the model,
+the Google Sheets/Drive connections and the prediction cache are loaded
+once and shared. Terminal front ends attach over a local socket with a
+line protocol: every line the client sends is one answer to an input()
+prompt, and everything the session prints is streamed back.
+
+The game code itself is unchanged: each session runs in its own thread,
+and sys.stdin/sys.stdout are routed to the socket of the session that
+owns the current thread.
+
+The server stops on SIGTERM (how Heroku stops a dyno) or SIGINT: it stops
+accepting connections, ends the running sessions, waits for their threads
+and only then releases the shared resources. Connections beyond
+TIC_TAC_TOE_MAX_SESSIONS are told that the server is full and closed.
+"""
+
+import asyncio
+import io
+import os
+import queue
+import signal
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+SOCKET_PATH = os.environ.get("TIC_TAC_TOE_SOCKET", "/tmp/tic_tac_toe.sock")
+# Every session holds one thread while it waits for input
+MAX_SESSIONS = int(os.environ.get("TIC_TAC_TOE_MAX_SESSIONS", "64"))
+# Seconds the running sessions get to end when the server stops
+SHUTDOWN_TIMEOUT = float(
+    os.environ.get("TIC_TAC_TOE_SHUTDOWN_TIMEOUT", "10"))
+# Sent to the clients that connect when all sessions are taken
+SERVER_FULL = "All game tables are taken, please try again later.\n"
+
+# The session served by the current thread, if any
+_current = threading.local()
+
+
+class _RoutedStdout(io.TextIOBase):
+    """
+    sys.stdout replacement that writes to the session of the current
+    thread, or to the real stdout outside of sessions.
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def write(self, data):
+        session = getattr(_current, "session", None)
+        if session is None:
+            return self.default.write(data)
+        session.write(data)
+        return len(data)
+
+    def flush(self):
+        if getattr(_current, "session", None) is None:
+            self.default.flush()
+
+    def isatty(self):
+        # input() must not use the terminal line editor for sessions
+        return False
+
+
+class _RoutedStdin(io.TextIOBase):
+    """
+    sys.stdin replacement that reads the lines sent by the client
+    of the current thread's session.
+    """
+
+    def __init__(self, default):
+        self.default = default
+
+    def readline(self, size=-1):
+        session = getattr(_current, "session", None)
+        if session is None:
+            return self.default.readline(size)
+        return session.readline()
+
+    def isatty(self):
+        return False
+
+
+def install_stream_routing():
+    """
+    Replace sys.stdin and sys.stdout with the per-session routers.
+    """
+
+    if not isinstance(sys.stdout, _RoutedStdout):
+        sys.stdout = _RoutedStdout(sys.stdout)
+    if not isinstance(sys.stdin, _RoutedStdin):
+        sys.stdin = _RoutedStdin(sys.stdin)
+
+
+class Session:
+    """
+    One connected player: a queue of input lines from the socket
+    and a writer for the output.
+    """
+
+    def __init__(self, loop, writer):
+        self.loop = loop
+        self.writer = writer
+        self.lines = queue.Queue()
+        # Future of the game thread, set when the game starts
+        self.game = None
+
+    def write(self, data):
+        """
+        Send output to the client (called from the session thread).
+        """
+
+        try:
+            self.loop.call_soon_threadsafe(
+                self.writer.write, data.encode())
+        except RuntimeError:
+            pass  # The server has stopped and closed the loop
+
+    def readline(self):
+        """
+        Wait for the next input line. An empty string means the client
+        has gone, which makes input() raise EOFError.
+        """
+
+        line = self.lines.get()
+        if line is None:
+            # Every later prompt also ends the session
+            self.lines.put(None)
+            return ""
+        return line
+
+    def close(self):
+        """
+        End the session: its next prompt raises EOFError.
+        """
+
+        self.lines.put(None)
+
+    def run(self, session_main, shared):
+        """
+        Run the game for this session in the current thread.
+        """
+
+        _current.session = self
+        try:
+            session_main(shared)
+        except EOFError:
+            pass  # The client disconnected while a prompt was waiting
+        except Exception:
+            self.write(traceback.format_exc())
+        finally:
+            _current.session = None
+
+
+class GameServer:
+    """
+    asyncio server that runs a game session for every connection
+    and shares the resources loaded once by load_shared.
+    """
+
+    def __init__(self, session_main, load_shared=None, close_shared=None,
+                 path=SOCKET_PATH, max_sessions=MAX_SESSIONS):
+        self.session_main = session_main
+        self.load_shared = load_shared
+        self.close_shared = close_shared
+        self.path = path
+        self.max_sessions = max_sessions
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_sessions + 1, thread_name_prefix="session")
+        self.loading = None
+        self.shared = None
+        # Sessions being played
+        self.sessions = set()
+
+    async def handle(self, reader, writer):
+        """
+        Serve one client connection until the game or the client ends.
+        """
+
+        loop = asyncio.get_running_loop()
+        if len(self.sessions) >= self.max_sessions:
+            # Every session thread is taken; don't queue the player
+            writer.write(SERVER_FULL.encode())
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+            return
+        session = Session(loop, writer)
+        self.sessions.add(session)
+        try:
+            await self.play(session, reader, writer)
+        finally:
+            self.sessions.discard(session)
+
+    async def play(self, session, reader, writer):
+        """
+        Run the game of a session while pumping the client's input.
+        """
+
+        loop = asyncio.get_running_loop()
+        shared = await asyncio.shield(self.loading)
+        game = session.game = loop.run_in_executor(
+            self.executor, session.run, self.session_main, shared)
+
+        async def pump_input():
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                session.lines.put(line.decode(errors="replace"))
+            session.lines.put(None)
+
+        pump = asyncio.ensure_future(pump_input())
+        try:
+            await game
+        finally:
+            pump.cancel()
+            try:
+                await writer.drain()
+            except ConnectionError:
+                pass
+            writer.close()
+
+    async def serve(self):
+        """
+        Load the shared resources and accept connections until
+        SIGTERM or SIGINT.
+        """
+
+        loop = asyncio.get_running_loop()
+        stop = asyncio.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # No signal handlers outside the main thread
+        install_stream_routing()
+        # Start listening at once; sessions wait until loading is done
+        self.loading = loop.run_in_executor(
+            self.executor, self.load_shared or (lambda: None))
+
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        server = await asyncio.start_unix_server(self.handle, path=self.path)
+        print(f"Game server listening on {self.path}")
+        try:
+            self.shared = await self.loading
+            async with server:
+                serving = asyncio.ensure_future(server.serve_forever())
+                stopping = asyncio.ensure_future(stop.wait())
+                await asyncio.wait(
+                    {serving, stopping},
+                    return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+                if serving.done():
+                    serving.result()  # Raise the error that stopped it
+                serving.cancel()
+                if stop.is_set():
+                    print("Game server stopping.")
+                server.close()
+                await self.end_sessions()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    async def end_sessions(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        End the running sessions and wait for their threads, so no
+        session still uses the shared resources when they are released.
+        """
+
+        games = [
+            session.game for session in self.sessions
+            if session.game is not None
+        ]
+        for session in list(self.sessions):
+            session.close()
+        if games:
+            _, running = await asyncio.wait(games, timeout=timeout)
+            if running:
+                print(f"{len(running)} sessions did not end in time.")
+
+    def run(self):
+        """
+        Run the server until it is stopped, then release the shared
+        resources (close_shared also flushes the buffered boards).
+        """
+
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self.close_shared is not None and self.shared is not None:
+                self.close_shared(self.shared)
+            self.executor.shutdown(wait=False)
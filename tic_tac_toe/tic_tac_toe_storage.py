@@ -0,0 +1,638 @@
+"""
+This module contains the storage backends behind tic_tac_toe_google.py.
+The Google backend uses Google Sheets and Google Drive. The local backend
+keeps the worksheets in SQLite and the model files in a directory, so the
+game can be run, benchmarked and tested without credentials or network.
+The backend is selected with TIC_TAC_TOE_STORAGE ("google" or "local").
+"""
+
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from .tic_tac_toe_metrics import InstrumentedClient
+
+
+STORAGE_BACKEND = os.environ.get("TIC_TAC_TOE_STORAGE", "google").lower()
+LOCAL_STORAGE_DIR = os.environ.get(
+    "TIC_TAC_TOE_LOCAL_STORAGE", ".local_storage")
+
+SERVICE_ACCOUNT_FILE = "creds.json"
+SCOPES = [
+    "https://www.googleapis.com/auth/drive",
+    "https://www.googleapis.com/auth/spreadsheets",
+    "https://www.googleapis.com/auth/drive.file",
+]
+
+# Header rows of new local worksheets
+DEFAULT_HEADERS = {
+    "leadersboard": [
+        "human_nickname", "total_games", "win_human", "win_ai", "draws",
+    ],
+}
+
+
+@lru_cache(maxsize=None)
+def get_credentials():
+    """
+    Reads the service account credentials on first use.
+    """
+
+    from google.oauth2.service_account import Credentials
+    return Credentials.from_service_account_file(
+        SERVICE_ACCOUNT_FILE, scopes=SCOPES)
+
+
+@lru_cache(maxsize=None)
+def get_client():
+    """
+    Authorizes the credentials and creates a gspread client on first use.
+    """
+
+    import gspread
+    return gspread.authorize(get_credentials())
+
+
+@lru_cache(maxsize=None)
+def get_service():
+    """
+    Builds the Google Drive client on first use.
+    googleapiclient is only imported when Drive is actually needed.
+    """
+
+    from googleapiclient.discovery import build
+    return build("drive", "v3", credentials=get_credentials())
+
+
+class GoogleStorage:
+    """
+    Storage backend on Google Sheets and Google Drive.
+    """
+
+    name = "google"
+
+    def open_spreadsheet(self, title):
+        """
+        Open a spreadsheet by its title.
+        """
+
+        return get_client().open(title)
+
+    def find_files(self, name, fields):
+        """
+        Return the metadata of the Drive files with the given name,
+        most recently modified first.
+        """
+
+        results = (
+            get_service().files()
+            .list(
+                q=f"name='{name}' and trashed=false",
+                pageSize=100,
+                orderBy="modifiedTime desc",
+                fields=f"files({fields})",
+            )
+            .execute()
+        )
+        return results.get("files", [])
+
+    def get_file_metadata(self, file_id, fields):
+        """
+        Return the metadata of one Drive file.
+        """
+
+        return (
+            get_service().files()
+            .get(fileId=file_id, fields=fields)
+            .execute()
+        )
+
+    def download_file(self, file_id):
+        """
+        Download the content of a Drive file.
+        """
+
+        from googleapiclient.http import MediaIoBaseDownload
+
+        request = get_service().files().get_media(fileId=file_id)
+        fh = io.BytesIO()
+        downloader = MediaIoBaseDownload(fh, request)
+        done = False
+        while done is False:
+            status, done = downloader.next_chunk()
+            print("Download %d%%." % int(status.progress() * 100))
+        return fh.getvalue()
+
+    def upload_file(self, metadata, data):
+        """
+        Upload a new Drive file and return its ID.
+        """
+
+        from googleapiclient.http import MediaIoBaseUpload
+
+        # Preparing a streaming upload
+        media = MediaIoBaseUpload(
+            io.BytesIO(data), mimetype=metadata["mimeType"], resumable=True
+        )
+        file = (
+            get_service().files()
+            .create(body=metadata, media_body=media, fields="id")
+            .execute()
+        )
+        return file.get("id")
+
+    def update_file(self, file_id, metadata, data):
+        """
+        Replace the content and metadata of an existing Drive file.
+        Drive keeps the previous content as a revision.
+        """
+
+        from googleapiclient.http import MediaIoBaseUpload
+
+        media = MediaIoBaseUpload(
+            io.BytesIO(data), mimetype=metadata["mimeType"], resumable=True
+        )
+        # The parents of a file are changed with addParents, not the body
+        body = {
+            key: value for key, value in metadata.items() if key != "parents"
+        }
+        get_service().files().update(
+            fileId=file_id, body=body, media_body=media, fields="id"
+        ).execute()
+        return file_id
+
+    def delete_file(self, file_id):
+        """
+        Delete a Drive file.
+        """
+
+        get_service().files().delete(fileId=file_id).execute()
+
+    def prune_revisions(self, file_id, keep):
+        """
+        Delete all but the newest keep revisions of a Drive file.
+        """
+
+        revisions = (
+            get_service().revisions()
+            .list(fileId=file_id, fields="revisions(id, modifiedTime)")
+            .execute()
+            .get("revisions", [])
+        )
+        revisions.sort(key=lambda revision: revision["modifiedTime"])
+        # The newest revision is the current content and is always kept
+        for revision in revisions[:-max(keep, 1)]:
+            get_service().revisions().delete(
+                fileId=file_id, revisionId=revision["id"]).execute()
+
+
+def _column_number(letters):
+    """
+    Convert column letters (A, B, ..., AA) to a 1-based number.
+    """
+
+    number = 0
+    for letter in letters.upper():
+        number = number * 26 + ord(letter) - ord("A") + 1
+    return number
+
+
+def column_letters(column):
+    """
+    Convert a 1-based column number to its letters (1 - A, 27 - AA).
+    """
+
+    letters = ""
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def rowcol_to_a1(row, column):
+    """
+    Convert a 1-based row and column to an A1 cell like "B7"
+    (the same as gspread.utils.rowcol_to_a1, without importing gspread).
+    """
+
+    return f"{column_letters(column)}{row}"
+
+
+def range_rows(a1_range):
+    """
+    Return the first and last row of an A1 range such as
+    "leadersboard!A5:E7" (the updatedRange of an append response).
+    """
+
+    cells = a1_range.rsplit("!", 1)[-1].replace("'", "").split(":")
+    first_row = _parse_a1(cells[0])[0]
+    last_row = _parse_a1(cells[-1])[0]
+    return first_row, last_row
+
+
+def appended_rows(response):
+    """
+    Return the first and last row written by an append, from the
+    updatedRange of its response, or None if the response has none.
+    """
+
+    updated_range = ((response or {}).get("updates") or {}).get(
+        "updatedRange")
+    if not updated_range:
+        return None
+    return range_rows(updated_range)
+
+
+def _parse_a1(a1):
+    """
+    Parse an A1 cell like "B7" into (row, column); the row may be
+    missing ("B" means the whole column) and is then None.
+    """
+
+    match = re.fullmatch(r"([A-Za-z]+)(\d*)", a1)
+    if match is None:
+        raise ValueError(f"Invalid A1 notation: {a1}")
+    row = int(match.group(2)) if match.group(2) else None
+    return row, _column_number(match.group(1))
+
+
+class LocalWorksheet:
+    """
+    SQLite stand-in for the part of the gspread Worksheet API
+    used by the game.
+    """
+
+    def __init__(self, spreadsheet, worksheet_id, title):
+        self.spreadsheet = spreadsheet
+        self.id = worksheet_id
+        self.title = title
+
+    def _rows(self, first=1, last=None):
+        """
+        Return {row number: list of values} of the rows first to last
+        (to the end of the worksheet if last is None).
+        """
+
+        cursor = self.spreadsheet.execute(
+            "SELECT row, data FROM cells WHERE worksheet = ? "
+            "AND row >= ? AND row <= ? ORDER BY row",
+            (self.id, first, last if last is not None else 2 ** 62))
+        return {row: json.loads(data) for row, data in cursor}
+
+    def _write_row(self, row, values, replace=True):
+        """
+        Store the values of one row, replacing the old ones. A new row
+        (replace=False) that already exists raises IntegrityError.
+        """
+
+        self.spreadsheet.execute(
+            f"INSERT {'OR REPLACE ' if replace else ''}INTO cells "
+            "(worksheet, row, data) VALUES (?, ?, ?)",
+            (self.id, row, json.dumps(values)))
+
+    def _last_row(self):
+        """
+        Return the number of the last row with data (0 if empty).
+        """
+
+        cursor = self.spreadsheet.execute(
+            "SELECT COALESCE(MAX(row), 0) FROM cells WHERE worksheet = ?",
+            (self.id,))
+        return cursor.fetchone()[0]
+
+    def get_all_values(self):
+        """
+        Return all rows as lists of strings, like gspread.
+        """
+
+        rows = self._rows()
+        if not rows:
+            return []
+        width = max(len(values) for values in rows.values())
+        return [
+            [str(value) for value in rows.get(row, [])]
+            + [""] * (width - len(rows.get(row, [])))
+            for row in range(1, max(rows) + 1)
+        ]
+
+    def get(self, range_name):
+        """
+        Return the rows of an A1 range such as "A5:B" as lists of strings.
+        """
+
+        start, end = (range_name.split(":") + [None])[:2]
+        first_row, first_column = _parse_a1(start)
+        last_row, last_column = (
+            _parse_a1(end) if end else (first_row, first_column))
+        first_row = first_row or 1
+        rows = self._rows(first_row, last_row)
+        last_row = last_row or max(rows, default=0)
+        result = []
+        for row in range(first_row, last_row + 1):
+            values = rows.get(row, [])[first_column - 1:last_column]
+            result.append([str(value) for value in values])
+        # Trailing empty rows are not returned, like in gspread
+        while result and not any(result[-1]):
+            result.pop()
+        return result
+
+    def batch_get(self, ranges, **kwargs):
+        """
+        Return the values of several A1 ranges, like get for each.
+        """
+
+        with self.spreadsheet.lock:
+            return [self.get(range_name) for range_name in ranges]
+
+    def append_row(self, values, **kwargs):
+        """
+        Add one row after the last row with data.
+        """
+
+        return self.append_rows([values])
+
+    def append_rows(self, values, **kwargs):
+        """
+        Add rows after the last row with data. Returns the range that
+        was written, in the form of the Sheets API response.
+        """
+
+        with self.spreadsheet.transaction():
+            return self._append_rows(values)
+
+    def _append_rows(self, values):
+        """
+        Add rows within the current transaction, so no other process
+        appends between finding the last row and writing after it.
+        """
+
+        row = first_row = self._last_row() + 1
+        width = 1
+        for row_values in values:
+            self._write_row(row, list(row_values), replace=False)
+            width = max(width, len(row_values))
+            row += 1
+        return {
+            "updates": {
+                "updatedRange": (
+                    f"{self.title}!{rowcol_to_a1(first_row, 1)}:"
+                    f"{rowcol_to_a1(row - 1, width)}"),
+                "updatedRows": len(values),
+            },
+        }
+
+    def insert_rows(self, values, row=1, **kwargs):
+        """
+        Insert rows before the given row, moving the rest down.
+        """
+
+        with self.spreadsheet.transaction():
+            # Move the rows down in two steps to keep the keys unique
+            self.spreadsheet.execute(
+                "UPDATE cells SET row = -(row + ?) "
+                "WHERE worksheet = ? AND row >= ?",
+                (len(values), self.id, row))
+            self.spreadsheet.execute(
+                "UPDATE cells SET row = -row WHERE worksheet = ? AND row < 0",
+                (self.id,))
+            for offset, row_values in enumerate(values):
+                self._write_row(row + offset, list(row_values), replace=False)
+
+    def batch_update(self, data, **kwargs):
+        """
+        Write several A1 ranges at once.
+        """
+
+        with self.spreadsheet.transaction():
+            # Only the rows that are written are read
+            updates = []
+            for update in data:
+                start = update["range"].split(":")[0]
+                first_row, first_column = _parse_a1(start)
+                updates.append((first_row, first_column, update["values"]))
+            rows = {}
+            for first_row, _, values in updates:
+                rows.update(
+                    self._rows(first_row, first_row + len(values) - 1))
+            for first_row, first_column, update_values in updates:
+                for offset, range_values in enumerate(update_values):
+                    row = first_row + offset
+                    values = rows.get(row, [])
+                    end = first_column - 1 + len(range_values)
+                    values += [""] * (end - len(values))
+                    values[first_column - 1:end] = range_values
+                    rows[row] = values
+                    self._write_row(row, values)
+
+
+class LocalSpreadsheet:
+    """
+    SQLite database that holds the local worksheets.
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            "CREATE TABLE IF NOT EXISTS worksheets ("
+            " id INTEGER PRIMARY KEY, title TEXT UNIQUE);"
+            "CREATE TABLE IF NOT EXISTS cells ("
+            " worksheet INTEGER, row INTEGER, data TEXT,"
+            " PRIMARY KEY (worksheet, row));"
+        )
+
+    def execute(self, sql, parameters=()):
+        """
+        Run one SQL statement under the lock.
+        """
+
+        with self.lock:
+            return self.connection.execute(sql, parameters)
+
+    def commit(self):
+        """
+        Commit the pending changes.
+        """
+
+        with self.lock:
+            self.connection.commit()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the statements of the block in one write transaction.
+        BEGIN IMMEDIATE takes the write lock of the database file at
+        once, so other processes sharing the file cannot write between
+        the reads and the writes of the block.
+        """
+
+        with self.lock:
+            if self.connection.in_transaction:
+                self.connection.commit()
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.connection.rollback()
+                raise
+            self.connection.commit()
+
+    def worksheet(self, title):
+        """
+        Return a worksheet by title, creating it (with its default
+        header row) if it does not exist yet.
+        """
+
+        with self.transaction():
+            found = self.execute(
+                "SELECT id FROM worksheets WHERE title = ?",
+                (title,)).fetchone()
+            if found is not None:
+                return LocalWorksheet(self, found[0], title)
+            cursor = self.execute(
+                "INSERT INTO worksheets (title) VALUES (?)", (title,))
+            worksheet = LocalWorksheet(self, cursor.lastrowid, title)
+            if title in DEFAULT_HEADERS:
+                worksheet._append_rows([DEFAULT_HEADERS[title]])
+            return worksheet
+
+
+class LocalStorage:
+    """
+    Storage backend on a local SQLite file and a model directory.
+    """
+
+    name = "local"
+
+    def __init__(self, root=LOCAL_STORAGE_DIR):
+        self.root = root
+        self.models_dir = os.path.join(root, "models")
+        self.spreadsheets = {}
+        self.lock = threading.Lock()
+
+    def open_spreadsheet(self, title):
+        """
+        Open (or create) the local spreadsheet with the given title.
+        """
+
+        with self.lock:
+            if title not in self.spreadsheets:
+                self.spreadsheets[title] = LocalSpreadsheet(
+                    os.path.join(self.root, f"{title}.sqlite3"))
+            return self.spreadsheets[title]
+
+    def _metadata_path(self, file_id):
+        return os.path.join(self.models_dir, f"{file_id}.json")
+
+    def _data_path(self, file_id):
+        return os.path.join(self.models_dir, f"{file_id}.bin")
+
+    def find_files(self, name, fields=None):
+        """
+        Return the metadata of the stored files with the given name,
+        newest first.
+        """
+
+        if not os.path.isdir(self.models_dir):
+            return []
+        files = []
+        for entry in os.listdir(self.models_dir):
+            if entry.endswith(".json"):
+                with open(os.path.join(self.models_dir, entry)) as meta:
+                    metadata = json.load(meta)
+                if metadata["name"] == name:
+                    files.append(metadata)
+        files.sort(key=lambda item: item["modifiedTime"], reverse=True)
+        return files
+
+    def get_file_metadata(self, file_id, fields=None):
+        """
+        Return the metadata of one stored file.
+        """
+
+        with open(self._metadata_path(file_id)) as meta:
+            return json.load(meta)
+
+    def download_file(self, file_id):
+        """
+        Return the content of a stored file.
+        """
+
+        with open(self._data_path(file_id), "rb") as data:
+            return data.read()
+
+    def upload_file(self, metadata, data):
+        """
+        Store a new file and return its ID.
+        """
+
+        return self._write(uuid.uuid4().hex, metadata, data)
+
+    def update_file(self, file_id, metadata, data):
+        """
+        Replace the content and metadata of a stored file.
+        """
+
+        return self._write(file_id, metadata, data)
+
+    def _write(self, file_id, metadata, data):
+        """
+        Write the content and metadata of a file and return its ID.
+        """
+
+        os.makedirs(self.models_dir, exist_ok=True)
+        metadata = dict(
+            metadata,
+            id=file_id,
+            md5Checksum=hashlib.md5(data).hexdigest(),
+            modifiedTime=datetime.now(timezone.utc).isoformat(),
+        )
+        tmp_path = f"{self._data_path(file_id)}.tmp"
+        with open(tmp_path, "wb") as stored:
+            stored.write(data)
+        os.replace(tmp_path, self._data_path(file_id))
+        # The metadata is written last, so a file is only listed
+        # once its content is complete
+        tmp_path = f"{self._metadata_path(file_id)}.tmp"
+        with open(tmp_path, "w") as meta:
+            json.dump(metadata, meta)
+        os.replace(tmp_path, self._metadata_path(file_id))
+        return file_id
+
+    def delete_file(self, file_id):
+        """
+        Delete a stored file.
+        """
+
+        for path in (self._metadata_path(file_id), self._data_path(file_id)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def prune_revisions(self, file_id, keep):
+        """
+        The local backend keeps only the current content of a file,
+        so there are no old revisions to delete.
+        """
+
+
+@lru_cache(maxsize=None)
+def get_storage():
+    """
+    Return the storage backend selected by TIC_TAC_TOE_STORAGE.
+    """
+
+    # Every Drive (or local) call is counted and timed
+    if STORAGE_BACKEND == "local":
+        return InstrumentedClient(LocalStorage(), "drive")
+    if STORAGE_BACKEND == "google":
+        return InstrumentedClient(GoogleStorage(), "drive")
+    raise ValueError(f"Unknown storage backend: {STORAGE_BACKEND}")
@@ -0,0 +1,135 @@
+"""
+This module handles the 8 symmetries of the tic-tac-toe board
+(4 rotations, each with and without a mirror).
+Every board can be mapped to one canonical form plus the transform that
+was applied, moves can be mapped through a transform and back, and
+training arrays can be expanded with all symmetric copies.
+"""
+
+import numpy as np
+
+from .tic_tac_toe_board import Board, CELLS, SIZE
+
+
+def _rotate(perm):
+    """
+    Rotate a cell permutation by 90 degrees clockwise.
+    """
+
+    return tuple(
+        perm[(SIZE - 1 - col) * SIZE + row]
+        for row in range(SIZE)
+        for col in range(SIZE)
+    )
+
+
+def _mirror(perm):
+    """
+    Mirror a cell permutation left to right.
+    """
+
+    return tuple(
+        perm[row * SIZE + SIZE - 1 - col]
+        for row in range(SIZE)
+        for col in range(SIZE)
+    )
+
+
+def _build_transforms():
+    """
+    Build the 8 permutations: transformed[i] = board[perm[i]].
+    """
+
+    transforms = []
+    perm = tuple(range(CELLS))
+    for _ in range(4):
+        transforms.append(perm)
+        transforms.append(_mirror(perm))
+        perm = _rotate(perm)
+    return tuple(transforms)
+
+
+# Transform t: new cell i takes the value of old cell TRANSFORMS[t][i]
+TRANSFORMS = _build_transforms()
+# Transform t moves old cell m to new cell INVERSE[t][m]
+INVERSE = tuple(
+    tuple(perm.index(cell) for cell in range(CELLS)) for perm in TRANSFORMS
+)
+
+# For every transform and every 9-bit mask: the transformed mask
+MASK_TRANSFORMS = tuple(
+    tuple(
+        sum(1 << i for i in range(CELLS) if mask >> perm[i] & 1)
+        for mask in range(1 << CELLS)
+    )
+    for perm in TRANSFORMS
+)
+
+TRANSFORM_ARRAY = np.array(TRANSFORMS, dtype=np.intp)
+INVERSE_ARRAY = np.array(INVERSE, dtype=np.int8)
+
+
+def transform_board(board, transform):
+    """
+    Return a new board with the transform applied.
+    """
+
+    masks = MASK_TRANSFORMS[transform]
+    return Board(masks[board.x], masks[board.o])
+
+
+def transform_move(move, transform):
+    """
+    Map a move on the original board to the transformed board.
+    """
+
+    return INVERSE[transform][move]
+
+
+def inverse_move(move, transform):
+    """
+    Map a move on the transformed board back to the original board.
+    """
+
+    return TRANSFORMS[transform][move]
+
+
+def canonicalize(board):
+    """
+    Return the canonical form of the board (the symmetric copy with the
+    smallest packed key) and the transform that produces it.
+    """
+
+    best_key, best_transform = None, 0
+    for transform, masks in enumerate(MASK_TRANSFORMS):
+        key = masks[board.x] | masks[board.o] << CELLS
+        if best_key is None or key < best_key:
+            best_key, best_transform = key, transform
+    masks = MASK_TRANSFORMS[best_transform]
+    return Board(masks[board.x], masks[board.o]), best_transform
+
+
+def canonicalize_move(board, move):
+    """
+    Return the canonical board and the move mapped onto it.
+    """
+
+    canonical, transform = canonicalize(board)
+    return canonical, transform_move(move, transform)
+
+
+def augment(boards, moves):
+    """
+    Expand (N, 9) boards and (N,) moves with all 8 symmetric copies.
+    Returns arrays of shape (8N, 9) and (8N,).
+    """
+
+    boards = np.asarray(boards)
+    moves = np.asarray(moves, dtype=np.intp)
+    # boards[:, perm] applies each transform to all boards at once
+    all_boards = boards[:, TRANSFORM_ARRAY].transpose(1, 0, 2)
+    all_moves = INVERSE_ARRAY[:, moves]
+    return (
+        all_boards.reshape(-1, CELLS),
+        all_moves.reshape(-1).astype(np.int8),
+    )
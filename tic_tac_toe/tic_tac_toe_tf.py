@@ -5,51 +5,151 @@ It includes functions for training the model,
 making predictions, and processing the game data.
 """
 
+import numpy as np
+import tensorflow as tf
 from tensorflow import keras
 
+from .tic_tac_toe_data import rows_to_arrays, deduplicate
+from .tic_tac_toe_metrics import timed
+from .tic_tac_toe_symmetry import augment
 
-def train_model(worksheet):
+
+# Number of epochs for fine-tuning on new records only
+FINE_TUNE_EPOCHS = 5
+# Batch size of the training pipeline
+BATCH_SIZE = 256
+
+
+def make_dataset(boards, moves, weights, batch_size=BATCH_SIZE):
     """
-    Train a neural network model to play Tic Tac Toe based
-    on historical game data.
+    Build a shuffled, batched tf.data pipeline of
+    (board, move, sample weight) triples.
     """
 
-    data = worksheet.get_all_values()
-    if not data:
-        print("The worksheet is empty. Starting with empty data.")
-        return None  # Explicitly return None
+    dataset = tf.data.Dataset.from_tensor_slices(
+        (boards.astype(np.float32), moves.astype(np.int32), weights)
+    )
+    return (
+        dataset.shuffle(len(boards))
+        .batch(batch_size)
+        .prefetch(tf.data.experimental.AUTOTUNE)
+    )
+
+
+def arrays_to_dataset(boards, moves, symmetries=True):
+    """
+    Turn (N, 9) boards and (N,) moves into a deduplicated tf.data pipeline.
+    With symmetries, every record is expanded to its 8 symmetric copies.
+    Returns None if there are no records.
+    """
+
+    if not len(boards):
+        return None
+    if symmetries:
+        boards, moves = augment(boards, moves)
+    boards, moves, weights = deduplicate(boards, moves)
+    return make_dataset(boards, moves, weights)
 
-    X_train = []
-    y_train = []
 
-    for row in data:
-        if len(row) < 2 or not row[0]:
-            continue
+def rows_to_dataset(rows, symmetries=True):
+    """
+    Parse worksheet rows into a deduplicated tf.data pipeline.
+    Returns None if there are no usable rows.
+    """
+
+    boards, moves = rows_to_arrays(rows)
+    return arrays_to_dataset(boards, moves, symmetries)
 
-        board_state = [
-            1 if cell == "X" else -1 if cell == "O" else 0 for cell in row[0]
+
+def build_model():
+    """
+    Create and compile a new, untrained network.
+    """
+
+    model = keras.Sequential(
+        [
+            keras.layers.Input(shape=(9,)),
+            keras.layers.Dense(128, activation="relu"),
+            keras.layers.Dense(9, activation="softmax"),
         ]
-        X_train.append(board_state)
-        move = int(row[1])
-        y_train.append(move)
-
-    if len(X_train) > 0:
-        model = keras.Sequential(
-            [
-                keras.layers.Input(shape=(9,)),
-                keras.layers.Dense(128, activation="relu"),
-                keras.layers.Dense(9, activation="softmax"),
-            ]
-        )
-
-        model.compile(
-            optimizer="adam",
-            loss="sparse_categorical_crossentropy",
-            metrics=["accuracy"],
-        )
-
-        model.fit(X_train, y_train, epochs=50, verbose=0)
+    )
+
+    model.compile(
+        optimizer="adam",
+        loss="sparse_categorical_crossentropy",
+        metrics=["accuracy"],
+    )
+    return model
+
+
+@timed("train_model")
+def train_model(history, cursor="id"):
+    """
+    Train a neural network model to play Tic Tac Toe based
+    on historical game data. The cursor ("id" or "sheet_row") is the
+    history column the training watermark refers to.
+    """
+
+    boards, moves, last_id = history.training_arrays(cursor=cursor)
+    if not len(boards):
+        print("The game history is empty. Starting with empty data.")
+        return None  # Explicitly return None
+
+    dataset = arrays_to_dataset(boards, moves)
+
+    if dataset is not None:
+        model = build_model()
+        model.fit(dataset, epochs=50, verbose=0)
+        # All recorded moves are now part of the model
+        model.training_watermark = last_id
+        model.training_cursor = cursor
         return model
     else:
         print("No training data available. Starting with an untrained model.")
         return None
+
+
+def train_model_on_arrays(boards, moves, model=None, epochs=50):
+    """
+    Train a new model, or continue training an existing one, on board
+    and move arrays, e.g. a dataset written by the self-play simulator.
+    """
+
+    dataset = arrays_to_dataset(boards, moves)
+    if dataset is None:
+        print("No training data available.")
+        return model
+
+    if model is None:
+        model = build_model()
+    model.fit(dataset, epochs=epochs, verbose=0)
+    return model
+
+
+@timed("train_model_incremental")
+def train_model_incremental(model, history, cursor="id"):
+    """
+    Fine-tune an existing model only on the moves recorded after
+    its training watermark, then move the watermark past them.
+    Trains a new model from scratch if there is no model yet.
+    """
+
+    if model is None:
+        return train_model(history, cursor)
+
+    watermark = getattr(model, "training_watermark", 0)
+    if getattr(model, "training_cursor", "id") != cursor:
+        # The watermark refers to another column: use all the moves
+        watermark = 0
+    # Only the moves after the watermark are read from the history
+    boards, moves, last_id = history.training_arrays(
+        since_id=watermark, cursor=cursor)
+    dataset = arrays_to_dataset(boards, moves)
+
+    if dataset is not None:
+        model.fit(dataset, epochs=FINE_TUNE_EPOCHS, verbose=0)
+        print(f"Model fine-tuned on {len(boards)} new records.")
+
+    model.training_watermark = last_id
+    model.training_cursor = cursor
+    return model
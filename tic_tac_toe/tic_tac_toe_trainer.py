@@ -0,0 +1,283 @@
+"""
+This module contains the training worker. It runs as its own process,
+so game sessions never train: they only load the latest published model.
+
+The worker consumes the moves of the game history: with the sheet
+mirror on, the rows of the mirror sheet (the moves of every machine),
+imported into its history; with the mirror off, the moves recorded in
+the local history. When enough new moves
+have been logged, or the retrain interval has passed, it fine-tunes a
+candidate from the published model, validates both against the
+perfect-play table and publishes the candidate only if it plays at least
+as well. After a rejected candidate the worker waits for as many new
+moves again, or for the retrain interval, before it tries once more.
+A model is published by saving its files in place as a new
+version, so sessions see either the old or the new version.
+
+Usage:
+    python -m tic_tac_toe.tic_tac_toe_trainer [--once]
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from .tic_tac_toe_board import Board, CELLS
+from .tic_tac_toe_google import (
+    MODEL_NAME,
+    get_published_model,
+    download_model_from_google_drive,
+    save_model_to_google_drive,
+    load_data_from_google_sheets,
+)
+from .tic_tac_toe_history import SHEETS_MIRROR, get_game_history
+from .tic_tac_toe_metrics import span
+from .tic_tac_toe_numpy_model import NumpyModel
+from .tic_tac_toe_perfect import load_perfect_player
+from .tic_tac_toe_symmetry import canonicalize, inverse_move
+
+
+# Retrain when this many new moves have been logged
+MIN_NEW_RECORDS = int(os.environ.get("TIC_TAC_TOE_TRAIN_MIN_RECORDS", "500"))
+# ... or when this many seconds have passed and there is any new move
+TRAIN_INTERVAL = float(os.environ.get("TIC_TAC_TOE_TRAIN_INTERVAL", "3600"))
+# Seconds between two checks for new moves
+POLL_INTERVAL = float(os.environ.get("TIC_TAC_TOE_TRAIN_POLL", "60"))
+# A candidate may score this much lower than the published model
+VALIDATION_TOLERANCE = float(
+    os.environ.get("TIC_TAC_TOE_TRAIN_TOLERANCE", "0"))
+# Column of the history the watermark refers to. With the mirror on,
+# the sheet holds the moves of every machine and the worker trains on
+# the imported rows, whose sheet row is the same in every history; the
+# local IDs are only used for a history that is not mirrored.
+TRAINING_CURSOR = "sheet_row" if SHEETS_MIRROR else "id"
+
+
+def validation_positions():
+    """
+    Return every reachable, unfinished position with O (the AI) to move,
+    and for each the set of moves that keep the perfect-play value.
+    """
+
+    perfect = load_perfect_player()
+    positions = {}
+
+    def optimal_moves(board):
+        target = perfect.value(board, -1)
+        moves = set()
+        for move in board.legal_moves():
+            child = board.copy()
+            child.make_move(move, -1)
+            if child.winner() == -1:
+                value = 1
+            elif child.is_full():
+                value = 0
+            else:
+                value = -perfect.value(child, 1)
+            if value == target:
+                moves.add(move)
+        return moves
+
+    def visit(board, player):
+        if board.status()[0]:
+            return
+        if player == -1:
+            if board.key() in positions:
+                return
+            positions[board.key()] = (board.copy(), optimal_moves(board))
+        for move in board.legal_moves():
+            board.make_move(move, player)
+            visit(board, -player)
+            board.unmake_move(move)
+
+    visit(Board(), 1)
+    return list(positions.values())
+
+
+def score_model(model, positions):
+    """
+    Return the fraction of validation positions where the model, used
+    the same way as in the game, picks a move that keeps the
+    perfect-play value.
+    """
+
+    if not isinstance(model, NumpyModel):
+        model = NumpyModel.from_keras(model)
+    canonical = [canonicalize(board) for board, _ in positions]
+    inputs = np.array(
+        [board.to_list() for board, _ in canonical], dtype=np.float32)
+    predictions = model(inputs)
+
+    correct = 0
+    for (board, transform), prediction, (_, optimal) in zip(
+            canonical, predictions, positions):
+        moves = list(board.legal_moves())
+        legal = np.full(CELLS, -np.inf)
+        legal[moves] = prediction[moves]
+        move = inverse_move(int(np.argmax(legal)), transform)
+        correct += move in optimal
+    return correct / len(positions)
+
+
+def published_key(published):
+    """
+    Return the file ID and version of the published model metadata.
+    """
+
+    published = published or {}
+    app_properties = published.get("appProperties") or {}
+    return published.get("id"), app_properties.get("version")
+
+
+class TrainingWorker:
+    """
+    Retrains the model from the game history and publishes
+    validated versions.
+    """
+
+    def __init__(self, history=None, min_records=MIN_NEW_RECORDS,
+                 interval=TRAIN_INTERVAL,
+                 tolerance=VALIDATION_TOLERANCE, cursor=TRAINING_CURSOR):
+        self.history = history or get_game_history()
+        self.cursor = cursor
+        self.min_records = min_records
+        self.interval = interval
+        self.tolerance = tolerance
+        self.positions = validation_positions()
+        self.last_run = 0.0
+        self.worksheet = None
+        # (published model, watermark) of the last rejected candidate
+        self.rejected = None
+
+    def sync(self):
+        """
+        Pull the moves mirrored to the Google Sheet by other machines.
+        """
+
+        if self.cursor != "sheet_row":
+            return
+        if self.worksheet is None:
+            _, self.worksheet = load_data_from_google_sheets()
+        if self.worksheet is not None:
+            self.history.sync_from_worksheet(self.worksheet)
+
+    def pending_records(self, published):
+        """
+        Return the number of moves the published model has not seen.
+        """
+
+        app_properties = (published or {}).get("appProperties") or {}
+        watermark = int(app_properties.get("watermark", 0))
+        if app_properties.get("watermark_cursor", "id") != self.cursor:
+            # The watermark refers to another column
+            watermark = 0
+        return self.history.count(since_id=watermark, cursor=self.cursor)
+
+    def new_records(self, published, pending):
+        """
+        Return the number of moves logged since the last candidate
+        trained from the published model was rejected (all pending
+        moves if none was).
+        """
+
+        if self.rejected is None or self.rejected[0] != published_key(
+                published):
+            return pending
+        return self.history.count(
+            since_id=self.rejected[1], cursor=self.cursor)
+
+    def due(self, pending, new=None):
+        """
+        Check whether it is time to retrain: when enough moves are new
+        (since the last rejected candidate, if any), or when the
+        interval has passed and the published model has not seen some
+        moves.
+        """
+
+        if (pending if new is None else new) >= self.min_records:
+            return True
+        return pending > 0 and time.time() - self.last_run >= self.interval
+
+    def run_once(self, force=False):
+        """
+        Retrain, validate and publish if the schedule (or force) says so.
+        Returns True if a new model was published.
+        """
+
+        # TensorFlow is only imported by the worker
+        from .tic_tac_toe_tf import train_model, train_model_incremental
+
+        with span("training_sync"):
+            self.sync()
+        published = get_published_model(MODEL_NAME)
+        pending = self.pending_records(published)
+        new = self.new_records(published, pending)
+        if not (force and pending) and not self.due(pending, new):
+            return False
+        self.last_run = time.time()
+
+        current_score = None
+        if published is None:
+            candidate = train_model(self.history, self.cursor)
+        else:
+            # The download is a fresh copy, so the published model
+            # is scored before it is fine-tuned into the candidate
+            model = download_model_from_google_drive(published["id"])
+            current_score = score_model(model, self.positions)
+            candidate = train_model_incremental(
+                model, self.history, self.cursor)
+        if candidate is None:
+            return False
+
+        with span("training_validation"):
+            score = score_model(candidate, self.positions)
+        print(f"Validation score of the candidate: {score:.3f} "
+              f"({pending} new records)")
+        if current_score is not None:
+            print(f"Validation score of the published model: "
+                  f"{current_score:.3f}")
+            if score < current_score - self.tolerance:
+                print("The candidate is worse than the published model, "
+                      "not published.")
+                self.rejected = (
+                    published_key(published),
+                    getattr(candidate, "training_watermark", 0))
+                return False
+
+        save_model_to_google_drive(candidate)
+        return True
+
+    def run(self, poll=POLL_INTERVAL):
+        """
+        Check for new moves forever.
+        """
+
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Training failed: {e}")
+            time.sleep(poll)
+
+
+def main(argv=None):
+    """
+    Command line entry point of the training worker.
+    """
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--once", action="store_true",
+                        help="train once if there are new moves and exit")
+    args = parser.parse_args(argv)
+
+    worker = TrainingWorker()
+    if args.once:
+        worker.run_once(force=True)
+    else:
+        worker.run()
+
+
+if __name__ == "__main__":
+    main()
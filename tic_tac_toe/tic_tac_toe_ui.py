@@ -5,7 +5,7 @@ and leaderboard to the user.
 """
 
 
-def display_start_game():
+def display_start_game(size=3, k=3):
     """
     Display the starting information for the game, including rules and the
     initial game board.
@@ -13,8 +13,12 @@ def display_start_game():
 
     print("Game rules:")
     print("Your turn will have symbol 'X', the AI turn - symbol 'O'.")
-    print("Winner must have three of their symbols in a line, vertically"
-          " or horizontally.")
+    if size == 3:
+        print("Winner must have three of their symbols in a line, vertically"
+              " or horizontally.")
+    else:
+        print(f"Board {size}x{size}: winner must have {k} of their symbols"
+              " in a line, vertically, horizontally or diagonally.")
     print("Turn order: you have the right to make the first move"
           " in the first game.")
     print("In subsequent games, the right"
@@ -22,6 +26,9 @@ def display_start_game():
     print("The AI will make the first move in the second game,"
           " the player in the third, and so on, etc.")
 
+    if size != 3:
+        return
+
     print("\nGameplay field: ")
     start_board = ["0", "1", "2", "3", "4", "5", "6", "7", "8"]
     print(f"\n {start_board[0]} | {start_board[1]} | {start_board[2]} ")
@@ -51,12 +58,35 @@ def print_row(row_board, row_numbers):
             ' ' * 11 + ' | '.join(row_numbers_str))
 
 
+def display_large_board(board):
+    """
+    Displays a board larger than 3x3 as one grid: used cells show
+    their symbol, free cells show their number.
+    """
+
+    size = board.size
+    width = len(str(size * size - 1))
+    value_to_symbol = {1: 'X', -1: 'O'}
+
+    print("Current board and positions:")
+    for y in range(size):
+        print(" ".join(
+            value_to_symbol.get(value, str(y * size + x)).rjust(width)
+            for x, value in enumerate(board.row(y))
+        ))
+
+
 def display_board(board):
     """
     Displays the game board with current plays and
     a reference board with cell numbers.
     Used cells on the reference board are replaced with an asterisk ( * )
     """
+
+    if getattr(board, "size", 3) != 3:
+        display_large_board(board)
+        return
+
     # Create a copy of the board with cell numbers
     numbers_board = [[str(i + j * 3) for i in range(3)] for j in range(3)]
 
@@ -64,29 +94,27 @@ def display_board(board):
     # the corresponding cell in the board is not empty
     for y in range(3):
         for x in range(3):
-            # Assuming 0 is the value for an empty space
-            if board[y][x] != 0:
-                # Assuming you want to display '*' for filled spaces
+            # Display '*' for filled spaces
+            if not board.is_empty(y * 3 + x):
                 numbers_board[y][x] = '*'
 
     # Print the board with headers for user guidance
     print("Current board:       Positions:")
     for i in range(3):
         # Print each row of the board
-        print(print_row(board[i], numbers_board[i]))
+        print(print_row(board.row(i), numbers_board[i]))
         if i < 2:  # Print the row separator if it's not the last row
             print(" ---+---+---         ---+---+---")
 
 
-def display_leadersboard(leadersboard_data_sheet, current_player_nickname):
+def display_leadersboard(leadersboard, current_player_nickname, page=1):
     """
-    Fetch and display the leadersboard with the rankings based on
-    past game outcomes. The current player's row will be highlighted.
+    Display one page of the leadersboard, ranked by wins.
+    If the current player is not on the page, their rank and
+    neighbours are shown below it. The current player's row
+    will be highlighted. Returns the number of the page shown.
     """
 
-    # Fetching the data from the sheet
-    leadersboard_data = leadersboard_data_sheet.get_all_values()
-
     print("\nLeadersboard")
 
     # Headers for the table
@@ -103,23 +131,39 @@ def display_leadersboard(leadersboard_data_sheet, current_player_nickname):
     HIGHLIGHT_START = "\033[93m"  # Yellow text
     HIGHLIGHT_END = "\033[0m"     # Reset to default text color
 
-    # If there are no data rows or only header row,
-    # print the headers and return
-    if len(leadersboard_data) <= 1:
+    # Only the rows on the page are read from the ranking index
+    page_rows, pages = leadersboard.page(page)
+    page = min(max(page, 1), pages)
+
+    # If there are no players, print the headers and return
+    if not page_rows:
         print(" | ".join(headers))
-        return
+        return page
+
+    player_rows = []
+    if current_player_nickname not in [row[0] for _, row in page_rows]:
+        # Neighbours that are already on the page are not repeated
+        page_ranks = {rank for rank, _ in page_rows}
+        player_rows = [
+            (rank, row)
+            for rank, row in leadersboard.around(current_player_nickname)
+            if rank not in page_ranks
+        ]
 
-    # Sort the data by 'Win Human' column in descending order,
-    # skipping the header
-    # Make sure to convert 'Win Human' values to integers for sorting
-    leadersboard_data[1:] = sorted(
-        leadersboard_data[1:], key=lambda x: int(x[2]), reverse=True
-    )
+    # Turn (rank, row) pairs into rows of text with the rank in front
+    def as_text(ranked_rows):
+        return [
+            [str(rank)] + [str(item) for item in row[:len(headers) - 1]]
+            for rank, row in ranked_rows
+        ]
+
+    page_rows = as_text(page_rows)
+    player_rows = as_text(player_rows)
 
     # Determine the maximum width for each column
     column_lengths = [len(header) for header in headers]
-    for row in leadersboard_data[1:]:  # Skip the header row in the data
-        for i, (item, header) in enumerate(zip(row, headers)):
+    for row in page_rows + player_rows:
+        for i, item in enumerate(row):
             column_lengths[i] = max(column_lengths[i], len(item))
 
     # Create a format string for each row with appropriate spacing
@@ -129,19 +173,23 @@ def display_leadersboard(leadersboard_data_sheet, current_player_nickname):
         ]
     )
 
+    def print_rows(rows):
+        for row_data in rows:
+            # If the row has less columns than headers, append empty strings
+            row_data += [""] * (len(headers) - len(row_data))
+            formatted_row = row_format.format(*row_data)
+            # Highlight the current player's row
+            if row_data[1] == current_player_nickname:
+                formatted_row = HIGHLIGHT_START + formatted_row + HIGHLIGHT_END
+            print(formatted_row)
+
     # Print the formatted header row
     print(row_format.format(*headers))
     # Print header separator
     print("-" * (sum(column_lengths) + 3 * (len(headers) - 1)))
-
-    # Print the sorted and formatted data rows,
-    # skipping the first row which is headers
-    for i, row_data in enumerate(leadersboard_data[1:], start=1):
-        # If the row has less columns than headers, append empty strings
-        row_data += [""] * (len(headers) - len(row_data))
-        formatted_row = row_format.format(i, *row_data)
-        # Highlight the current player's row
-        if row_data[0] == current_player_nickname:
-            formatted_row = HIGHLIGHT_START + formatted_row + HIGHLIGHT_END
-        # Print each row with the correct number for 'PP'
-        print(formatted_row)
+    print_rows(page_rows)
+    if player_rows:
+        print("...")
+        print_rows(player_rows)
+    print(f"Page {page} of {pages}")
+    return page